@@ -0,0 +1 @@
+"""Helpers shared by the density extraction and plotting scripts."""
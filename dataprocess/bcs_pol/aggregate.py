@@ -0,0 +1,239 @@
+"""Mergeable partial aggregates for combining many ``.bcs`` traces.
+
+A :class:`Partial` holds the summed final Pol II and Ser7P occupancy of a
+set of simulations, how many simulations that is and, optionally, their
+bit-packed per-simulation occupancy (see :mod:`bcs_pol.bootstrap`).
+:func:`merge` adds the sums and counts and concatenates the per-simulation
+rows in order, so it is associative and partials written for each trace,
+on any node, can be combined in any grouping.  A partial is stored next to
+its trace as ``<trace>.partial.npz`` and refreshed when the trace changes;
+traces in read-only directories, or callers that name a cache directory,
+keep theirs there instead (see :func:`ensure_partial`).
+
+:func:`reduce_partials` merges any number of partial files in a thread
+pool: each worker folds a contiguous group of files one at a time, so only
+one loaded file per worker is held besides the running sums and packed
+rows.  :func:`save_partial_densities` writes the result as the
+``*_polii_ser7p_density_arrays.npz`` read by ``density8graphs_*.py``, with
+averages over the simulations actually counted.
+"""
+import collections
+import concurrent.futures
+import hashlib
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+
+from .bootstrap import pack_occupancy
+from .parallel import extract_occupancy
+from .parser import DEFAULT_CHUNK_SIZE, EXTRACTOR_VERSION
+from .pyramid import DensityPyramid
+
+PARTIAL_SUFFIX = '.partial.npz'
+DENSITY_SUFFIX = '_polii_ser7p_density_arrays.npz'  # the .npz written by save_densities
+
+Partial = collections.namedtuple('Partial', ['polii', 'ser7p', 'sims', 'polii_packed', 'ser7p_packed', 'sources',
+                                             'source_sims'])
+
+
+def replace_atomic(path, write):
+    """Write *path* through ``write(f)`` on a temporary binary file renamed over it.
+
+    Readers never see a partly written file, and a failed write leaves the
+    old one in place.
+    """
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def save_densities(npz_path, txt_path, polii, ser7p, sims, **arrays):
+    """Write the ``snapshot_cis.py`` ``.npz`` and ``.txt`` outputs atomically.
+
+    Either path may be ``None``.  Averages are over the *sims* simulations
+    counted; the counts of :class:`bcs_pol.pyramid.DensityPyramid` and extra
+    *arrays* (e.g. packed per-simulation occupancy) are added to the ``.npz``.
+    2-D totals (one row per sweep point, all of *sims* simulations) are
+    written to the ``.npz`` only.
+    """
+    gene_length = np.shape(polii)[-1]
+    polii_avg = polii / max(sims, 1)
+    ser7p_avg = ser7p / max(sims, 1)
+    if npz_path is not None:
+        replace_atomic(npz_path, lambda f: np.savez(f, positions=np.arange(1, gene_length + 1),
+                                                     polii_density_avg=polii_avg, ser7p_density_avg=ser7p_avg,
+                                                     polii_density_total=polii, ser7p_density_total=ser7p,
+                                                     sims=sims, **DensityPyramid(polii, ser7p, sims).arrays(),
+                                                     **arrays))
+    if txt_path is not None and np.ndim(polii) == 1:
+        lines = ["# Position\tAverage_PolII_Count\tAverage_Ser7P_Count\tTotal_PolII_Count\tTotal_Ser7P_Count\n"]
+        for pos in range(1, gene_length + 1):
+            lines.append(f"{pos}\t{polii_avg[pos-1]:.6f}\t{ser7p_avg[pos-1]:.6f}\t{int(polii[pos-1])}\t"
+                         f"{int(ser7p[pos-1])}\n")
+        replace_atomic(txt_path, lambda f: f.write(''.join(lines).encode()))
+
+
+def stored_sims(data):
+    """How many simulations the totals of a loaded density ``.npz`` are summed over."""
+    if 'sims' in data:
+        return int(data['sims'])
+    # older files only have the averages, which were divided by sim_number
+    average = data['polii_density_avg'].sum()
+    return int(round(data['polii_density_total'].sum() / average)) if average > 0 else 0
+
+
+def merge(partials):
+    """Combine an iterable of partials into one.
+
+    Per-simulation rows are kept only if every partial has them.  Partials
+    are consumed one at a time, so a generator of loaded files is fine.
+    """
+    polii = ser7p = None
+    sims = 0
+    packed, sources, source_sims = [], [], []
+    for partial in partials:
+        if polii is None:
+            polii, ser7p = np.zeros(len(partial.polii)), np.zeros(len(partial.ser7p))
+        elif len(partial.polii) != len(polii):
+            raise ValueError(f'cannot merge gene lengths {len(polii)} and {len(partial.polii)}')
+        polii += partial.polii
+        ser7p += partial.ser7p
+        sims += partial.sims
+        if packed is not None and partial.polii_packed is not None:
+            packed.append((partial.polii_packed, partial.ser7p_packed))
+        else:
+            packed = None
+        sources.extend(partial.sources)
+        source_sims.extend(partial.source_sims)
+    if polii is None:
+        raise ValueError('no partials to merge')
+    polii_packed = ser7p_packed = None
+    if packed:
+        polii_packed = np.concatenate([a for a, _ in packed])
+        ser7p_packed = np.concatenate([b for _, b in packed])
+    return Partial(polii, ser7p, sims, polii_packed, ser7p_packed, tuple(sources), tuple(source_sims))
+
+
+def partial_from_trace(path, gene_length, sim_number=None, keep_per_sim=False, n_workers=1,
+                       chunk_size=DEFAULT_CHUNK_SIZE):
+    """Partial aggregate of simulations 1..*sim_number* of the trace *path*."""
+    polii_rows, ser7p_rows = extract_occupancy(path, gene_length, sim_number, n_workers, chunk_size)
+    packed = (pack_occupancy(polii_rows), pack_occupancy(ser7p_rows)) if keep_per_sim else (None, None)
+    return Partial(polii_rows.sum(axis=0, dtype=np.float64), ser7p_rows.sum(axis=0, dtype=np.float64),
+                   len(polii_rows), *packed, (os.path.abspath(path),), (len(polii_rows),))
+
+
+def _packed_arrays(partial):
+    if partial.polii_packed is None:
+        return {}
+    return dict(polii_per_sim_packed=partial.polii_packed, ser7p_per_sim_packed=partial.ser7p_packed)
+
+
+def save_partial(path, partial, **arrays):
+    """Write *partial* to *path* atomically, with any extra *arrays*."""
+    replace_atomic(path, lambda f: np.savez(f, polii=partial.polii, ser7p=partial.ser7p, sims=partial.sims,
+                                             sources=np.array(partial.sources, dtype=str),
+                                             source_sims=np.array(partial.source_sims, dtype=np.int64),
+                                             **_packed_arrays(partial), **arrays))
+
+
+def load_partial(path):
+    with np.load(path) as data:
+        packed = (None, None)
+        if 'polii_per_sim_packed' in data:
+            packed = data['polii_per_sim_packed'], data['ser7p_per_sim_packed']
+        return Partial(data['polii'], data['ser7p'], int(data['sims']), *packed,
+                       tuple(data['sources'].tolist()), tuple(data['source_sims'].tolist()))
+
+
+def partial_path(path, cache_dir=None):
+    """Where the partial of the trace *path* goes when its own directory is read-only.
+
+    The file is named after the trace and a digest of its absolute path, in
+    *cache_dir* (by default ``bcs_pol_partials`` in the temporary directory).
+    """
+    cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'bcs_pol_partials')
+    digest = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f'{os.path.basename(path)}.{digest}{PARTIAL_SUFFIX}')
+
+
+def _fresh(sidecar, stamp, gene_length, keep_per_sim):
+    try:
+        with np.load(sidecar) as data:
+            return (all(int(data[key]) == value for key, value in stamp.items()) and len(data['polii']) == gene_length
+                    and (not keep_per_sim or 'polii_per_sim_packed' in data))
+    except (OSError, KeyError, ValueError):
+        return False
+
+
+def ensure_partial(path, gene_length, sim_number=None, keep_per_sim=False, n_workers=1,
+                   chunk_size=DEFAULT_CHUNK_SIZE, cache_dir=None):
+    """Path of the trace's partial, written if missing or stale.
+
+    The partial is rewritten when the trace size or mtime, the gene length,
+    *sim_number* or :data:`bcs_pol.parser.EXTRACTOR_VERSION` changed, or
+    per-simulation rows are wanted but missing.  It is written at
+    :func:`partial_path` in *cache_dir* when that is given; otherwise next
+    to the trace as ``<path>.partial.npz``, or in the temporary directory
+    if the trace's directory cannot be written.  A fresh partial in either
+    place is reused.
+    """
+    stat = os.stat(path)
+    sidecars = (path + PARTIAL_SUFFIX, partial_path(path, cache_dir))
+    stamp = dict(file_size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                 sim_number=-1 if sim_number is None else sim_number, extractor_version=EXTRACTOR_VERSION)
+    for sidecar in sidecars:
+        if _fresh(sidecar, stamp, gene_length, keep_per_sim):
+            return sidecar
+    partial = partial_from_trace(path, gene_length, sim_number, keep_per_sim, n_workers, chunk_size)
+    if cache_dir is None:
+        try:
+            save_partial(sidecars[0], partial, **stamp)
+            return sidecars[0]
+        except OSError:
+            pass  # read-only trace directory
+    os.makedirs(os.path.dirname(sidecars[1]), exist_ok=True)
+    save_partial(sidecars[1], partial, **stamp)
+    return sidecars[1]
+
+
+def make_partials(paths, gene_length, sim_number=None, keep_per_sim=False, n_workers=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE, cache_dir=None):
+    """:func:`ensure_partial` for every trace in *paths*, one process per trace.
+
+    Returns the sidecar paths in the order of *paths*.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers == 1 or len(paths) == 1:
+        # a single trace is split over the workers at its simulation headers instead
+        return [ensure_partial(path, gene_length, sim_number, keep_per_sim, n_workers, chunk_size, cache_dir)
+                for path in paths]
+    n_workers = min(n_workers, len(paths))
+    # fork keeps the config-style scripts, which have no __main__ guard, from re-running in workers
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    with concurrent.futures.ProcessPoolExecutor(n_workers, mp_context=context) as pool:
+        futures = [pool.submit(ensure_partial, path, gene_length, sim_number, keep_per_sim, 1, chunk_size, cache_dir)
+                   for path in paths]
+        return [future.result() for future in futures]
+
+
+def _reduce_group(paths):
+    return merge(load_partial(path) for path in paths)
+
+
+def reduce_partials(paths, n_workers=None):
+    """Merge the partial files *paths*, in order, with *n_workers* threads."""
+    if not paths:
+        raise ValueError('no partials to merge')
+    n_workers = min(n_workers or os.cpu_count() or 1, len(paths))
+    groups = [list(group) for group in np.array_split(np.array(paths, dtype=object), n_workers)]
+    with concurrent.futures.ThreadPoolExecutor(n_workers) as executor:
+        return merge(executor.map(_reduce_group, groups))
+
+
+def save_partial_densities(npz_path, txt_path, partial):
+    """Write *partial* as the density outputs, with per-simulation rows if it has them."""
+    save_densities(npz_path, txt_path, partial.polii, partial.ser7p, partial.sims, **_packed_arrays(partial))
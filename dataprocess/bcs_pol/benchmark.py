@@ -0,0 +1,173 @@
+"""Benchmarks of the extraction pipeline on synthetic traces.
+
+Every stage runs in a fresh interpreter (``python -m bcs_pol.benchmark``)
+so its peak RSS is its own.  The stages are
+
+* ``parse``: read the trace and convert the ``Pol_ii`` rows to arrays,
+* ``accumulate``: the full :func:`bcs_pol.parser.extract_counts`,
+* ``smooth``: the ``density8graphs`` curves and bootstrap bands from the
+  per-simulation occupancy (extraction not timed),
+* ``plot``: the ``snapshot`` and ``density8graphs`` figures rendered with
+  the Agg backend (extraction not timed).
+
+Results are a list of dicts, one per (trace size, stage), and can be saved
+as a JSON baseline and compared against it later.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+STAGES = ('parse', 'accumulate', 'smooth', 'plot')
+TOLERANCE = 0.10  # relative slowdown reported as a regression
+
+
+def trace_for_size(work_dir, size_mb, variant='cis', seed=0):
+    """Path of a synthetic trace of about *size_mb* MB, generated on first use."""
+    from .synthetic import write_trace
+
+    path = os.path.join(work_dir, f'synthetic_{variant}_{size_mb}MB_seed{seed}.bcs')
+    if not os.path.exists(path):
+        tmp = f'{path}.{os.getpid()}.tmp'
+        write_trace(tmp, target_bytes=size_mb * 1e6, variant=variant, seed=seed)
+        os.replace(tmp, path)
+    return path
+
+
+def _count_lines(path):
+    lines = 0
+    with open(path, 'rb') as f:
+        for piece in iter(lambda: f.read(1 << 24), b''):
+            lines += piece.count(b'\n')
+    return lines
+
+
+def _run_stage(stage, path, gene_length):
+    """Run *stage* on *path* in this process; returns the timed seconds."""
+    import numpy as np
+
+    from .parser import extract_counts
+
+    if stage == 'parse':
+        from .compressed import open_trace
+        from .parser import iter_blocks, parse_polii_rows
+        start = time.perf_counter()
+        with open_trace(path) as f:
+            for _, segment in iter_blocks(f):
+                parse_polii_rows(segment, times=False)
+        return time.perf_counter() - start
+    if stage == 'accumulate':
+        start = time.perf_counter()
+        extract_counts(path, gene_length)
+        return time.perf_counter() - start
+    if stage == 'smooth':
+        from .bootstrap import bootstrap_bands, density_curves
+        from .parallel import extract_occupancy
+        polii_rows, ser7p_rows = extract_occupancy(path, gene_length)
+        start = time.perf_counter()
+        density_curves(polii_rows.mean(axis=0), ser7p_rows.mean(axis=0), sigma=5)
+        bootstrap_bands(polii_rows, ser7p_rows, sigma=5, seed=0)
+        return time.perf_counter() - start
+    if stage == 'plot':
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        from .bootstrap import density_curves
+        polii, ser7p = extract_counts(path, gene_length)
+        start = time.perf_counter()
+        positions = np.arange(1, gene_length + 1)
+        with tempfile.TemporaryDirectory() as out:
+            plt.figure(figsize=(15, 10))
+            for k, values in enumerate((polii, ser7p, polii, ser7p)):
+                plt.subplot(2, 2, k + 1)
+                plt.bar(positions, values, alpha=0.7)
+            plt.tight_layout()
+            plt.savefig(os.path.join(out, 'snapshot.pdf'), dpi=300, bbox_inches='tight')
+            plt.close()
+            curves = density_curves(polii, ser7p, sigma=5)
+            plt.figure(figsize=(12, 18))
+            for k, name in enumerate(('polii', 'ser7p', 'ratio', 'log2_ratio', 'difference')):
+                plt.subplot(5, 1, k + 1)
+                plt.plot(positions, curves[name])
+            plt.tight_layout()
+            plt.savefig(os.path.join(out, 'density.pdf'), dpi=300, bbox_inches='tight')
+            plt.close()
+        return time.perf_counter() - start
+    raise ValueError(f'unknown stage {stage!r}')
+
+
+def measure(stage, path, gene_length=1000):
+    """Time *stage* on *path* in a child interpreter; returns its result dict."""
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_parent, os.environ.get('PYTHONPATH')])))
+    proc = subprocess.run([sys.executable, '-m', 'bcs_pol.benchmark', stage, path, str(gene_length)],
+                          env=env, capture_output=True, text=True, check=True)
+    result = json.loads(proc.stdout.splitlines()[-1])
+    size = os.path.getsize(path)
+    lines = _count_lines(path)
+    result.update(stage=stage, trace=os.path.basename(path), mb=size / 1e6, lines=lines,
+                  mb_per_s=size / 1e6 / result['seconds'], lines_per_s=lines / result['seconds'])
+    return result
+
+
+def run_benchmarks(work_dir, sizes_mb=(10, 100), stages=STAGES, variant='cis', seed=0, repeats=1):
+    """Benchmark every stage on a synthetic trace of each size.
+
+    With *repeats* > 1 the fastest run is kept.
+    """
+    results = []
+    for size_mb in sizes_mb:
+        path = trace_for_size(work_dir, size_mb, variant, seed)
+        for stage in stages:
+            runs = [measure(stage, path) for _ in range(repeats)]
+            best = min(runs, key=lambda r: r['seconds'])
+            best.update(size_mb=size_mb)
+            results.append(best)
+    return results
+
+
+def format_results(results):
+    """Plain-text table of benchmark results."""
+    lines = [f"{'size':>8} {'stage':<11} {'seconds':>9} {'MB/s':>9} {'lines/s':>12} {'peak RSS MB':>12}"]
+    for r in results:
+        lines.append(f"{r['size_mb']:>6}MB {r['stage']:<11} {r['seconds']:>9.3f} {r['mb_per_s']:>9.1f} "
+                     f"{r['lines_per_s']:>12.0f} {r['peak_rss_mb']:>12.1f}")
+    return '\n'.join(lines)
+
+
+def save_baseline(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+
+
+def compare(results, baseline_path, tolerance=TOLERANCE):
+    """Compare *results* with a saved baseline.
+
+    Returns one dict per (size, stage) present in both, with the time ratio
+    (current / baseline), the RSS ratio, and ``regression`` set when the
+    stage got slower by more than *tolerance*.
+    """
+    with open(baseline_path) as f:
+        baseline = {(r['size_mb'], r['stage']): r for r in json.load(f)}
+    rows = []
+    for r in results:
+        base = baseline.get((r['size_mb'], r['stage']))
+        if base is None:
+            continue
+        ratio = r['seconds'] / base['seconds']
+        rows.append({'size_mb': r['size_mb'], 'stage': r['stage'], 'time_ratio': ratio,
+                     'rss_ratio': r['peak_rss_mb'] / base['peak_rss_mb'], 'regression': ratio > 1 + tolerance})
+    return rows
+
+
+if __name__ == '__main__':
+    import resource
+
+    seconds = _run_stage(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+    print(json.dumps({'seconds': seconds, 'peak_rss_mb': peak}))
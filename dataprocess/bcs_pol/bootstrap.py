@@ -0,0 +1,70 @@
+"""Per-simulation occupancy storage and bootstrap confidence bands.
+
+Final occupancy is 0/1 per site, so the (sims x gene_length) matrix is
+stored bit-packed.  Resampling simulations with replacement is a multinomial
+weight matrix times the occupancy matrix, so a batch of resamples is one
+matrix product followed by smoothing along the position axis of the whole
+batch, with the curves of ``density8graphs_*.py`` computed on every row.
+"""
+import numpy as np
+
+EPSILON = 1e-9  # ratios and log2 ratios, as in density8graphs_*.py
+EPSILON_DENSITY = 1e-12  # density normalisation sums
+
+CURVES = ('polii', 'ser7p', 'ratio', 'log2_ratio', 'difference')
+
+
+def pack_occupancy(rows):
+    """Bit-pack a 0/1 (sims x gene_length) occupancy matrix along positions."""
+    return np.packbits(np.asarray(rows, dtype=bool), axis=1)
+
+
+def unpack_occupancy(packed, gene_length):
+    """Inverse of :func:`pack_occupancy`."""
+    return np.unpackbits(packed, axis=1, count=gene_length)
+
+
+def density_curves(polii_avg, ser7p_avg, sigma):
+    """Smoothed, normalised density curves along the last axis.
+
+    Returns a dict with the normalised Pol II and Ser7P densities, their
+    ratio, log2 ratio and difference, computed exactly as in
+    ``density8graphs_*.py``.  Leading axes are treated as a batch.
+    """
+    from scipy.ndimage import gaussian_filter1d  # SciPy is only loaded when curves are needed
+
+    smoothed_polii = gaussian_filter1d(polii_avg, sigma=sigma, axis=-1)
+    smoothed_ser7p = gaussian_filter1d(ser7p_avg, sigma=sigma, axis=-1)
+    polii = smoothed_polii / (smoothed_polii.sum(axis=-1, keepdims=True) + EPSILON_DENSITY)
+    ser7p = smoothed_ser7p / (smoothed_ser7p.sum(axis=-1, keepdims=True) + EPSILON_DENSITY)
+    ratio = ser7p / (polii + EPSILON)
+    return {
+        'polii': polii,
+        'ser7p': ser7p,
+        'ratio': ratio,
+        'log2_ratio': np.log2(ratio + EPSILON),
+        'difference': ser7p - polii,
+    }
+
+
+def bootstrap_bands(polii_rows, ser7p_rows, sigma=5, n_boot=1000, levels=(2.5, 97.5),
+                    batch_size=256, seed=None):
+    """Percentile bands of every curve in :data:`CURVES` over bootstrap resamples.
+
+    *polii_rows* and *ser7p_rows* are the unpacked per-simulation occupancy
+    matrices.  Resamples are drawn *batch_size* at a time to bound memory.
+    Returns a dict mapping each curve name to an array of shape
+    ``(len(levels), gene_length)``.
+    """
+    n_sims, gene_length = polii_rows.shape
+    rng = np.random.default_rng(seed)
+    polii = np.asarray(polii_rows, dtype=np.float64)
+    ser7p = np.asarray(ser7p_rows, dtype=np.float64)
+    samples = {name: np.empty((n_boot, gene_length), dtype=np.float32) for name in CURVES}
+    for start in range(0, n_boot, batch_size):
+        size = min(batch_size, n_boot - start)
+        weights = rng.multinomial(n_sims, np.full(n_sims, 1.0 / n_sims), size=size) / n_sims
+        curves = density_curves(weights @ polii, weights @ ser7p, sigma)
+        for name in CURVES:
+            samples[name][start:start + size] = curves[name]
+    return {name: np.percentile(samples[name], levels, axis=0) for name in CURVES}
@@ -0,0 +1,361 @@
+"""Fitting model header parameters to measured Pol II / Ser7P profiles by ABC-SMC.
+
+:func:`calibrate` runs approximate Bayesian computation with sequential
+Monte Carlo (Beaumont et al. 2009).  Generation 0 draws parameters from
+uniform priors within *bounds* (log-uniform for *log_scale* names); each
+later generation draws a particle of the previous one by weight, perturbs
+it with a Gaussian kernel of twice the weighted covariance, and keeps it if
+the run's :func:`distance` to the target is within the tolerance, a
+quantile of the previous generation's distances.  Every proposal is a
+rewritten ``.bc`` simulated with a configurable command (``bcs``, or
+:data:`bcs_pol.sweep.NUMPY_COMMAND` as a stand-in):
+
+* runs are submitted one at a time to ``cores // threads_per_run`` workers
+  and a new proposal goes out as soon as any run returns, so no worker
+  waits for a generation to fill.  Runs still going when their generation
+  closes were drawn from a stale proposal and are stopped;
+* parameters are rounded to *digits* significant digits, and finished runs
+  are stored in the :mod:`bcs_pol.sweep` cache under the same key, so a
+  point already run with the same command by a sweep or an earlier
+  calibration is loaded;
+* each trace is followed while it is written (:func:`bcs_pol.follow.follow_counts`)
+  with its simulations split alternately into two halves.  The distance
+  between the halves estimates how far the partial profile can still move,
+  and a run is stopped once its partial distance minus *safety* times that
+  exceeds the tolerance.  Stopped runs are kept as ``<key>.stopped.npz`` and
+  reused while they stay ruled out.
+
+The target is a profile in bins of bp (:func:`load_target`); runs are
+binned to the same bins through prefix sums (:mod:`bcs_pol.pyramid`).
+"""
+import collections
+import concurrent.futures
+import json
+import math
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from .aggregate import replace_atomic
+from .follow import follow_counts
+from .model import read_parameters, write_parameters
+from .parser import EXTRACTOR_VERSION
+from .pyramid import SITE_BP, DensityPyramid
+from .sweep import BCS_COMMAND, cache_key, load_point, simulator_environment
+
+STOPPED_SUFFIX = '.stopped.npz'
+
+Target = collections.namedtuple('Target', ['edges_bp', 'polii', 'ser7p'])
+Evaluation = collections.namedtuple('Evaluation', ['generation', 'params', 'key', 'distance', 'sims', 'stopped',
+                                                   'cached'])
+CalibrationResult = collections.namedtuple('CalibrationResult', ['names', 'population', 'weights', 'distances',
+                                                                 'epsilons', 'evaluations'])
+
+
+def load_target(path, bin_bp=None):
+    """A measured (or reference) profile to calibrate against.
+
+    *path* is a text file whose first four columns are ``start_bp``,
+    ``end_bp``, Pol II and Ser7P signal per bin (``#`` comments; the tables
+    of ``bcs-pol compare --bin-bp`` qualify), or a density ``.npz`` binned
+    by *bin_bp* (default one site).  Bin edges must fall on site boundaries.
+    """
+    if path.endswith('.npz'):
+        pyramid = DensityPyramid.load(path)
+        bin_bp = bin_bp or pyramid.site_bp
+        return Target(pyramid.bin_edges(bin_bp), pyramid.level('polii', bin_bp, average=True),
+                      pyramid.level('ser7p', bin_bp, average=True))
+    table = np.atleast_2d(np.loadtxt(path, comments='#'))
+    if (table[1:, 0] != table[:-1, 1]).any():
+        raise ValueError(f'{path}: bins must be contiguous')
+    return Target(np.append(table[:, 0], table[-1, 1]).astype(np.int64), table[:, 2], table[:, 3])
+
+
+def _binned(polii, ser7p, target):
+    """Pol II and Ser7P totals of per-site counts in the bins of *target*."""
+    edges = np.asarray(target.edges_bp)
+    if (edges % SITE_BP).any():
+        raise ValueError(f'target bin edges are not multiples of {SITE_BP} bp')
+    pyramid = DensityPyramid(polii, ser7p, levels_bp=())
+    first, last = edges[:-1] // SITE_BP + 1, edges[1:] // SITE_BP
+    return pyramid.window_total('polii', first, last), pyramid.window_total('ser7p', first, last)
+
+
+def _l1(profiles_a, profiles_b):
+    total = 0.0
+    for a, b in zip(profiles_a, profiles_b):
+        sum_a, sum_b = np.sum(a), np.sum(b)
+        if sum_a > 0 and sum_b > 0:
+            total += np.abs(np.asarray(a) / sum_a - np.asarray(b) / sum_b).sum()
+        elif sum_a > 0 or sum_b > 0:
+            total += 2.0
+    return float(total)
+
+
+def distance(polii, ser7p, target):
+    """L1 distance between the binned profiles of a run and of *target*.
+
+    Each profile is normalised to sum 1, as in ``density8graphs_*.py``, so
+    only shapes are compared and the arbitrary units of ChIP-seq or NET-seq
+    signal drop out; the Pol II and Ser7P distances are added (0 to 4).
+    """
+    return _l1(_binned(polii, ser7p, target), (target.polii, target.ser7p))
+
+
+def _lower_bound(halves, sims, sim_number, target, safety):
+    """Smallest final distance still plausible after *sims* of *sim_number* simulations.
+
+    *halves* holds the (Pol II, Ser7P) totals of the even and odd
+    simulations.  Two halves of sims/2 differ about twice as much as the
+    partial profile differs from the final one.
+    """
+    (polii_a, ser7p_a), (polii_b, ser7p_b) = halves
+    partial = distance(polii_a + polii_b, ser7p_a + ser7p_b, target)
+    spread = 0.5 * _l1(_binned(polii_a, ser7p_a, target), _binned(polii_b, ser7p_b, target))
+    return partial - safety * spread * math.sqrt(max(1 - sims / sim_number, 0))
+
+
+class _StopRule:
+    """:func:`bcs_pol.follow.follow_counts` monitor ending runs that are ruled out or cancelled."""
+
+    def __init__(self, gene_length, sim_number, target, tolerance, cancelled, min_sims, safety):
+        self.sim_number = sim_number
+        self.target = target
+        self.tolerance = tolerance
+        self.cancelled = cancelled
+        self.min_sims = min_sims
+        self.safety = safety
+        self.halves = np.zeros((2, 2, gene_length))  # (even, odd simulations) x (Pol II, Ser7P)
+        self.sims = 0
+        self.ruled_out = False
+
+    def update(self, polii_rows, ser7p_rows):
+        half = (self.sims + np.arange(len(polii_rows))) % 2
+        for k in (0, 1):
+            self.halves[k, 0] += polii_rows[half == k].sum(axis=0)
+            self.halves[k, 1] += ser7p_rows[half == k].sum(axis=0)
+        self.sims += len(polii_rows)
+        if self.sims >= self.min_sims and np.isfinite(self.tolerance):
+            bound = _lower_bound(self.halves, self.sims, self.sim_number, self.target, self.safety)
+            self.ruled_out = bound > self.tolerance
+
+    def converged(self):
+        return self.ruled_out or self.cancelled()
+
+    def state(self):
+        return {}
+
+    def restore(self, state):
+        pass
+
+
+def _run(text, key, sim_number, cache_dir, command, threads, target, tolerance, cancelled, min_sims, safety,
+         poll_interval):
+    """Distance of one proposal as ``(distance, sims, stopped, cached)``, or ``None`` if cancelled."""
+    gene_length = int(read_parameters(text)['gene_length'])
+    loaded = load_point(os.path.join(cache_dir, key + '.npz'))
+    if loaded is not None:
+        return distance(*loaded, target), sim_number, False, True
+    stopped_path = os.path.join(cache_dir, key + STOPPED_SUFFIX)
+    try:
+        with np.load(stopped_path) as data:
+            halves, sims = data['halves'], int(data['sims'])
+        if _lower_bound(halves, sims, sim_number, target, safety) > tolerance:
+            return distance(*halves.sum(axis=0), target), sims, True, True
+    except (OSError, KeyError, ValueError):
+        pass
+
+    with tempfile.TemporaryDirectory(prefix=key[:12], dir=cache_dir) as work:
+        model = os.path.join(work, 'model.bc')
+        trace = os.path.join(work, 'trace.bcs')
+        with open(model, 'w') as f:
+            f.write(text)
+        args = [arg.format(sims=sim_number, threads=threads, output=trace, model=model) for arg in command]
+        process = subprocess.Popen(args, stdout=subprocess.DEVNULL, env=simulator_environment())
+        rule = _StopRule(gene_length, sim_number, target, tolerance, cancelled, min_sims, safety)
+        result = None
+        try:
+            while not os.path.exists(trace) and process.poll() is None and not cancelled():
+                time.sleep(poll_interval)
+            if os.path.exists(trace) and not cancelled():
+                result = follow_counts(trace, gene_length, sim_number=sim_number, poll_interval=poll_interval,
+                                       refresh_interval=None, finished=lambda: process.poll() is not None,
+                                       monitor=rule, checkpoint_path=os.path.join(work, 'follow.npz'))
+        finally:
+            if process.poll() is None and (result is None or rule.converged()):
+                process.kill()
+            process.wait()
+        if cancelled():
+            return None
+        if rule.ruled_out:
+            replace_atomic(stopped_path, lambda f: np.savez(f, halves=rule.halves, sims=rule.sims,
+                                                             sim_number=sim_number, model=text))
+            return distance(*rule.halves.sum(axis=0), target), rule.sims, True, False
+        if process.returncode != 0 or result is None:
+            raise subprocess.CalledProcessError(process.returncode, args)
+        params = read_parameters(text)
+        replace_atomic(os.path.join(cache_dir, key + '.npz'),
+                        lambda f: np.savez(f, polii=result.polii, ser7p=result.ser7p, sim_number=sim_number,
+                                           params=json.dumps(params), model=text,
+                                           extractor_version=EXTRACTOR_VERSION))
+    return distance(result.polii, result.ser7p, target), result.sims, False, False
+
+
+def _round(value, digits, integer):
+    value = float(f'{value:.{digits}g}')
+    return int(round(value)) if integer else value
+
+
+def calibrate(model_path, target, bounds, sim_number, cache_dir, command=BCS_COMMAND, log_scale=(),
+              population_size=50, n_generations=5, quantile=0.5, min_epsilon=0.0, max_runs=None, digits=3,
+              early_stop=True, min_sims=None, safety=2.0, cores=None, threads_per_run=1, poll_interval=0.5,
+              seed=None, log=None):
+    """ABC-SMC fit of the header parameters in *bounds* to a :class:`Target`.
+
+    *bounds* maps parameter names (``uv_distance``, ``repair_half_life``,
+    ``dissociation_time``, ``initiation_freq`` ...) to ``(low, high)``.
+    Each generation keeps *population_size* runs; the tolerance of the next
+    one is the *quantile* of their distances.  The fit ends after
+    *n_generations*, once the tolerance is at most *min_epsilon*, or when
+    *max_runs* runs have been started.  With *early_stop*, runs are stopped
+    as described in the module docstring, no earlier than *min_sims*
+    simulations (default a fifth of *sim_number*).  *log*, e.g. ``print``,
+    is given a line per generation.  Returns a :class:`CalibrationResult`
+    with the last complete generation (natural units, one column per name),
+    its normalised weights and distances, the tolerance of every generation
+    and every run evaluated.
+    """
+    with open(model_path) as f:
+        base = f.read()
+    header = read_parameters(base)
+    names = list(bounds)
+    unknown = set(names) - set(header)
+    if unknown:
+        raise KeyError(f'not model parameters: {sorted(unknown)}')
+    os.makedirs(cache_dir, exist_ok=True)
+    min_sims = max(min_sims or sim_number // 5, 2)
+    is_log = np.array([name in log_scale for name in names])
+    integer = [isinstance(header[name], int) for name in names]
+    low = np.array([bounds[name][0] for name in names], dtype=np.float64)
+    high = np.array([bounds[name][1] for name in names], dtype=np.float64)
+    low, high = np.where(is_log, np.log(low), low), np.where(is_log, np.log(high), high)
+    rng = np.random.default_rng(seed)
+
+    def natural(theta):
+        return np.where(is_log, np.exp(theta), theta)
+
+    state = {'generation': 0, 'done': False}
+    epsilon, epsilons = np.inf, []
+    population = weights = distances = chol = inverse = None
+
+    def propose():
+        if population is None:
+            theta = rng.uniform(low, high)
+        else:
+            for _ in range(1000):
+                theta = population[rng.choice(len(population), p=weights)] + chol @ rng.standard_normal(len(names))
+                if ((theta >= low) & (theta <= high)).all():
+                    break
+            theta = np.clip(theta, low, high)
+        params = {name: _round(value, digits, is_int) for name, value, is_int in zip(names, natural(theta), integer)}
+        values = np.array([params[name] for name in names], dtype=np.float64)
+        return np.where(is_log, np.log(values), values), params
+
+    def kernel_weights(thetas):
+        """Prior over the mixture of perturbation kernels around the previous population."""
+        if population is None:
+            return np.ones(len(thetas))
+        scaled = (thetas[:, None, :] - population[None, :, :]) @ inverse.T
+        density = np.exp(-0.5 * np.square(scaled).sum(axis=-1)) @ weights
+        return 1.0 / np.maximum(density, np.finfo(float).tiny)
+
+    evaluations, accepted, in_flight = [], [], {}
+    runs = 0
+    n_parallel = max(1, (cores or os.cpu_count() or 1) // threads_per_run)
+    with concurrent.futures.ThreadPoolExecutor(n_parallel) as executor:
+        while True:
+            running = {proposals[0][3]: future for future, proposals in in_flight.items()
+                       if proposals[0][0] == state['generation']}
+            shared = 0
+            while (not state['done'] and len(in_flight) < n_parallel and shared < population_size
+                   and (max_runs is None or runs < max_runs)):
+                theta, params = propose()
+                text = write_parameters(base, params)
+                key = cache_key(text, sim_number, command)
+                generation = state['generation']
+                runs += 1
+                if key in running:
+                    # the same rounded point is already being simulated for this generation
+                    in_flight[running[key]].append((generation, theta, params, key))
+                    shared += 1
+                    continue
+                cancelled = (lambda generation=generation: state['done'] or state['generation'] != generation)
+                future = executor.submit(_run, text, key, sim_number, cache_dir, command, threads_per_run, target,
+                                         epsilon if early_stop else np.inf, cancelled, min_sims, safety,
+                                         poll_interval)
+                in_flight[future] = [(generation, theta, params, key)]
+                running[key] = future
+            if not in_flight:
+                break
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                outcome = future.result()
+                for k, (generation, theta, params, key) in enumerate(in_flight.pop(future)):
+                    if outcome is None:
+                        continue
+                    run_distance, sims, stopped, cached = outcome
+                    evaluations.append(Evaluation(generation, params, key, run_distance, sims, stopped,
+                                                  cached or k > 0))
+                    if state['done'] or generation != state['generation'] or stopped or run_distance > epsilon:
+                        continue
+                    accepted.append((theta, run_distance))
+                    if len(accepted) < population_size:
+                        continue
+
+                    thetas = np.array([theta for theta, _ in accepted])
+                    new_weights = kernel_weights(thetas)
+                    population, weights = thetas, new_weights / new_weights.sum()
+                    distances = np.array([run_distance for _, run_distance in accepted])
+                    epsilons.append(epsilon)
+                    if log is not None:
+                        current = [e for e in evaluations if e.generation == state['generation']]
+                        log(f"generation {state['generation']}: tolerance {epsilon:.4g}, {len(current)} runs "
+                            f"({sum(e.stopped for e in current)} stopped early, "
+                            f"{sum(e.cached for e in current)} cached), median distance {np.median(distances):.4g}")
+                    accepted = []
+                    epsilon = float(np.quantile(distances, quantile))
+                    covariance = 2 * np.atleast_2d(np.cov(population.T, aweights=weights))
+                    covariance += np.diag(1e-9 * np.square(high - low))
+                    chol = np.linalg.cholesky(covariance)
+                    inverse = np.linalg.inv(chol)
+                    if state['generation'] + 1 >= n_generations or epsilon <= min_epsilon:
+                        state['done'] = True
+                    else:
+                        state['generation'] += 1
+
+    if population is None:
+        if not accepted:
+            raise RuntimeError('no run was accepted; raise max_runs')
+        population = np.array([theta for theta, _ in accepted])
+        distances = np.array([run_distance for _, run_distance in accepted])
+        weights = np.full(len(population), 1.0 / len(population))
+        epsilons.append(epsilon)
+    return CalibrationResult(names, natural(population), weights, distances, np.array(epsilons), evaluations)
+
+
+def save_calibration(filename, result):
+    """Write a :class:`CalibrationResult` as an ``.npz``, with every run evaluated as columns."""
+    evaluations = result.evaluations
+    np.savez(filename, names=np.array(result.names), population=result.population, weights=result.weights,
+             distances=result.distances, epsilons=result.epsilons,
+             run_generation=np.array([e.generation for e in evaluations], dtype=np.int64),
+             run_params=np.array([[e.params[name] for name in result.names] for e in evaluations],
+                                 dtype=np.float64).reshape(len(evaluations), len(result.names)),
+             run_key=np.array([e.key for e in evaluations]),
+             run_distance=np.array([e.distance for e in evaluations]),
+             run_sims=np.array([e.sims for e in evaluations], dtype=np.int64),
+             run_stopped=np.array([e.stopped for e in evaluations]),
+             run_cached=np.array([e.cached for e in evaluations]))
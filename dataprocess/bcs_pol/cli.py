@@ -0,0 +1,483 @@
+"""Command line interface, ``bcs-pol <command>`` or ``python -m bcs_pol <command>``.
+
+Commands:
+
+``extract``
+    Density arrays (``<label>_polii_ser7p_density_arrays.npz`` and
+    ``.txt``) from one or more ``.bcs`` traces.  A trace given on its own
+    can instead be read for a subset of its simulations, through the
+    columnar store, or with densities at time checkpoints or action
+    timelines (see :mod:`bcs_pol.snapshot`); any trace also gives a
+    kymograph.
+``analyze``
+    Smoothed, normalised curves and bootstrap bands
+    (``<label>_density_curves.npz``) with the ``density8graphs`` summary.
+``plot``
+    The ``snapshot`` and ``density8graphs`` figures of each model, rendered
+    headless in a process pool (see :mod:`bcs_pol.reports`).
+``compare``
+    Models side by side: a summary table and an overlay figure, and with
+    ``--bin-bp`` the models in bins matching experimental data (see
+    :mod:`bcs_pol.pyramid`).
+``test``
+    Permutation tests of the first model against each other one, per
+    position and per window of positions, with multiple-testing
+    correction (``<a>_vs_<b>_permutation_test.npz``, see
+    :mod:`bcs_pol.permutation`).
+
+Every command takes any number of inputs written ``[LABEL=]PATH``.  A path
+is either a trace or a density ``.npz`` written by ``extract``; inputs with
+the same label are merged (see :mod:`bcs_pol.aggregate`), so a cis and a
+trans run, each split over several files, go through one invocation and
+each trace is parsed once.  ``gene_length`` is read from the model header
+given with ``--model [LABEL=]MODEL.bc``.
+
+Only the standard library is imported up front; NumPy, SciPy and
+matplotlib are loaded by the commands that use them.  ``--progress``
+prints progress lines and saves stage timings as
+``<labels>_<command>_telemetry.json``.  The ``snapshot_*.py`` and
+``density8graphs_*.py`` scripts are configuration for ``extract``,
+``analyze`` and ``plot``.
+"""
+import argparse
+import os
+import sys
+
+CURVES_SUFFIX = '_density_curves.npz'
+
+
+def _split_label(spec):
+    """``'cis=a.bcs'`` -> ``('cis', 'a.bcs')``; a bare path has no label."""
+    label, sep, path = spec.partition('=')
+    if not sep or not label or os.path.exists(spec):
+        return None, spec
+    return label, path
+
+
+def _gene_lengths(args, parser):
+    """``gene_length`` per model label from the ``--model`` headers."""
+    from .model import load_model
+
+    lengths = {}
+    for spec in args.model:
+        label, path = _split_label(spec)
+        _, params, variant = load_model(path)
+        if 'gene_length' not in params:
+            parser.error(f'{path} has no gene_length in its header')
+        lengths[label or variant] = int(params['gene_length'])
+    return lengths
+
+
+def _load_densities(path):
+    """A density ``.npz`` written by ``extract`` (or the snapshot scripts) as a partial."""
+    import numpy as np
+
+    from .aggregate import Partial, stored_sims
+
+    with np.load(path) as data:
+        polii, ser7p = data['polii_density_total'], data['ser7p_density_total']
+        sims = stored_sims(data)
+        packed = (None, None)
+        if 'polii_per_sim_packed' in data:
+            packed = data['polii_per_sim_packed'], data['ser7p_per_sim_packed']
+    return Partial(polii, ser7p, sims, *packed, (os.path.abspath(path),), (sims,))
+
+
+def _groups(args, parser):
+    """Input paths by label, in input order."""
+    from .aggregate import DENSITY_SUFFIX
+
+    lengths = _gene_lengths(args, parser)
+    groups = {}
+    for spec in args.inputs:
+        label, path = _split_label(spec)
+        if not os.path.exists(path):
+            parser.error(f'no such file: {path}')
+        if label is None:
+            if path.endswith(DENSITY_SUFFIX):
+                label = os.path.basename(path)[:-len(DENSITY_SUFFIX)]
+            elif len(lengths) == 1:
+                label = next(iter(lengths))
+            else:
+                label = os.path.basename(path).split('.')[0]
+        groups.setdefault(label, []).append(path)
+    return groups, lengths
+
+
+def _trace_gene_length(label, lengths, args, parser):
+    gene_length = lengths.get(label, args.gene_length)
+    if gene_length is None and len(lengths) == 1:
+        gene_length = next(iter(lengths.values()))
+    if gene_length is None:
+        parser.error(f'no gene length for {label!r}: give --model {label}=MODEL.bc or --gene-length')
+    return gene_length
+
+
+def _gather(args, parser, keep_per_sim=False):
+    """Merge the inputs by label; returns ``{label: Partial}`` in input order."""
+    from .aggregate import make_partials, merge, reduce_partials
+
+    groups, lengths = _groups(args, parser)
+    merged = {}
+    for label, paths in groups.items():
+        traces = [path for path in paths if not path.endswith('.npz')]
+        parts = [_load_densities(path) for path in paths if path.endswith('.npz')]
+        if traces:
+            gene_length = _trace_gene_length(label, lengths, args, parser)
+            # partials go to the cache directory, never next to traces that may be read-only or shared
+            partials = make_partials(traces, gene_length, args.sim_number, keep_per_sim, args.workers,
+                                     cache_dir=args.cache_dir or args.output_dir)
+            parts.append(reduce_partials(partials, args.workers))
+        merged[label] = merge(parts)
+    return merged
+
+
+def _curves(partial, args, bootstrap):
+    """Density curves of *partial* and, when it has per-simulation rows, bootstrap bands."""
+    from .bootstrap import bootstrap_bands, density_curves, unpack_occupancy
+
+    sims = max(partial.sims, 1)
+    curves = density_curves(partial.polii / sims, partial.ser7p / sims, args.sigma)
+    bands = None
+    if bootstrap and partial.polii_packed is not None and partial.sims > 1:
+        gene_length = len(partial.polii)
+        bands = bootstrap_bands(unpack_occupancy(partial.polii_packed, gene_length),
+                                unpack_occupancy(partial.ser7p_packed, gene_length), sigma=args.sigma,
+                                n_boot=args.bootstrap, levels=args.band, seed=args.seed)
+    return curves, bands
+
+
+def _output(args, name):
+    os.makedirs(args.output_dir, exist_ok=True)
+    return os.path.join(args.output_dir, name)
+
+
+def _telemetry(args):
+    """A running :class:`bcs_pol.telemetry.Telemetry` when ``--progress`` was given, else ``None``."""
+    if args.progress is None:
+        return None
+    from .telemetry import Telemetry
+
+    telemetry = Telemetry(args.progress)
+    telemetry.begin(args.command)
+    return telemetry
+
+
+def _finish_telemetry(telemetry, args, labels):
+    if telemetry is None:
+        return
+    telemetry.finish()
+    filename = _output(args, f"{'_'.join(labels)}_{args.command}_telemetry.json")
+    telemetry.save(filename)
+    print(f"Telemetry saved to: {filename}")
+
+
+def _sims(text):
+    """``'1-20,40'`` -> simulations 1..20 and 40."""
+    sims = []
+    try:
+        for part in text.split(','):
+            first, _, last = part.partition('-')
+            sims.extend(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected simulation numbers like 1-20,40, got {text!r}') from None
+    return sims
+
+
+def _extract_alone(args, parser, groups, lengths):
+    """``extract`` of one trace per label with the reading modes of :mod:`bcs_pol.snapshot`."""
+    from .snapshot import extract_snapshot, save_snapshot
+
+    modes = [flag for flag, value in (('--sims', args.sims), ('--store', args.store or None),
+                                      ('--per-sim', args.per_sim or None),
+                                      ('--snapshot-interval', args.snapshot_interval),
+                                      ('--rate-time-bin', args.rate_time_bin)) if value is not None]
+    if len(modes) > 1:
+        parser.error(f"{' and '.join(modes)} each read the trace their own way; give at most one of them")
+    for label, paths in groups.items():
+        if len(paths) != 1 or paths[0].endswith('.npz'):
+            parser.error(f'--sims, --store, --snapshot-interval and --rate-time-bin read one trace per label, '
+                         f'{label!r} has {len(paths)} input(s)')
+        snapshot = extract_snapshot(paths[0], _trace_gene_length(label, lengths, args, parser), args.sim_number,
+                                    args.workers or os.cpu_count(), args.sims, args.store, args.per_sim,
+                                    args.snapshot_interval, args.rate_time_bin, args.rate_position_bin)
+        os.makedirs(args.output_dir, exist_ok=True)
+        filenames = save_snapshot(args.output_dir, label, snapshot)
+        print(f"{label}: {snapshot.sims} simulations -> {', '.join(filenames)}")
+
+
+def cmd_extract(args, parser):
+    from .aggregate import DENSITY_SUFFIX, save_partial_densities
+
+    telemetry = _telemetry(args)
+    groups, lengths = _groups(args, parser)
+    if args.sims is not None or args.store or args.snapshot_interval is not None or args.rate_time_bin is not None:
+        _extract_alone(args, parser, groups, lengths)
+    else:
+        for label, partial in _gather(args, parser, keep_per_sim=args.per_sim).items():
+            npz_filename = _output(args, label + DENSITY_SUFFIX)
+            save_partial_densities(npz_filename, _output(args, f'{label}_polii_ser7p_density_data.txt'), partial)
+            print(f"{label}: {partial.sims} simulations from {len(partial.sources)} file(s) -> {npz_filename}")
+
+    if args.kymograph_time_bin is not None:
+        import numpy as np
+
+        from .index import load_index
+        from .kymograph import Kymograph, extract_kymograph
+
+        if telemetry is not None:
+            telemetry.begin('kymograph')
+        for label, paths in groups.items():
+            # time-weighted occupancy per (time bin, position bin), averaged over simulations
+            traces = [path for path in paths if not path.endswith('.npz')]
+            if not traces:
+                continue
+            t_max = max(np.nanmax(load_index(path).final_time) for path in traces)
+            kymograph = Kymograph(_trace_gene_length(label, lengths, args, parser), t_max, args.kymograph_time_bin,
+                                  args.kymograph_position_bin)
+            for path in traces:
+                extract_kymograph(path, kymograph.gene_length, args.kymograph_time_bin, sim_number=args.sim_number,
+                                  kymograph=kymograph)
+            filename = _output(args, f'{label}_polii_ser7p_kymograph.npz')
+            kymograph.save(filename)
+            print(f"Kymograph saved to: {filename}")
+    _finish_telemetry(telemetry, args, groups)
+
+
+def cmd_analyze(args, parser):
+    import numpy as np
+
+    telemetry = _telemetry(args)
+    partials = _gather(args, parser, keep_per_sim=args.bootstrap > 0)
+    for label, partial in partials.items():
+        curves, bands = _curves(partial, args, args.bootstrap > 0)
+        arrays = dict(curves)
+        if bands is not None:
+            arrays.update({f'{name}_band': band for name, band in bands.items()})
+        filename = _output(args, label + CURVES_SUFFIX)
+        np.savez(filename, positions=np.arange(1, len(partial.polii) + 1), sims=partial.sims, sigma=args.sigma,
+                 **arrays)
+        print(f"\n--- {label}: {partial.sims} simulations, first 10 values -> {filename} ---")
+        print(f"{'Position':<10}{'PolII Density':<15}{'Ser7P Density':<15}{'Ratio Densities':<18}"
+              f"{'Log2 Ratio Densities':<23}{'Diff Density':<15}")
+        for i in range(min(10, len(partial.polii))):
+            print(f"{i + 1:<10}{curves['polii'][i]:<15.4f}{curves['ser7p'][i]:<15.4f}{curves['ratio'][i]:<18.4f}"
+                  f"{curves['log2_ratio'][i]:<23.4f}{curves['difference'][i]:<15.4f}")
+    _finish_telemetry(telemetry, args, partials)
+
+
+def cmd_plot(args, parser):
+    from .reports import FIGURES, Report, render_reports
+
+    telemetry = _telemetry(args)
+    reports = []
+    for label, partial in _gather(args, parser, keep_per_sim=args.bootstrap > 0).items():
+        curves, bands = _curves(partial, args, args.bootstrap > 0)
+        reports.append(Report(label, partial.polii, partial.ser7p, partial.sims, curves, bands))
+    for filenames in render_reports(reports, args.output_dir, args.format, args.dpi, args.sigma, args.zoom,
+                                    args.rasterize, n_workers=args.workers, figures=args.figure or FIGURES):
+        for filename in filenames:
+            print(f"Plot saved to: {filename}")
+    _finish_telemetry(telemetry, args, [report.label for report in reports])
+
+
+def cmd_compare(args, parser):
+    import numpy as np
+
+    from .pyramid import DensityPyramid
+
+    telemetry = _telemetry(args)
+    partials = _gather(args, parser, keep_per_sim=True)
+    if len(partials) < 2:
+        parser.error('compare needs inputs with at least two labels')
+    curves = {label: _curves(partial, args, False)[0] for label, partial in partials.items()}
+    pyramids = {label: DensityPyramid(partial.polii, partial.ser7p, partial.sims)
+                for label, partial in partials.items()}
+    gene_bps = {label: pyramid.gene_bp for label, pyramid in pyramids.items()}
+    if args.bin_bp and len(set(gene_bps.values())) > 1:
+        parser.error(f'--bin-bp tabulates models on shared bins, but their genes differ: {gene_bps} bp')
+    first, stop = next(iter(partials)), args.zoom
+
+    print(f"{'Model':<14}{'Sims':>6}{'PolII/site':>12}{'Ser7P frac':>12}{f'L1 vs {first}':>14}{'max |z| PolII':>15}")
+    for label, partial in partials.items():
+        pyramid = pyramids[label]
+        polii, ser7p = (pyramid.level(name, pyramid.gene_bp)[0] for name in ('polii', 'ser7p'))
+        fraction = ser7p / polii if polii > 0 else np.nan
+        distance = np.abs(curves[label]['ser7p'] - curves[first]['ser7p']).sum()
+        z = '-'
+        if label != first and partial.polii_packed is not None and partials[first].polii_packed is not None:
+            from .bootstrap import unpack_occupancy
+            from .simulate import occupancy_z_scores
+            gene_length = len(partial.polii)
+            scores = occupancy_z_scores(unpack_occupancy(partials[first].polii_packed, gene_length),
+                                        unpack_occupancy(partial.polii_packed, gene_length))
+            z = f'{np.nanmax(np.abs(scores[:stop])):.2f}'
+        print(f"{label:<14}{partial.sims:>6}{pyramid.level('polii', pyramid.gene_bp, average=True)[0]:>12.4f}"
+              f"{fraction:>12.4f}{distance:>14.4f}{z:>15}")
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    from .plots import binned_figure, compare_figure
+
+    fig = compare_figure(curves, args.sigma, args.zoom)
+    filename = _output(args, f"compare_{'_'.join(partials)}.{args.format}")
+    fig.savefig(filename, dpi=args.dpi, bbox_inches='tight')
+    plt.close(fig)
+    print(f"Plot saved to: {filename}")
+
+    for bin_bp in args.bin_bp:
+        stem = f"compare_{'_'.join(partials)}_{bin_bp}bp"
+        edges = next(iter(pyramids.values())).bin_edges(bin_bp)
+        with open(_output(args, stem + '.txt'), 'w') as f:
+            f.write('# Start_bp\tEnd_bp'
+                    + ''.join(f'\t{label}_PolII_Avg\t{label}_Ser7P_Avg' for label in pyramids) + '\n')
+            levels = [pyramid.level(name, bin_bp, average=True) for pyramid in pyramids.values()
+                      for name in ('polii', 'ser7p')]
+            for k in range(len(edges) - 1):
+                f.write(f'{edges[k]}\t{edges[k + 1]}' + ''.join(f'\t{level[k]:.6f}' for level in levels) + '\n')
+        print(f"Data saved to: {f.name}")
+        fig = binned_figure(pyramids, bin_bp)
+        filename = _output(args, f'{stem}.{args.format}')
+        fig.savefig(filename, dpi=args.dpi, bbox_inches='tight')
+        plt.close(fig)
+        print(f"Plot saved to: {filename}")
+    _finish_telemetry(telemetry, args, partials)
+
+
+def _window(text):
+    first, _, last = text.partition('-')
+    try:
+        return int(first), int(last)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected FIRST-LAST, got {text!r}') from None
+
+
+def cmd_test(args, parser):
+    import numpy as np
+
+    from .bootstrap import unpack_occupancy
+    from .permutation import METRICS, permutation_test, save_permutation_test
+
+    telemetry = _telemetry(args)
+    partials = _gather(args, parser, keep_per_sim=True)
+    if len(partials) < 2:
+        parser.error('test needs inputs with at least two labels')
+    missing = [label for label, partial in partials.items() if partial.polii_packed is None]
+    if missing:
+        parser.error(f'no per-simulation occupancy for {", ".join(missing)} (extract with --per-sim)')
+    (first, reference), *others = partials.items()
+    gene_length = len(reference.polii)
+    rows_a = [unpack_occupancy(packed, gene_length) for packed in (reference.polii_packed, reference.ser7p_packed)]
+    for label, partial in others:
+        rows_b = [unpack_occupancy(packed, gene_length) for packed in (partial.polii_packed, partial.ser7p_packed)]
+        result = permutation_test(*rows_a, *rows_b, curve=args.curve, sigma=args.sigma,
+                                  windows=args.window or [(1, args.zoom), (1, gene_length)],
+                                  n_permutations=args.permutations, correction=args.correction, seed=args.seed,
+                                  n_workers=args.workers)
+        filename = _output(args, f'{first}_vs_{label}_permutation_test.npz')
+        save_permutation_test(filename, result, sims=np.array([reference.sims, partial.sims]))
+
+        significant = np.flatnonzero(result.p_adjusted < args.alpha) + 1
+        print(f"\n--- {first} ({reference.sims} sims) vs {label} ({partial.sims} sims): {args.curve}, "
+              f"sigma={args.sigma:g}, {args.permutations} permutations -> {filename} ---")
+        print(f"{len(significant)} of {gene_length} positions with {args.correction}-adjusted p < {args.alpha:g}")
+        if len(significant):
+            breaks = np.flatnonzero(np.diff(significant) > 1) + 1
+            print('  ' + ', '.join(f'{run[0]}-{run[-1]}' if len(run) > 1 else f'{run[0]}'
+                                   for run in np.split(significant, breaks)))
+        print(f"{'Window':<12}{'Metric':<8}{'Observed':>12}{'p':>10}{'Holm p':>10}")
+        for k, (start, stop) in enumerate(result.windows):
+            for m, metric in enumerate(METRICS):
+                print(f"{f'{start}-{stop}':<12}{metric:<8}{result.window_observed[k, m]:>12.4g}"
+                      f"{result.window_p_values[k, m]:>10.4g}{result.window_p_adjusted[k, m]:>10.4g}")
+    _finish_telemetry(telemetry, args, partials)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='bcs-pol', description='Pol II / Ser7P densities from bcs traces.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add(name, func, help):
+        sub = commands.add_parser(name, help=help, description=help)
+        sub.set_defaults(func=func)
+        sub.add_argument('inputs', nargs='+', metavar='[LABEL=]PATH',
+                         help='.bcs trace (also .gz/.xz/.bz2) or density .npz; same label = merged')
+        sub.add_argument('-m', '--model', action='append', default=[], metavar='[LABEL=]MODEL',
+                         help='model .bc whose header gives gene_length (label defaults to cis/trans)')
+        sub.add_argument('-g', '--gene-length', type=int, help='gene length for traces without a --model')
+        sub.add_argument('-n', '--sim-number', type=int, help='simulations used from each trace (default all)')
+        sub.add_argument('-j', '--workers', type=int, help='processes parsing traces (default all CPUs)')
+        sub.add_argument('-o', '--output-dir', default='.', help='where outputs are written (default .)')
+        sub.add_argument('--cache-dir', help='where per-trace partials are kept (default the output directory)')
+        sub.add_argument('--progress', type=float, metavar='SECONDS',
+                         help='print progress every SECONDS and save <labels>_<command>_telemetry.json')
+        return sub
+
+    sub = add('extract', cmd_extract, 'write density arrays for each model')
+    sub.add_argument('--per-sim', action='store_true', help='keep bit-packed per-simulation occupancy')
+    alone = sub.add_argument_group('reading one trace per label (at most one of these and --per-sim)')
+    alone.add_argument('--sims', type=_sims, metavar='LIST',
+                       help='only these simulations, e.g. 1-20 to preview or 201-500 to resume')
+    alone.add_argument('--store', action='store_true',
+                       help='convert once to <trace>.store/ and count from memory-mapped columns')
+    alone.add_argument('--snapshot-interval', type=float, metavar='SECONDS',
+                       help='also write the densities at every checkpoint SECONDS apart')
+    alone.add_argument('--rate-time-bin', type=float, metavar='SECONDS',
+                       help='also write the count of every action per time bin (damage left, dissociation rate)')
+    alone.add_argument('--rate-position-bin', type=int, metavar='SITES', help='sites per position bin of those counts')
+    sub.add_argument('--kymograph-time-bin', type=float, metavar='SECONDS',
+                     help='also write a time x position occupancy kymograph with SECONDS per time bin')
+    sub.add_argument('--kymograph-position-bin', type=int, default=1, metavar='SITES',
+                     help='sites per kymograph position bin (default 1)')
+
+    for name, func, help in (('analyze', cmd_analyze, 'smoothed density curves and bootstrap bands'),
+                             ('plot', cmd_plot, 'snapshot and density8graphs figures'),
+                             ('compare', cmd_compare, 'compare models in a table and an overlay figure')):
+        sub = add(name, func, help)
+        sub.add_argument('--sigma', type=float, default=5, help='Gaussian smoothing in positions (default 5)')
+        sub.add_argument('--zoom', type=int, default=50, help='positions in the zoomed-in views (default 50)')
+        if name != 'compare':
+            sub.add_argument('--bootstrap', type=int, default=1000,
+                             help='bootstrap resamples for bands, 0 for none (default 1000)')
+            sub.add_argument('--seed', type=int, help='bootstrap seed')
+            sub.add_argument('--band', type=float, nargs=2, default=(2.5, 97.5), metavar=('LOW', 'HIGH'),
+                             help='percentiles of the bootstrap bands (default 2.5 97.5)')
+        if name != 'analyze':
+            sub.add_argument('--format', default='pdf', help='figure format (default pdf)')
+            sub.add_argument('--dpi', type=int, default=300, help='figure resolution (default 300)')
+        if name == 'compare':
+            sub.add_argument('--bin-bp', type=int, action='append', default=[], metavar='BP',
+                             help='also tabulate and plot models in bins of BP base pairs, e.g. 1000 or 10000 '
+                                  '(repeatable)')
+        if name == 'plot':
+            sub.add_argument('--rasterize', action='store_true',
+                             help='embed curves and bars as images at --dpi (for dense line art)')
+            sub.add_argument('--figure', action='append', choices=('snapshot', 'density'),
+                             help='only this figure, repeatable (default both)')
+
+    sub = add('test', cmd_test, 'permutation tests of the first model against the others')
+    sub.add_argument('--curve', default='ratio', choices=('polii', 'ser7p', 'ratio', 'log2_ratio', 'difference'),
+                     help='density curve compared (default ratio, normalised Ser7P / Pol II)')
+    sub.add_argument('--sigma', type=float, default=5, help='Gaussian smoothing in positions (default 5)')
+    sub.add_argument('--zoom', type=int, default=50, help='default first window is 1-ZOOM (default 50)')
+    sub.add_argument('--window', action='append', type=_window, metavar='FIRST-LAST',
+                     help='window of positions tested as a whole, repeatable (default 1-ZOOM and the whole gene)')
+    sub.add_argument('--permutations', type=int, default=10000, help='random splits (default 10000)')
+    sub.add_argument('--correction', default='bh', choices=('bh', 'by', 'holm', 'bonferroni'),
+                     help='position-wise multiple-testing correction (default bh)')
+    sub.add_argument('--alpha', type=float, default=0.05, help='significance level reported (default 0.05)')
+    sub.add_argument('--seed', type=int, help='permutation seed')
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    args.func(args, parser)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Transparent reading of gzip, xz and bz2 compressed ``.bcs`` traces.
+
+:func:`open_trace` returns a binary file object for plain and compressed
+traces alike.  For a compressed trace, decompression runs in a background
+thread that hands fixed-size pieces to the reader through a bounded queue,
+so decompressing the next piece overlaps with parsing the current one (the
+stdlib decompressors release the GIL while they work).  Compressed streams
+cannot seek, so the byte-range functions in :mod:`bcs_pol.parallel` read
+them sequentially instead.
+"""
+import bz2
+import gzip
+import lzma
+import os
+import queue
+import threading
+
+from .telemetry import watch
+
+PIECE_SIZE = 1 << 22  # decompressed bytes handed over at a time (4 MiB)
+QUEUE_PIECES = 16  # pieces buffered ahead of the parser
+
+# leading bytes of each format -> module whose open() reads it
+_MAGIC = (
+    (b'\x1f\x8b', gzip),
+    (b'\xfd7zXZ\x00', lzma),
+    (b'BZh', bz2),
+)
+
+
+def _compressor(path):
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for magic, module in _MAGIC:
+        if head.startswith(magic):
+            return module
+    return None
+
+
+def is_compressed(path):
+    """True if *path* is a gzip, xz or bz2 file, whatever its suffix."""
+    return _compressor(path) is not None
+
+
+class ThreadedReader:
+    """Read-only binary stream fed by a background decompression thread."""
+
+    def __init__(self, path, module, piece_size=PIECE_SIZE, queue_pieces=QUEUE_PIECES):
+        self._queue = queue.Queue(queue_pieces)
+        self._stop = threading.Event()
+        self._pending = b''
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, args=(path, module, piece_size), daemon=True)
+        self._thread.start()
+
+    def _fill(self, path, module, piece_size):
+        try:
+            with module.open(path, 'rb') as f:
+                while not self._stop.is_set():
+                    piece = f.read(piece_size)
+                    self._put(piece)
+                    if not piece:
+                        return
+        except Exception as error:  # re-raised in the reading thread
+            self._put(error)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _next_piece(self):
+        item = self._queue.get()
+        if isinstance(item, Exception):
+            self._eof = True
+            raise item
+        if not item:
+            self._eof = True
+        return item
+
+    def read(self, size=-1):
+        pieces = [self._pending]
+        have = len(self._pending)
+        while (size < 0 or have < size) and not self._eof:
+            piece = self._next_piece()
+            pieces.append(piece)
+            have += len(piece)
+        data = b''.join(pieces)
+        if size < 0:
+            self._pending = b''
+            return data
+        self._pending = data[size:]
+        return data[:size]
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_trace(path):
+    """Open the trace *path* for binary reading, decompressing if needed.
+
+    Reads are counted by the running :mod:`bcs_pol.telemetry` stage, if any;
+    progress in percent is only known for uncompressed traces.
+    """
+    module = _compressor(path)
+    if module is None:
+        return watch(open(path, 'rb'), os.path.getsize(path))
+    return watch(ThreadedReader(path, module))
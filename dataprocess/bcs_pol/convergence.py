@@ -0,0 +1,187 @@
+"""Sequential convergence checks on the simulation count.
+
+A :class:`ConvergenceMonitor` keeps streaming per-position means and
+(co)variances over simulations, updated a batch at a time with the
+pairwise Welford/Chan formulas, for
+
+* ``polii`` and ``ser7p``: the final per-simulation occupancy averaged in
+  ``snapshot_cis.py``,
+* ``ratio``: the normalised, smoothed Ser7P / Pol II density ratio of
+  ``density8graphs_*.py``.  It is a smooth function of the mean smoothed
+  profiles and their sums, so its variance follows from their running
+  covariance by the delta method.
+
+The confidence interval half-width at each position is divided by the mean
+value over a window of positions (the whole gene by default), and the
+maximum of that over the window is compared with a target per quantity.
+:func:`converge_trace` stops reading a trace as soon as every target is met;
+:func:`bcs_pol.follow.follow_counts` takes a monitor too and stops following.
+"""
+import collections
+
+import numpy as np
+from scipy.ndimage import gaussian_filter1d
+from scipy.stats import norm
+
+from .bootstrap import density_curves
+from .compressed import open_trace
+from .parser import DEFAULT_CHUNK_SIZE, iter_occupancy
+
+QUANTITIES = ('polii', 'ser7p', 'ratio')
+
+ConvergenceResult = collections.namedtuple('ConvergenceResult', ['polii', 'ser7p', 'sims', 'converged'])
+
+
+class ConvergenceMonitor:
+    """Running per-position statistics of simulations and a stopping rule.
+
+    *targets* maps quantities in :data:`QUANTITIES` to the largest relative
+    CI half-width accepted, e.g. ``{'ratio': 0.05}`` for +-5%.  *window* is
+    an inclusive ``(first, last)`` range of 1-based positions, e.g.
+    ``(1, 50)``.  *sigma* is the smoothing of the ratio curve, *level* the
+    confidence level, and no decision is made before *min_sims* simulations.
+    """
+
+    def __init__(self, gene_length, targets, window=None, sigma=5, level=0.95, min_sims=20):
+        unknown = set(targets) - set(QUANTITIES)
+        if unknown:
+            raise ValueError(f'unknown quantities {sorted(unknown)}; choose from {QUANTITIES}')
+        self.gene_length = gene_length
+        self.targets = dict(targets)
+        first, last = window or (1, gene_length)
+        self.window = slice(first - 1, last)
+        self.sigma = sigma
+        self.z = norm.ppf(0.5 + level / 2)
+        self.min_sims = min_sims
+        self.n = 0
+        # raw occupancy of Pol II / Ser7P, and per position the smoothed Pol II, smoothed Ser7P
+        # and the two smoothed profile sums
+        self.mean_raw = np.zeros((2, gene_length))
+        self.m2_raw = np.zeros((2, gene_length))
+        self.mean_smooth = np.zeros((gene_length, 4))
+        self.comoment_smooth = np.zeros((gene_length, 4, 4))
+
+    def update(self, polii_rows, ser7p_rows):
+        """Add a batch of per-simulation 0/1 occupancy rows."""
+        polii = np.asarray(polii_rows, dtype=np.float64).reshape(-1, self.gene_length)
+        ser7p = np.asarray(ser7p_rows, dtype=np.float64).reshape(-1, self.gene_length)
+        n_b = len(polii)
+        if n_b == 0:
+            return
+        raw = np.stack([polii, ser7p], axis=1)  # (sims, 2, gene_length)
+        smooth_polii = gaussian_filter1d(polii, self.sigma, axis=-1)
+        smooth_ser7p = gaussian_filter1d(ser7p, self.sigma, axis=-1)
+        smooth = np.stack([smooth_polii, smooth_ser7p,
+                           np.repeat(smooth_polii.sum(axis=1, keepdims=True), self.gene_length, axis=1),
+                           np.repeat(smooth_ser7p.sum(axis=1, keepdims=True), self.gene_length, axis=1)], axis=-1)
+
+        n_a, n = self.n, self.n + n_b
+        mean_b = raw.mean(axis=0)
+        delta = mean_b - self.mean_raw
+        self.m2_raw += ((raw - mean_b) ** 2).sum(axis=0) + delta ** 2 * n_a * n_b / n
+        self.mean_raw += delta * n_b / n
+
+        mean_b = smooth.mean(axis=0)
+        centred = smooth - mean_b
+        delta = mean_b - self.mean_smooth
+        self.comoment_smooth += (np.einsum('sgi,sgj->gij', centred, centred)
+                                 + np.einsum('gi,gj->gij', delta, delta) * n_a * n_b / n)
+        self.mean_smooth += delta * n_b / n
+        self.n = n
+
+    def values(self):
+        """Current estimate of each quantity, one array per position."""
+        ratio = density_curves(self.mean_raw[0], self.mean_raw[1], self.sigma)['ratio']
+        return {'polii': self.mean_raw[0], 'ser7p': self.mean_raw[1], 'ratio': ratio}
+
+    def half_widths(self):
+        """CI half-width of each quantity per position.
+
+        All are inf before two simulations; the ratio is NaN where no
+        simulation has put Pol II near a position, and such positions are
+        left out of :meth:`relative_widths`.
+        """
+        if self.n < 2:
+            return {name: np.full(self.gene_length, np.inf) for name in QUANTITIES}
+        widths = {}
+        variance = self.m2_raw / (self.n - 1)
+        widths['polii'] = self.z * np.sqrt(variance[0] / self.n)
+        widths['ser7p'] = self.z * np.sqrt(variance[1] / self.n)
+
+        # ratio = S * A_p / (P * A_s); gradient in (P, S, A_p, A_s)
+        p, s, a_p, a_s = self.mean_smooth.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = s * a_p / (p * a_s)
+            gradient = np.stack([-ratio / p, a_p / (p * a_s), ratio / a_p, -ratio / a_s], axis=-1)
+            covariance = self.comoment_smooth / (self.n - 1)
+            variance = np.einsum('gi,gij,gj->g', gradient, covariance, gradient)
+        widths['ratio'] = np.where(p > 0, self.z * np.sqrt(np.maximum(variance, 0) / self.n), np.nan)
+        return widths
+
+    def relative_widths(self):
+        """Largest CI half-width over the window divided by the mean value there."""
+        values = self.values()
+        widths = self.half_widths()
+        relative = {}
+        for name in self.targets:
+            width = widths[name][self.window]
+            measured = ~np.isnan(width)
+            scale = np.abs(values[name][self.window][measured]).mean() if measured.any() else 0.0
+            relative[name] = float(width[measured].max() / scale) if scale > 0 else np.inf
+        return relative
+
+    def converged(self):
+        """True once *min_sims* simulations are in and every target is met."""
+        if self.n < max(self.min_sims, 2):
+            return False
+        return all(width <= self.targets[name] for name, width in self.relative_widths().items())
+
+    def state(self):
+        """Arrays that :meth:`restore` takes to continue from this point."""
+        return dict(n=self.n, mean_raw=self.mean_raw, m2_raw=self.m2_raw, mean_smooth=self.mean_smooth,
+                    comoment_smooth=self.comoment_smooth)
+
+    def restore(self, state):
+        for name in ('mean_raw', 'm2_raw', 'mean_smooth', 'comoment_smooth'):
+            if np.shape(state[name]) != np.shape(getattr(self, name)):
+                raise ValueError(f'saved {name} has shape {np.shape(state[name])}')
+        self.n = int(state['n'])
+        self.mean_raw = np.array(state['mean_raw'], dtype=np.float64)
+        self.m2_raw = np.array(state['m2_raw'], dtype=np.float64)
+        self.mean_smooth = np.array(state['mean_smooth'], dtype=np.float64)
+        self.comoment_smooth = np.array(state['comoment_smooth'], dtype=np.float64)
+
+
+def converge_trace(path, gene_length, monitor, sim_number=None, check_every=10, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Read simulations from *path* until *monitor* has converged.
+
+    The monitor is updated and checked every *check_every* simulations;
+    reading stops at the first check that passes, or after *sim_number*
+    simulations.  Returns a :class:`ConvergenceResult` with the summed
+    occupancy of the simulations read.
+    """
+    polii = np.zeros(gene_length)
+    ser7p = np.zeros(gene_length)
+    sims = 0
+    batch = []
+
+    def flush():
+        nonlocal polii, ser7p, sims
+        if batch:
+            polii_rows, ser7p_rows = np.array([a for a, _ in batch]), np.array([b for _, b in batch])
+            monitor.update(polii_rows, ser7p_rows)
+            polii += polii_rows.sum(axis=0)
+            ser7p += ser7p_rows.sum(axis=0)
+            sims += len(batch)
+            batch.clear()
+
+    with open_trace(path) as f:
+        for rows in iter_occupancy(f, gene_length, sim_number, chunk_size=chunk_size):
+            batch.append(rows)
+            if len(batch) == check_every:
+                flush()
+                if monitor.converged():
+                    break
+        else:
+            flush()
+    return ConvergenceResult(polii, ser7p, sims, monitor.converged())
@@ -0,0 +1,194 @@
+"""Density curves of many runs at many smoothing widths in one batch.
+
+:func:`density_curves` in :mod:`bcs_pol.bootstrap` smooths one pair of
+density arrays at one sigma.  Here the densities of many runs are stacked
+as (runs x species x gene_length) and smoothed at every sigma at once.
+Narrow kernels run ``gaussian_filter1d`` over the whole block; for wide
+ones the rows are padded by reflection (its default mode) to the largest
+radius, and the block takes one real FFT, one product with the spectra of
+all those kernels and one inverse FFT.  The normalised densities, ratio,
+log2 ratio and difference are then computed in place, into buffers reused
+from block to block, so results equal :func:`density_curves` to rounding.
+
+:func:`write_curves` stores every curve of every run and sigma as a
+columnar directory, one ``<curve>.npy`` of shape (runs x sigmas x
+gene_length) per curve plus a ``meta.json`` with the run labels and
+sigmas; :func:`open_curves` memory-maps it back and :func:`select` picks
+curves by label and sigma without recomputing anything.
+"""
+import collections
+import json
+import os
+
+import numpy as np
+
+from .bootstrap import CURVES, EPSILON, EPSILON_DENSITY
+
+TRUNCATE = 4.0  # kernel radius in sigmas, as in gaussian_filter1d
+FFT_RADIUS = 32  # wider kernels are applied by FFT; below this direct convolution is faster
+
+CurveBank = collections.namedtuple('CurveBank', ['labels', 'sigmas', 'positions', 'curves'])
+
+
+def _kernel_spectra(sigmas, n_fft):
+    """Real FFT of each centred, normalised Gaussian kernel on a circle of *n_fft* points."""
+    from scipy.fft import rfft
+
+    kernels = np.zeros((len(sigmas), n_fft))
+    for k, sigma in enumerate(sigmas):
+        radius = int(TRUNCATE * sigma + 0.5)
+        x = np.arange(-radius, radius + 1)
+        weights = np.exp(-0.5 / sigma ** 2 * x ** 2) if sigma > 0 else np.ones(1)
+        kernels[k, x % n_fft] = weights / weights.sum()
+    return rfft(kernels, axis=-1)
+
+
+def smooth_rows(rows, sigmas, out=None):
+    """``gaussian_filter1d`` of every row of *rows* at every sigma.
+
+    *rows* has shape (n, gene_length); returns (n, len(sigmas), gene_length),
+    written into *out* if given.  Kernels up to :data:`FFT_RADIUS` sites
+    wide are applied directly to the whole block, wider ones through one
+    FFT for all of them; sites no nonzero value reaches are set to exactly
+    0 there too.  A sigma of 0 leaves the rows unsmoothed.
+    """
+    from scipy.fft import irfft, next_fast_len, rfft
+    from scipy.ndimage import gaussian_filter1d
+
+    rows = np.asarray(rows, dtype=np.float64)
+    n, gene_length = rows.shape
+    if out is None:
+        out = np.empty((n, len(sigmas), gene_length))
+    radii = [int(TRUNCATE * sigma + 0.5) for sigma in sigmas]
+    wide = [k for k, radius in enumerate(radii) if radius > FFT_RADIUS]
+    for k, sigma in enumerate(sigmas):
+        if sigma == 0:
+            out[:, k] = rows
+        elif radii[k] <= FFT_RADIUS:
+            gaussian_filter1d(rows, sigma, axis=-1, output=out[:, k])
+    if wide:
+        radius = max(radii[k] for k in wide)
+        n_fft = next_fast_len(gene_length + 2 * radius, real=True)
+        padded = np.pad(rows, ((0, 0), (radius, radius)), mode='symmetric')
+        spectra = rfft(padded, n_fft, axis=-1)[:, None, :] * _kernel_spectra([sigmas[k] for k in wide], n_fft)
+        smoothed = irfft(spectra, n_fft, axis=-1)[..., radius:radius + gene_length]
+        # beyond the reach of every nonzero site direct convolution gives exactly 0 but the FFT leaves
+        # rounding noise, which ratios of sparse densities would blow up
+        reached = np.concatenate([np.zeros((n, 1), dtype=np.int64), np.cumsum(padded != 0, axis=-1)], axis=-1)
+        sites = np.arange(radius, radius + gene_length)
+        for i, k in enumerate(wide):
+            smoothed[:, i][reached[:, sites + radii[k] + 1] == reached[:, sites - radii[k]]] = 0
+        if rows.min(initial=0) >= 0:
+            # rounding must not make densities negative (log2 ratios would be NaN)
+            np.maximum(smoothed, 0, out=smoothed)
+        out[:, wide] = smoothed
+    return out
+
+
+def compute_curves(polii, ser7p, sigmas, out=None, batch_size=64):
+    """Every curve in :data:`CURVES` for each run (row) and sigma.
+
+    *polii* and *ser7p* are (runs x gene_length) average densities.
+    Returns a dict of (runs x sigmas x gene_length) arrays; pass *out* (e.g.
+    the memory maps of :func:`write_curves`) to fill existing arrays.  Runs
+    are processed *batch_size* at a time through buffers reused between
+    batches.
+    """
+    polii = np.atleast_2d(np.asarray(polii, dtype=np.float64))
+    ser7p = np.atleast_2d(np.asarray(ser7p, dtype=np.float64))
+    n_runs, gene_length = polii.shape
+    shape = (n_runs, len(sigmas), gene_length)
+    if out is None:
+        out = {name: np.empty(shape) for name in CURVES}
+    smoothed = np.empty((2 * min(batch_size, n_runs), len(sigmas), gene_length))
+    total = np.empty(smoothed.shape[:2] + (1,))
+    for start in range(0, n_runs, batch_size):
+        stop = min(start + batch_size, n_runs)
+        size = stop - start
+        rows = np.concatenate([polii[start:stop], ser7p[start:stop]])
+        buffer = smooth_rows(rows, sigmas, out=smoothed[:2 * size])
+        np.sum(buffer, axis=-1, keepdims=True, out=total[:2 * size])
+        total[:2 * size] += EPSILON_DENSITY
+        buffer /= total[:2 * size]
+        normalised_polii, normalised_ser7p = buffer[:size], buffer[size:]
+        out['polii'][start:stop] = normalised_polii
+        out['ser7p'][start:stop] = normalised_ser7p
+        np.subtract(normalised_ser7p, normalised_polii, out=out['difference'][start:stop])
+        ratio = out['ratio'][start:stop]
+        np.add(normalised_polii, EPSILON, out=ratio)
+        np.divide(normalised_ser7p, ratio, out=ratio)
+        log2_ratio = out['log2_ratio'][start:stop]
+        np.add(ratio, EPSILON, out=log2_ratio)
+        np.log2(log2_ratio, out=log2_ratio)
+    return out
+
+
+def stack_densities(paths):
+    """Average densities of many ``*_density_arrays.npz`` files as (runs x gene_length).
+
+    A file whose densities are 2-D (one row per point, as written by
+    ``sweep_parameters.py`` or ``surrogate_screen.py``) gives one run per
+    row, labelled ``<path>[k]``.  Returns ``(labels, polii, ser7p)``.
+    """
+    labels, polii, ser7p = [], [], []
+    for path in paths:
+        with np.load(path) as data:
+            polii_avg, ser7p_avg = data['polii_density_avg'], data['ser7p_density_avg']
+        if polii_avg.ndim == 1:
+            labels.append(path)
+        else:
+            labels.extend(f'{path}[{k}]' for k in range(len(polii_avg)))
+        polii.append(np.atleast_2d(polii_avg))
+        ser7p.append(np.atleast_2d(ser7p_avg))
+    lengths = {rows.shape[1] for rows in polii}
+    if len(lengths) > 1:
+        raise ValueError(f'cannot stack gene lengths {sorted(lengths)}')
+    return labels, np.concatenate(polii), np.concatenate(ser7p)
+
+
+def write_curves(directory, labels, polii, ser7p, sigmas, batch_size=64):
+    """Compute the curves of every run and sigma straight into a columnar directory.
+
+    Returns the :class:`CurveBank` opened on the new directory.
+    """
+    polii = np.atleast_2d(polii)
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)  # an interrupted write must not look complete
+    shape = (len(polii), len(sigmas), polii.shape[1])
+    out = {name: np.lib.format.open_memmap(os.path.join(directory, f'{name}.npy'), mode='w+', shape=shape)
+           for name in CURVES}
+    compute_curves(polii, ser7p, sigmas, out, batch_size)
+    for array in out.values():
+        array.flush()
+    del out
+    with open(meta_path, 'w') as f:
+        json.dump({'labels': list(labels), 'sigmas': [float(sigma) for sigma in sigmas],
+                   'gene_length': shape[2], 'curves': list(CURVES)}, f)
+    return open_curves(directory)
+
+
+def open_curves(directory):
+    """Memory-map a directory written by :func:`write_curves`."""
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    curves = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in meta['curves']}
+    return CurveBank(meta['labels'], np.array(meta['sigmas']), np.arange(1, meta['gene_length'] + 1), curves)
+
+
+def select(bank, curve, labels=None, sigmas=None):
+    """Rows of *curve* for the given labels and sigmas (all of them when ``None``).
+
+    Returns an array of shape (labels x sigmas x gene_length).
+    """
+    runs = slice(None) if labels is None else [bank.labels.index(label) for label in labels]
+    widths = slice(None)
+    if sigmas is not None:
+        widths = []
+        for sigma in sigmas:
+            match = np.flatnonzero(np.isclose(bank.sigmas, sigma))
+            if len(match) == 0:
+                raise KeyError(f'sigma {sigma} not in {bank.sigmas.tolist()}')
+            widths.append(match[0])
+    return np.asarray(bank.curves[curve][runs][:, widths])
@@ -0,0 +1,167 @@
+"""Incremental extraction from a ``.bcs`` trace that ``bcs`` is still writing.
+
+:func:`follow_counts` tails the trace and adds each simulation block to the
+running ``RNApolIIcount_all`` / ``Ser7Pcount_all`` totals as soon as the
+``>`` header of the next simulation appears, so densities are available
+while a long run is going.  Every *refresh_interval* seconds the ``.npz`` /
+``.txt`` outputs of ``snapshot_cis.py`` are rewritten atomically, and the
+byte offset of the first unconsumed block is checkpointed next to the trace
+as ``<trace>.follow.npz`` together with the totals; a restart resumes from
+there.  The last simulation has no header after it, so it is only counted
+once the writer is known to be done (*finished*) or the file has stopped
+growing for *idle_timeout* seconds.
+"""
+import collections
+import hashlib
+import io
+import os
+import time
+
+import numpy as np
+
+from .aggregate import replace_atomic, save_densities
+from .compressed import is_compressed
+from .parser import DEFAULT_CHUNK_SIZE, count_blocks, occupancy_blocks
+from .telemetry import active
+
+CHECKPOINT_SUFFIX = '.follow.npz'
+HEAD_BYTES = 1 << 16  # leading bytes hashed to recognise the trace on restart
+
+FollowResult = collections.namedtuple('FollowResult', ['polii', 'ser7p', 'sims', 'offset'])
+
+
+def _head_digest(path, length):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read(length)).hexdigest()
+
+
+def _load_checkpoint(path, checkpoint_path, gene_length, monitor=None):
+    """Saved ``(polii, ser7p, sims, offset)``, or ``None`` if it does not apply.
+
+    A checkpoint is ignored when the gene length differs, when the trace no
+    longer starts with the bytes it was taken from (a new run was started at
+    the same path), or when *monitor* is given but its state was not saved.
+    The saved monitor state is restored into *monitor* only when the
+    checkpoint is used, so a rejected one leaves *monitor* untouched.
+    """
+    try:
+        with np.load(checkpoint_path) as data:
+            polii, ser7p = data['polii'], data['ser7p']
+            sims, offset = int(data['sims']), int(data['offset'])
+            head_length, head = int(data['head_length']), str(data['head'])
+            monitor_state = {name[len('monitor_'):]: data[name] for name in data.files if name.startswith('monitor_')}
+    except (OSError, KeyError, ValueError):
+        return None
+    if len(polii) != gene_length or os.path.getsize(path) < offset or _head_digest(path, head_length) != head:
+        return None
+    if monitor is not None:
+        try:
+            monitor.restore(monitor_state)
+        except (KeyError, ValueError):
+            return None
+    return FollowResult(polii, ser7p, sims, offset)
+
+
+def _save_checkpoint(path, checkpoint_path, state, monitor=None):
+    head_length = min(state.offset, HEAD_BYTES)
+    head = _head_digest(path, head_length)
+    monitor_state = {} if monitor is None else {'monitor_' + name: value for name, value in monitor.state().items()}
+    replace_atomic(checkpoint_path, lambda f: np.savez(f, polii=state.polii, ser7p=state.ser7p, sims=state.sims,
+                                                        offset=state.offset, head_length=head_length, head=head,
+                                                        **monitor_state))
+
+
+def _count_headers(data):
+    return data.count(b'\n>') + data.startswith(b'>')
+
+
+def _nth_header(data, n):
+    """Byte position of the header line that starts block *n* of *data* (0 = first)."""
+    pos = 0 if data.startswith(b'>') else data.find(b'\n>') + 1
+    for _ in range(n):
+        pos = data.find(b'\n>', pos) + 1
+    return pos
+
+
+def follow_counts(path, gene_length, npz_path=None, txt_path=None, sim_number=None, poll_interval=5.0,
+                  refresh_interval=60.0, idle_timeout=None, finished=None, monitor=None, checkpoint_path=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE, sleep=time.sleep):
+    """Follow the growing trace *path*, keeping running density totals.
+
+    Complete simulation blocks are counted as the next header appears.  The
+    outputs and the checkpoint (``<path>.follow.npz`` unless
+    *checkpoint_path* is given) are refreshed at most every
+    *refresh_interval* seconds and once more on return, including when
+    interrupted.  Following ends, with the last block counted, when the file
+    has not grown for *idle_timeout* seconds (``None`` waits forever) or the
+    callable *finished* returns true at the end of the file.  At most
+    *sim_number* simulations are counted.  With a
+    :class:`bcs_pol.convergence.ConvergenceMonitor` as *monitor*, each new
+    simulation is added to it and following stops once it has converged;
+    its state is kept in the checkpoint.  Returns a :class:`FollowResult`.
+    """
+    if is_compressed(path):
+        raise ValueError(f'{path} is compressed and cannot be followed while it is written')
+    checkpoint_path = checkpoint_path or path + CHECKPOINT_SUFFIX
+    state = _load_checkpoint(path, checkpoint_path, gene_length, monitor)
+    if state is None:
+        state = FollowResult(np.zeros(gene_length), np.zeros(gene_length), 0, 0)
+    polii, ser7p, sims, offset = state.polii.copy(), state.ser7p.copy(), state.sims, state.offset
+
+    def consume(data, final):
+        """Count the complete blocks at the start of *data*; returns the bytes used."""
+        nonlocal polii, ser7p, sims, offset
+        cut = len(data) if final else data.rfind(b'\n>') + 1
+        if sim_number is not None and sims + _count_headers(data[:cut]) > sim_number:
+            # stop at the header after simulation sim_number
+            cut = _nth_header(data, sim_number - sims)
+        if cut <= 0:
+            return 0
+        if monitor is None:
+            block_polii, block_ser7p = count_blocks(io.BytesIO(data[:cut]), gene_length, chunk_size=chunk_size)
+        else:
+            polii_rows, ser7p_rows = occupancy_blocks(io.BytesIO(data[:cut]), gene_length, chunk_size=chunk_size)
+            monitor.update(polii_rows, ser7p_rows)
+            block_polii, block_ser7p = polii_rows.sum(axis=0), ser7p_rows.sum(axis=0)
+        polii += block_polii
+        ser7p += block_ser7p
+        headers = _count_headers(data[:cut])
+        sims += headers
+        offset += cut
+        telemetry = active()
+        if telemetry is not None:
+            telemetry.add(cut, data.count(b'\n', 0, cut), headers)
+        return cut
+
+    def save():
+        state = FollowResult(polii, ser7p, sims, offset)
+        save_densities(npz_path, txt_path, polii, ser7p, sims)
+        _save_checkpoint(path, checkpoint_path, state, monitor)
+        return state
+
+    pending = b''
+    saved_offset = offset
+    last_growth = last_refresh = time.monotonic()
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while (sim_number is None or sims < sim_number) and (monitor is None or not monitor.converged()):
+                data = f.read(chunk_size)
+                now = time.monotonic()
+                if data:
+                    last_growth = now
+                    pending += data
+                    pending = pending[consume(pending, False):]
+                elif ((finished is not None and finished()) or
+                      (idle_timeout is not None and now - last_growth >= idle_timeout)):
+                    consume(pending + f.read(), True)
+                    break
+                if refresh_interval is not None and now - last_refresh >= refresh_interval and offset != saved_offset:
+                    save()
+                    saved_offset, last_refresh = offset, now
+                if not data:
+                    sleep(poll_interval)
+    finally:
+        state = save()
+    return state
+
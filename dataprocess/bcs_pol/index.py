@@ -0,0 +1,85 @@
+"""Persistent byte-offset index of the simulations inside a ``.bcs`` trace.
+
+The index is stored next to the trace as ``<trace>.idx.npz``.  Row 0
+describes anything before the first ``>`` header and row k the k-th
+simulation, with its byte offset, byte length, line count (header included)
+and the time of its last event.  The file size and modification time of the
+trace are stored alongside, and a stale index is rebuilt automatically.
+"""
+import collections
+import os
+
+import numpy as np
+
+from .compressed import open_trace
+from .parser import DEFAULT_CHUNK_SIZE, iter_blocks, last_event_time
+
+INDEX_SUFFIX = '.idx.npz'
+
+TraceIndex = collections.namedtuple('TraceIndex', ['offset', 'length', 'lines', 'final_time'])
+
+
+def build_index(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Scan *path* once and return its :class:`TraceIndex`."""
+    offset, lines, final_time = [0], [0], [np.nan]
+    pos = 0
+    with open_trace(path) as f:
+        for block, segment in iter_blocks(f, chunk_size):
+            if block == len(offset):
+                offset.append(pos)
+                lines.append(0)
+                final_time.append(np.nan)
+            n = len(segment)
+            if n:
+                newlines = np.count_nonzero(np.frombuffer(segment, dtype=np.uint8) == ord('\n'))
+                lines[block] += newlines + (segment[n - 1] != ord('\n'))
+                time = last_event_time(segment)
+                if not np.isnan(time):
+                    final_time[block] = time
+            pos += n
+    offset = np.array(offset, dtype=np.int64)
+    length = np.diff(np.append(offset, pos))
+    return TraceIndex(offset, length, np.array(lines, dtype=np.int64), np.array(final_time))
+
+
+def load_index(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Return the index of *path*, building or refreshing the sidecar if needed."""
+    stat = os.stat(path)
+    sidecar = path + INDEX_SUFFIX
+    try:
+        with np.load(sidecar) as data:
+            if int(data['file_size']) == stat.st_size and int(data['mtime_ns']) == stat.st_mtime_ns:
+                return TraceIndex(*(data[name] for name in TraceIndex._fields))
+    except (OSError, KeyError, ValueError):
+        pass
+
+    index = build_index(path, chunk_size)
+    tmp = f'{sidecar}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'wb') as out:
+            np.savez(out, file_size=stat.st_size, mtime_ns=stat.st_mtime_ns, **index._asdict())
+        os.replace(tmp, sidecar)
+    except OSError:
+        # read-only trace directory: use the index without persisting it
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return index
+
+
+def sim_ranges(index, sims, merge=True):
+    """Byte ranges covering the simulations numbered in *sims* (1-based).
+
+    With *merge*, adjacent simulations are combined into one range so they
+    are read in a single sequential pass.
+    """
+    sims = np.unique(np.asarray(list(sims), dtype=np.int64))
+    if len(sims) and (sims[0] < 1 or sims[-1] >= len(index.offset)):
+        raise IndexError(f'simulations must be numbered 1..{len(index.offset) - 1}')
+    ranges = []
+    for k in sims:
+        start, stop = int(index.offset[k]), int(index.offset[k] + index.length[k])
+        if merge and ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], stop)
+        else:
+            ranges.append((start, stop))
+    return ranges
@@ -0,0 +1,156 @@
+"""Position x time kymograph of Pol II and Ser7P occupancy.
+
+Occupancy is accumulated as time-weighted averages on a binned grid, so
+memory depends only on the number of bins, not on the number of events or
+simulations.  Only the moments where a site becomes occupied (+1) or free
+(-1) are recorded: the occupied time of a site up to a bin edge e is the sum
+of ``sign * (e - t)`` over its transitions before e, so each transition is
+folded into a per-bin count and time sum and the integral over any bin is
+recovered from their cumulative sums.  State persists after a simulation's
+last event, as in :mod:`bcs_pol.timecourse`.
+"""
+import numpy as np
+
+from .compressed import open_trace
+from .index import load_index
+from .parser import DEFAULT_CHUNK_SIZE, iter_blocks, parse_polii_rows
+
+SPECIES = ('polii', 'ser7p')
+
+
+class Kymograph:
+    """Incrementally updated binned occupancy over position and time.
+
+    *time_bin* is the width of a time bin in seconds and *position_bin* the
+    number of sites per position bin.  Transitions after *t_max* are
+    ignored.
+    """
+
+    def __init__(self, gene_length, t_max, time_bin, position_bin=1):
+        self.gene_length = gene_length
+        self.position_bin = position_bin
+        self.time_edges = np.arange(0, t_max + time_bin, time_bin, dtype=np.float64)
+        self.position_edges = np.arange(0, gene_length + position_bin, position_bin)
+        self.n_sims = 0
+        shape = (len(SPECIES), len(self.position_edges) - 1, len(self.time_edges) + 1)
+        self.count = np.zeros(shape)
+        self.moment = np.zeros(shape)
+
+    def add_transitions(self, species, sites, times, signs):
+        """Record occupancy changes of *sites* at *times* (sign +1 or -1)."""
+        n_edges = len(self.time_edges) + 1
+        keys = (sites // self.position_bin) * n_edges + np.searchsorted(self.time_edges, times, side='right')
+        size = self.count[species].size
+        self.count[species] += np.bincount(keys, signs, size).reshape(self.count[species].shape)
+        self.moment[species] += np.bincount(keys, signs * times, size).reshape(self.count[species].shape)
+
+    def merge(self, other):
+        """Add the totals of another kymograph on the same grid."""
+        self.count += other.count
+        self.moment += other.moment
+        self.n_sims += other.n_sims
+
+    def occupied_time(self):
+        """Occupied site-seconds per (species, time bin, position bin)."""
+        count = np.cumsum(self.count, axis=2)[:, :, :-1]
+        moment = np.cumsum(self.moment, axis=2)[:, :, :-1]
+        integral = count * self.time_edges - moment
+        return np.diff(integral, axis=2).transpose(0, 2, 1)
+
+    def occupancy_avg(self):
+        """Mean occupied sites per simulation, (species, time bin, position bin)."""
+        return self.occupied_time() / np.diff(self.time_edges)[:, None] / max(self.n_sims, 1)
+
+    def save(self, filename):
+        """Write the kymograph and its raw accumulators as a compressed ``.npz``."""
+        avg = self.occupancy_avg()
+        np.savez_compressed(filename,
+                            time_edges=self.time_edges,
+                            position_edges=self.position_edges,
+                            polii_occupancy_avg=avg[0],
+                            ser7p_occupancy_avg=avg[1],
+                            n_sims=self.n_sims,
+                            count=self.count,
+                            moment=self.moment)
+
+    @classmethod
+    def load(cls, filename):
+        """Reopen a saved kymograph so more simulations can be added to it."""
+        with np.load(filename) as data:
+            time_edges = data['time_edges']
+            position_edges = data['position_edges']
+            kymograph = cls(int(position_edges[-1]), time_edges[-1], time_edges[1] - time_edges[0],
+                            int(position_edges[1]))
+            kymograph.time_edges = time_edges
+            kymograph.position_edges = position_edges
+            kymograph.n_sims = int(data['n_sims'])
+            kymograph.count = data['count']
+            kymograph.moment = data['moment']
+        return kymograph
+
+
+def occupancy_transitions(state, i, time):
+    """Replay ``Pol_ii`` moves onto *state* and return its transitions.
+
+    Returns ``(sites, times, signs)`` for every site whose occupancy changes,
+    with sign +1 when it becomes occupied and -1 when it is cleared.
+    *state* is updated in place to the occupancy after the last move.
+    """
+    empty = np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    if len(i) == 0:
+        return empty
+    gene_length = len(state)
+    if i.min() < 0 or i.max() >= gene_length:
+        raise ValueError(f'Pol_ii position outside 0..{gene_length - 1}')
+    sites = np.empty(2 * len(i), dtype=np.int64)
+    sites[0::2] = i - 1
+    sites[1::2] = i
+    valid = sites >= 0
+    # stable sort keeps each site's writes in event order
+    order = np.flatnonzero(valid)[np.argsort(sites[valid], kind='stable')]
+    sites = sites[order]
+    values = (order % 2).astype(np.float64)  # odd positions are the occupying writes
+    times = np.repeat(time, 2)[order]
+
+    first = np.ones(len(sites), dtype=bool)
+    first[1:] = sites[1:] != sites[:-1]
+    previous = np.empty_like(values)
+    previous[1:] = values[:-1]
+    previous[first] = state[sites[first]]
+    last = np.append(first[1:], True)
+    state[sites[last]] = values[last]
+
+    change = values != previous
+    return sites[change], times[change], np.where(values[change] == 1, 1.0, -1.0)
+
+
+def extract_kymograph(path, gene_length, time_bin, t_max=None, position_bin=1, sim_number=None,
+                      kymograph=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Accumulate the kymograph of *path* in one streaming pass.
+
+    *t_max* defaults to the last event time recorded in the trace index.
+    Pass an existing *kymograph* to add this trace's simulations to it.
+    Block and *sim_number* handling follow
+    :func:`bcs_pol.parser.extract_counts`.
+    """
+    if kymograph is None:
+        if t_max is None:
+            t_max = np.nanmax(load_index(path, chunk_size).final_time)
+        kymograph = Kymograph(gene_length, t_max, time_bin, position_bin)
+    state = np.zeros((len(SPECIES), gene_length))
+    current = 0
+    with open_trace(path) as f:
+        for block, segment in iter_blocks(f, chunk_size):
+            if block != current:
+                kymograph.n_sims += current > 0
+                state[:] = 0
+                current = block
+            if sim_number is not None and block > sim_number:
+                break
+            time, i, p = parse_polii_rows(segment)
+            kymograph.add_transitions(0, *occupancy_transitions(state[0], i, time))
+            ser7p = p == 1
+            kymograph.add_transitions(1, *occupancy_transitions(state[1], i[ser7p], time[ser7p]))
+        else:
+            kymograph.n_sims += current > 0
+    return kymograph
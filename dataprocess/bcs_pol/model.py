@@ -0,0 +1,51 @@
+"""Reading and rewriting the parameter header of the Beacon Calculus model files.
+
+``cis.bc`` and ``trans.bc`` start with a block of ``name = value;`` lines
+(``gene_length``, ``uv_distance``, ``repair_half_life`` ...).  Process
+definitions never match that form, and commented-out parameters are skipped.
+"""
+import numbers
+import re
+
+_PARAMETER = re.compile(r'^([ \t]*)([A-Za-z_]\w*)([ \t]*=[ \t]*)([-+]?[0-9.]+(?:[eE][-+]?\d+)?)([ \t]*;)', re.M)
+
+
+def _number(text):
+    value = float(text)
+    return int(value) if value.is_integer() and not re.search(r'[.eE]', text) else value
+
+
+def read_parameters(text):
+    """Return the header parameters of a model given as source *text*."""
+    return {m.group(2): _number(m.group(4)) for m in _PARAMETER.finditer(text)}
+
+
+def write_parameters(text, params):
+    """Return *text* with the header values of *params* substituted.
+
+    Only the value is replaced, so comments and layout are kept.  A name
+    that is not in the header raises ``KeyError``.
+    """
+    unknown = set(params) - set(read_parameters(text))
+    if unknown:
+        raise KeyError(f'not model parameters: {sorted(unknown)}')
+
+    def substitute(m):
+        if m.group(2) not in params:
+            return m.group(0)
+        value = params[m.group(2)]
+        value = int(value) if isinstance(value, numbers.Integral) else float(value)
+        return f'{m.group(1)}{m.group(2)}{m.group(3)}{value!r}{m.group(5)}'
+    return _PARAMETER.sub(substitute, text)
+
+
+def model_variant(text):
+    """``'trans'`` if the model signals through the ``phos`` beacon, else ``'cis'``."""
+    return 'trans' if re.search(r'\bphos\b', text) else 'cis'
+
+
+def load_model(path):
+    """Return ``(text, parameters, variant)`` of the model file *path*."""
+    with open(path) as f:
+        text = f.read()
+    return text, read_parameters(text), model_variant(text)
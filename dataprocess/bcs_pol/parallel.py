@@ -0,0 +1,142 @@
+"""Process-pool density extraction sharded by simulation block.
+
+Every simulation in a ``.bcs`` trace starts at a ``>`` header and the
+occupancy state is reset there, so the file splits cleanly into independent
+byte ranges at header offsets.  Each worker process counts its own ranges
+with :func:`bcs_pol.parser.count_blocks` and the parent adds the partial
+count arrays together.  Compressed traces cannot seek and are read
+sequentially in this process.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .compressed import is_compressed, open_trace
+from .index import load_index, sim_ranges
+from .parser import DEFAULT_CHUNK_SIZE, count_blocks, extract_counts, occupancy_blocks
+from .telemetry import active
+
+SHARDS_PER_WORKER = 4  # more shards than workers evens out uneven simulations
+
+
+def shard_ranges(index, n_shards, sim_number=None):
+    """Split a trace into at most *n_shards* ``(start, stop)`` byte ranges.
+
+    Ranges begin and end on the header offsets recorded in *index* and hold
+    roughly equal numbers of bytes.  With *sim_number* set, the last range
+    stops at the header that follows that simulation, like the serial
+    extraction.
+    """
+    bounds = np.append(index.offset, index.offset[-1] + index.length[-1])
+    if sim_number is not None:
+        bounds = bounds[:sim_number + 2]
+    targets = bounds[0] + (bounds[-1] - bounds[0]) * np.arange(1, n_shards) / n_shards
+    cuts = np.unique(np.concatenate(([0], np.searchsorted(bounds, targets), [len(bounds) - 1])))
+    return [(int(bounds[a]), int(bounds[b])) for a, b in zip(cuts[:-1], cuts[1:]) if bounds[b] > bounds[a]]
+
+
+def _count_range(path, start, stop, gene_length, chunk_size):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return count_blocks(f, gene_length, length=stop - start, chunk_size=chunk_size, count_sims=True)
+
+
+def _occupancy_range(path, start, stop, gene_length, chunk_size):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return occupancy_blocks(f, gene_length, length=stop - start, chunk_size=chunk_size)
+
+
+def _map_ranges(worker, path, ranges, gene_length, n_workers, chunk_size):
+    """Yield ``worker(path, start, stop, ...)`` for each range, in range order."""
+    telemetry = active()
+    total = sum(stop - start for start, stop in ranges)
+    done = 0
+    if n_workers == 1:
+        for start, stop in ranges:
+            yield worker(path, start, stop, gene_length, chunk_size)
+            if telemetry is not None:
+                done += stop - start
+                telemetry.add(stop - start, position=done, size=total)
+        return
+
+    # fork keeps the snapshot scripts, which have no __main__ guard, from re-running in workers
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    with ProcessPoolExecutor(n_workers, mp_context=context) as pool:
+        futures = [pool.submit(worker, path, start, stop, gene_length, chunk_size) for start, stop in ranges]
+        for (start, stop), future in zip(ranges, futures):
+            yield future.result()
+            if telemetry is not None:
+                done += stop - start
+                telemetry.add(stop - start, position=done, size=total)
+
+
+def count_ranges(path, ranges, gene_length, n_workers=1, chunk_size=DEFAULT_CHUNK_SIZE, count_sims=False):
+    """Sum the occupancy of the simulations in the byte *ranges* of *path*.
+
+    Every range must start on a header line.  Ranges are counted in a pool
+    of *n_workers* processes, or in this process when *n_workers* is 1.
+    With *count_sims*, the number of simulations read is returned as well.
+    """
+    polii_all = np.zeros(gene_length)
+    ser7p_all = np.zeros(gene_length)
+    sims_all = 0
+    for polii, ser7p, sims in _map_ranges(_count_range, path, ranges, gene_length, n_workers, chunk_size):
+        polii_all += polii
+        ser7p_all += ser7p
+        sims_all += sims
+    return (polii_all, ser7p_all, sims_all) if count_sims else (polii_all, ser7p_all)
+
+
+def extract_counts_parallel(path, gene_length, sim_number=None, n_workers=None,
+                            chunk_size=DEFAULT_CHUNK_SIZE, count_sims=False):
+    """Parallel version of :func:`bcs_pol.parser.extract_counts`.
+
+    *n_workers* defaults to the number of CPUs.  The returned totals, and
+    with *count_sims* the number of simulations read, are identical to the
+    serial extraction.
+    """
+    n_workers = n_workers or os.cpu_count()
+    if n_workers == 1 or is_compressed(path):
+        return extract_counts(path, gene_length, sim_number, chunk_size, count_sims)
+    ranges = shard_ranges(load_index(path, chunk_size), n_workers * SHARDS_PER_WORKER, sim_number)
+    return count_ranges(path, ranges, gene_length, n_workers, chunk_size, count_sims)
+
+
+def extract_sims(path, gene_length, sims, n_workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Sum the occupancy of the simulations numbered in *sims* (1-based).
+
+    The ``.idx.npz`` sidecar is used to seek straight to each simulation, so
+    a preview of the first few simulations or the remainder of a partial
+    run is read without scanning the rest of the file.
+    """
+    if is_compressed(path):
+        # no seeking in a compressed stream: read up to the last simulation wanted
+        sims = np.unique(np.asarray(list(sims), dtype=np.int64))
+        polii, ser7p = extract_occupancy(path, gene_length, int(sims.max(initial=0)), chunk_size=chunk_size)
+        if len(sims) and (sims[0] < 1 or sims[-1] > len(polii)):
+            raise IndexError(f'simulations must be numbered 1..{len(polii)}')
+        return polii[sims - 1].sum(axis=0, dtype=np.float64), ser7p[sims - 1].sum(axis=0, dtype=np.float64)
+    # one range per simulation keeps all workers busy; a single reader merges neighbours
+    ranges = sim_ranges(load_index(path, chunk_size), sims, merge=n_workers == 1)
+    return count_ranges(path, ranges, gene_length, n_workers, chunk_size)
+
+
+def extract_occupancy(path, gene_length, sim_number=None, n_workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Per-simulation final occupancy, two uint8 (sims x gene_length) arrays.
+
+    Rows are simulations 1..*sim_number* in file order; see
+    :func:`bcs_pol.parser.occupancy_blocks`.
+    """
+    if n_workers == 1 or is_compressed(path):
+        with open_trace(path) as f:
+            return occupancy_blocks(f, gene_length, sim_number, chunk_size=chunk_size)
+    ranges = shard_ranges(load_index(path, chunk_size), n_workers * SHARDS_PER_WORKER, sim_number)
+    parts = list(_map_ranges(_occupancy_range, path, ranges, gene_length, n_workers, chunk_size))
+    if not parts:
+        empty = np.zeros((0, gene_length), dtype=np.uint8)
+        return empty, empty.copy()
+    return (np.concatenate([polii for polii, _ in parts]),
+            np.concatenate([ser7p for _, ser7p in parts]))
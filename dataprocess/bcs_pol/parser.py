@@ -0,0 +1,386 @@
+"""Chunked, vectorised reader for ``bcs`` simulation traces.
+
+A trace is a sequence of simulation blocks, each introduced by a line that
+starts with ``>``.  Event lines are tab separated::
+
+    time    action    process    i    <i>    p    <p>    [d    <d>]
+
+Only the ``Pol_ii`` rows are needed for the density extraction.  The file is
+read in large byte chunks, line and field boundaries are found with array
+searches over the raw bytes, and the ``Pol_ii`` rows are converted to NumPy
+arrays in bulk.  The occupancy updates of ``snapshot_cis.py`` are then
+replayed per simulation block as array operations.
+"""
+import re
+
+import numpy as np
+
+from .compressed import open_trace
+
+DEFAULT_CHUNK_SIZE = 1 << 25  # bytes read from disk at a time (32 MiB)
+EXTRACTOR_VERSION = 1  # bump when a change alters extracted densities (keys the sweep cache)
+
+_HEADER = re.compile(rb'^>', re.M)
+
+_NEWLINE, _TAB = ord('\n'), ord('\t')
+_POLII = np.frombuffer(b'Pol_ii', dtype=np.uint8)
+
+PARAMETERS = ('i', 'p', 'd')  # integer process parameters kept by parse_event_rows
+
+# (action, process) of every action in cis.bc / trans.bc, in the order of the action codes used by
+# bcs_pol.rates and the event log of bcs_pol.simulate; release is an action of two processes
+ACTIONS = (
+    ('Pol_ii', 'RNAPolII_postPause'),
+    ('elongation2', 'RNAPolII_postPause'),
+    ('release', 'RNAPolII_postPause'),
+    ('release1', 'RNAPolII_postPause'),
+    ('release2', 'RNAPolII_postPause'),
+    ('unbind', 'RNAPolII_postPause'),
+    ('reuse', 'RNAPolII_pool'),
+    ('elongation1', 'RNAPolII_prePause'),
+    ('terminate', 'RNAPolII_prePause'),
+    ('release', 'RNAPolII_prePause'),
+    ('dwell', 'RNAPolII_prePause'),
+    ('damageDNA', 'MakeDamage'),
+    ('pass', 'MakeDamage'),
+    ('repairedPos', 'RepairDamage'),
+)
+
+
+def iter_blocks(f, chunk_size=DEFAULT_CHUNK_SIZE, length=None):
+    """Yield ``(block, segment)`` pieces of the binary file object *f*.
+
+    Block 0 holds anything before the first ``>`` line and block k is the
+    k-th simulation.  Chunks are always cut at a newline, so a block that
+    straddles a chunk boundary is yielded as several consecutive segments
+    carrying the same block number.  Segments are memoryviews into the
+    current chunk and are only valid until the next iteration.  If *length*
+    is given, at most that many bytes are read from the current position.
+    """
+    block = 0
+    tail = b''
+    remaining = length
+    while True:
+        if remaining is None:
+            data = f.read(chunk_size)
+        else:
+            data = f.read(min(chunk_size, remaining))
+            remaining -= len(data)
+        if data:
+            buf = tail + data
+            cut = buf.rfind(b'\n') + 1
+            if cut == 0:
+                tail = buf
+                continue
+            buf, tail = buf[:cut], buf[cut:]
+        else:
+            buf, tail = tail, b''
+        view = memoryview(buf)
+        start = 0
+        for m in _HEADER.finditer(buf):
+            if m.start() > start:
+                yield block, view[start:m.start()]
+            block += 1
+            start = m.start()
+        yield block, view[start:]
+        if not data:
+            break
+
+
+def last_event_time(segment):
+    """Time of the last event line in *segment*, or NaN if there is none."""
+    data = bytes(segment)
+    end = len(data)
+    while end > 0:
+        start = data.rfind(b'\n', 0, end) + 1
+        field = data[start:end].split(b'\t', 1)[0]
+        if field.replace(b'.', b'').replace(b'-', b'').isdigit():
+            return float(field)
+        end = start - 1
+    return np.nan
+
+
+def _gather_fields(a, lo, hi):
+    """Copy the byte ranges ``a[lo:hi]`` into a NUL padded ``S`` array."""
+    width = max(int((hi - lo).max(initial=0)), 1)
+    idx = lo[:, None] + np.arange(width)
+    field = np.take(a, idx, mode='clip')
+    field[idx >= hi[:, None]] = 0
+    return field.view(f'S{width}').ravel()
+
+
+def _parse_ints(a, lo, hi):
+    """Parse the decimal integers ``a[lo:hi]`` digit by digit."""
+    negative = a[lo] == ord('-')
+    lo = lo + negative
+    width = hi - lo
+    if (width <= 0).any():
+        raise ValueError('empty parameter field')
+    value = np.zeros(len(lo), dtype=np.int64)
+    for k in range(int(width.max(initial=0))):
+        live = k < width
+        digit = a[np.where(live, lo + k, 0)].astype(np.int64) - ord('0')
+        if ((digit < 0) | (digit > 9))[live].any():
+            raise ValueError('non-integer parameter field')
+        value = np.where(live, value * 10 + digit, value)
+    return np.where(negative, -value, value)
+
+
+def _split_lines(a):
+    """Locate lines and tabs in the byte array *a*.
+
+    Returns the start and end of every line, the sorted tab positions and,
+    per line, the index into the tab positions of its first tab.
+    """
+    ends = np.flatnonzero(a == _NEWLINE)
+    if len(a) and a[-1] != _NEWLINE:
+        ends = np.append(ends, len(a))
+    starts = np.zeros_like(ends)
+    starts[1:] = ends[:-1] + 1
+    tabs = np.flatnonzero(a == _TAB)
+    return starts, ends, tabs, np.searchsorted(tabs, starts)
+
+
+def _field(a, tabs, first, ends, k):
+    """Return ``(lo, hi, present)`` for field *k* (k >= 1) of each line.
+
+    A field runs from just after its preceding tab to the next tab or the
+    end of the line, without a trailing carriage return.
+    """
+    before = np.minimum(first + k - 1, len(tabs) - 1)
+    present = (first + k - 1 < len(tabs)) & (tabs[before] < ends)
+    lo = tabs[before] + 1
+    after = np.minimum(first + k, len(tabs) - 1)
+    hi = np.where((first + k < len(tabs)) & (tabs[after] < ends), tabs[after], ends)
+    hi -= (hi > lo) & (a[np.maximum(hi - 1, 0)] == ord('\r'))
+    return lo, hi, present
+
+
+def _time_field(a, starts, stop):
+    """Gather the time fields ``a[starts:stop]`` and flag the valid ones.
+
+    A valid time is made of digits, '.' and '-' with at least one digit, as
+    in the ``isdigit`` check of the original per-line loop.
+    """
+    time = _gather_fields(a, starts, stop)
+    raw = time.view(np.uint8).reshape(len(time), time.itemsize)
+    digit = (raw >= ord('0')) & (raw <= ord('9'))
+    valid = (digit | (raw == ord('.')) | (raw == ord('-')) | (raw == 0)).all(axis=1) & digit.any(axis=1)
+    return time, valid
+
+
+def parse_polii_rows(segment, times=True):
+    """Return ``(time, i, p)`` arrays for the ``Pol_ii`` rows in *segment*.
+
+    Rows are accepted by the same rule as the original per-line loop: at
+    least seven tab separated fields, a time field made of digits, '.' and
+    '-', and the action ``Pol_ii``.  Line and field boundaries are located
+    with array searches over the raw bytes, so no Python object is created
+    per line.  With ``times=False`` the time column is validated but not
+    converted, and ``None`` is returned in its place.
+    """
+    empty = (np.empty(0) if times else None), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    a = np.frombuffer(segment, dtype=np.uint8)
+    starts, ends, tabs, first = _split_lines(a)
+    if len(tabs) == 0:
+        return empty
+
+    # rows need six tabs before their end
+    keep = first + 5 < len(tabs)
+    first, starts, ends = first[keep], starts[keep], ends[keep]
+    keep = tabs[first + 5] < ends
+    first, starts, ends = first[keep], starts[keep], ends[keep]
+
+    # action field must be exactly 'Pol_ii'
+    action = tabs[first]
+    keep = tabs[first + 1] - action == len(_POLII) + 1
+    first, starts, ends, action = first[keep], starts[keep], ends[keep], action[keep]
+    keep = (a[action[:, None] + np.arange(1, len(_POLII) + 1)] == _POLII).all(axis=1)
+    first, starts, ends, action = first[keep], starts[keep], ends[keep], action[keep]
+
+    p_lo, p_hi, _ = _field(a, tabs, first, ends, 6)
+    keep = p_hi > p_lo
+    first, starts, action, p_lo, p_hi = first[keep], starts[keep], action[keep], p_lo[keep], p_hi[keep]
+    if len(first) == 0:
+        return empty
+
+    time, keep = _time_field(a, starts, action)
+    first, time, p_lo, p_hi = first[keep], time[keep], p_lo[keep], p_hi[keep]
+
+    i = _parse_ints(a, tabs[first + 3] + 1, tabs[first + 4])
+    p = _parse_ints(a, p_lo, p_hi)
+    return (time.astype(np.float64) if times else None), i, p
+
+
+def parse_event_rows(segment):
+    """Parse every event line of *segment* into columns.
+
+    Returns a dict with ``time`` (float64), ``action`` and ``process`` (bytes
+    arrays) and the integer parameters ``i``, ``p`` and ``d``, which are -1
+    where the process does not carry them.  Event lines are those with a
+    valid time field and at least the action and process fields; parameters
+    are read from the name/value pairs that follow the process field.
+    """
+    a = np.frombuffer(segment, dtype=np.uint8)
+    starts, ends, tabs, first = _split_lines(a)
+    if len(tabs) == 0:
+        starts = ends = first = np.empty(0, dtype=np.int64)
+        tabs = np.zeros(1, dtype=np.int64)
+    keep = (first + 1 < len(tabs)) & (tabs[np.minimum(first + 1, len(tabs) - 1)] < ends)
+    first, starts, ends = first[keep], starts[keep], ends[keep]
+    time, keep = _time_field(a, starts, tabs[first])
+    first, ends, time = first[keep], ends[keep], time[keep]
+
+    columns = {
+        'time': time.astype(np.float64),
+        'action': _gather_fields(a, tabs[first] + 1, tabs[first + 1]),
+        'process': _gather_fields(a, *_field(a, tabs, first, ends, 2)[:2]),
+    }
+    for name in PARAMETERS:
+        columns[name] = np.full(len(first), -1, dtype=np.int64)
+    for k in range(3, 3 + 2 * len(PARAMETERS), 2):
+        name_lo, name_hi, _ = _field(a, tabs, first, ends, k)
+        value_lo, value_hi, present = _field(a, tabs, first, ends, k + 1)
+        present &= (name_hi - name_lo == 1) & (value_hi > value_lo)
+        for name in PARAMETERS:
+            sel = present & (a[name_lo] == ord(name))
+            columns[name][sel] = _parse_ints(a, value_lo[sel], value_hi[sel])
+    return columns
+
+
+def apply_moves(state, i):
+    """Replay ``Pol_ii`` moves to positions *i* onto the 0/1 row *state*.
+
+    Each move clears site ``i-1`` and occupies site ``i``, in event order.
+    Only the last write to a site survives, so the final row is found by
+    looking up the most recent write per site instead of looping.
+    """
+    if len(i) == 0:
+        return
+    gene_length = len(state)
+    if i.min() < 0 or i.max() >= gene_length:
+        raise ValueError(f'Pol_ii position outside 0..{gene_length - 1}')
+    sites = np.empty(2 * len(i), dtype=np.int64)
+    sites[0::2] = i - 1
+    sites[1::2] = i
+    values = np.zeros(len(sites))
+    values[1::2] = 1
+    last = np.full(gene_length + 1, -1, dtype=np.int64)
+    # shift by one so the clear of site -1 (a move to i=0) lands in a dummy slot
+    np.maximum.at(last, sites + 1, np.arange(len(sites)))
+    last = last[1:]
+    touched = last >= 0
+    state[touched] = values[last[touched]]
+
+
+def final_occupancy(block, i, n_blocks, gene_length):
+    """Final 0/1 occupancy of many blocks at once, shape (n_blocks, gene_length).
+
+    *block* gives the block of each ``Pol_ii`` move in *i*; moves must be in
+    trace order.  This is :func:`apply_moves` for every block in one pass,
+    with the block number folded into the site key.
+    """
+    occupancy = np.zeros((n_blocks, gene_length))
+    if len(i) == 0:
+        return occupancy
+    if i.min() < 0 or i.max() >= gene_length:
+        raise ValueError(f'Pol_ii position outside 0..{gene_length - 1}')
+    sites = np.empty(2 * len(i), dtype=np.int64)
+    sites[0::2] = i - 1
+    sites[1::2] = i
+    order = np.flatnonzero(sites >= 0)
+    keys = np.repeat(np.asarray(block, dtype=np.int64), 2)[order] * gene_length + sites[order]
+    last = np.full(n_blocks * gene_length, -1, dtype=np.int64)
+    np.maximum.at(last, keys, order)
+    # odd positions in the interleaved sequence are the occupying writes
+    occupancy.ravel()[:] = (last >= 0) & (last % 2 == 1)
+    return occupancy
+
+
+def count_blocks(f, gene_length, sim_number=None, length=None, chunk_size=DEFAULT_CHUNK_SIZE, count_sims=False):
+    """Sum the final Pol II and Ser7P occupancy of the blocks read from *f*.
+
+    Reading starts at the current position of the binary file object *f*
+    and covers *length* bytes (``None`` for the rest of the file).  Reading
+    stops at the header that follows simulation *sim_number*, counted from
+    that position.  With *count_sims*, the number of simulations read is
+    returned as a third value.
+    """
+    polii_all = np.zeros(gene_length)
+    ser7p_all = np.zeros(gene_length)
+    polii_sim = np.zeros(gene_length)
+    ser7p_sim = np.zeros(gene_length)
+    current = 0
+    for block, segment in iter_blocks(f, chunk_size, length):
+        if block != current:
+            polii_all += polii_sim
+            ser7p_all += ser7p_sim
+            polii_sim[:] = 0
+            ser7p_sim[:] = 0
+            current = block
+        if sim_number is not None and block > sim_number:
+            break
+        _, i, p = parse_polii_rows(segment, times=False)
+        apply_moves(polii_sim, i)
+        apply_moves(ser7p_sim, i[p == 1])
+    polii_all += polii_sim
+    ser7p_all += ser7p_sim
+    if count_sims:
+        return polii_all, ser7p_all, current if sim_number is None else min(current, sim_number)
+    return polii_all, ser7p_all
+
+
+def iter_occupancy(f, gene_length, sim_number=None, length=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the final ``(polii, ser7p)`` uint8 occupancy rows of each simulation read from *f*.
+
+    Same reading rules as :func:`count_blocks`.  Rows before the first
+    header (block 0, which ``bcs`` does not write) have no simulation and
+    are left out.  Each simulation is yielded as soon as it has been read,
+    so the caller can stop early.
+    """
+    polii_sim = np.zeros(gene_length)
+    ser7p_sim = np.zeros(gene_length)
+    current = 0
+    for block, segment in iter_blocks(f, chunk_size, length):
+        if block != current:
+            if current > 0:
+                yield polii_sim.astype(np.uint8), ser7p_sim.astype(np.uint8)
+            polii_sim[:] = 0
+            ser7p_sim[:] = 0
+            current = block
+        if sim_number is not None and block > sim_number:
+            return
+        _, i, p = parse_polii_rows(segment, times=False)
+        apply_moves(polii_sim, i)
+        apply_moves(ser7p_sim, i[p == 1])
+    if current > 0:
+        yield polii_sim.astype(np.uint8), ser7p_sim.astype(np.uint8)
+
+
+def occupancy_blocks(f, gene_length, sim_number=None, length=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Final Pol II and Ser7P occupancy of each simulation read from *f*.
+
+    Same reading rules as :func:`count_blocks`, but returns one uint8 row
+    per simulation instead of the sums (see :func:`iter_occupancy`).
+    """
+    polii_rows = []
+    ser7p_rows = []
+    for polii, ser7p in iter_occupancy(f, gene_length, sim_number, length, chunk_size):
+        polii_rows.append(polii)
+        ser7p_rows.append(ser7p)
+    shape = (len(polii_rows), gene_length)
+    return (np.array(polii_rows, dtype=np.uint8).reshape(shape),
+            np.array(ser7p_rows, dtype=np.uint8).reshape(shape))
+
+
+def extract_counts(path, gene_length, sim_number=None, chunk_size=DEFAULT_CHUNK_SIZE, count_sims=False):
+    """Sum the final Pol II and Ser7P occupancy of every simulation in *path*.
+
+    Gives the same ``RNApolIIcount_all`` / ``Ser7Pcount_all`` as the per-line
+    loop in ``snapshot_cis.py``: rows before the first header count as a
+    block, and reading stops at the header that follows simulation
+    *sim_number* (``None`` reads to the end of the file).  With
+    *count_sims*, the number of simulations read is returned as well.
+    """
+    with open_trace(path) as f:
+        return count_blocks(f, gene_length, sim_number, chunk_size=chunk_size, count_sims=count_sims)
@@ -0,0 +1,190 @@
+"""Permutation tests of cis against trans on per-simulation occupancy.
+
+The simulations of both models are pooled and split at random into groups
+of the original sizes; a model difference is significant where the observed
+difference of a density curve (by default the normalised Ser7P / Pol II
+ratio of ``density8graphs_*.py``) is rarely reached by such splits.
+Smoothing is linear, so every pooled row is smoothed once and a batch of
+splits is one product of a 0/1 group-membership matrix with the smoothed
+rows, giving the group sums of all splits at once; the other group is the
+pooled total minus that.  Batches are spread over worker processes, each
+with its own seed, and only exceedance counts come back.
+
+Tests are run at every position and, for windows of positions such as
+1-50 around the ``i == 2`` phosphorylation site, on distances between the
+two curves (:data:`METRICS`).  :func:`adjust_pvalues` corrects the
+position-wise p-values (Benjamini-Hochberg by default) and the window
+p-values (Holm over every window and metric).
+"""
+import collections
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .bootstrap import CURVES, EPSILON, EPSILON_DENSITY
+
+# mean: signed mean difference; l1, l2: norms of the difference; max: largest |difference|
+METRICS = ('mean', 'l1', 'l2', 'max')
+CORRECTIONS = ('bh', 'by', 'holm', 'bonferroni')
+TASK_SIZE = 1000  # permutations per task; fixed so results only depend on the seed
+TIES = 1e-6  # slack, relative to the curves, so splits tying the observed statistic count despite float32 rounding
+
+PermutationResult = collections.namedtuple('PermutationResult', [
+    'curve', 'sigma', 'n_permutations', 'curve_a', 'curve_b', 'observed', 'p_values', 'p_adjusted',
+    'windows', 'window_observed', 'window_p_values', 'window_p_adjusted'])
+
+_STATE = {}  # pooled smoothed rows and observed statistics of this process, set by _init
+
+
+def adjust_pvalues(p_values, method='bh'):
+    """Multiple-testing adjusted p-values, same shape as *p_values*.
+
+    *method* is one of :data:`CORRECTIONS`: Benjamini-Hochberg (``bh``) or
+    Benjamini-Yekutieli (``by``) false discovery rate, or Holm or Bonferroni
+    family-wise error rate.
+    """
+    p = np.asarray(p_values, dtype=np.float64)
+    flat = p.ravel()
+    n = len(flat)
+    if method == 'bonferroni':
+        return np.minimum(p * n, 1)
+    if n == 0:
+        return p.copy()
+    order = np.argsort(flat)
+    ranked = flat[order]
+    if method == 'holm':
+        adjusted = np.maximum.accumulate(ranked * (n - np.arange(n)))
+    elif method in ('bh', 'by'):
+        scale = n / np.arange(1, n + 1)
+        if method == 'by':
+            scale *= np.sum(1.0 / np.arange(1, n + 1))
+        adjusted = np.minimum.accumulate((ranked * scale)[::-1])[::-1]
+    else:
+        raise ValueError(f'unknown correction {method!r}, expected one of {CORRECTIONS}')
+    out = np.empty(n)
+    out[order] = np.minimum(adjusted, 1)
+    return out.reshape(p.shape)
+
+
+def _curve(sums_a, total, n_a, n_b, curve):
+    """*curve* of both groups, and its difference, from group-A sums of smoothed rows."""
+    gene_length = sums_a.shape[-1] // 2
+    sums_a = sums_a.astype(np.float64)
+    values = []
+    for sums, n in ((sums_a, n_a), (total - sums_a, n_b)):
+        polii, ser7p = sums[:, :gene_length] / n, sums[:, gene_length:] / n
+        polii /= polii.sum(axis=1, keepdims=True) + EPSILON_DENSITY
+        ser7p /= ser7p.sum(axis=1, keepdims=True) + EPSILON_DENSITY
+        if curve == 'polii':
+            values.append(polii)
+        elif curve == 'ser7p':
+            values.append(ser7p)
+        elif curve == 'difference':
+            values.append(ser7p - polii)
+        else:
+            ratio = ser7p / (polii + EPSILON)
+            values.append(ratio if curve == 'ratio' else np.log2(ratio + EPSILON))
+    return values[0], values[1], values[0] - values[1]
+
+
+def _window_stats(difference, windows):
+    """(splits x windows x metrics) distances of each window of *difference*."""
+    stats = np.empty((len(difference), len(windows), len(METRICS)))
+    for k, (first, last) in enumerate(windows):
+        part = difference[:, first - 1:last]
+        stats[:, k, 0] = np.abs(part.mean(axis=1))
+        stats[:, k, 1] = np.abs(part).sum(axis=1)
+        stats[:, k, 2] = np.sqrt(np.square(part).sum(axis=1))
+        stats[:, k, 3] = np.abs(part).max(axis=1)
+    return stats
+
+
+def _init(smoothed, n_a, curve, windows, observed, window_observed, batch_size):
+    _STATE.update(smoothed=smoothed, total=smoothed.sum(axis=0, dtype=np.float64), n_a=n_a,
+                  n_b=len(smoothed) - n_a, curve=curve, windows=windows, observed=observed,
+                  window_observed=window_observed, batch_size=batch_size)
+
+
+def _count(seed, n_permutations):
+    """Splits of this task whose statistics reach the observed ones, per position and window."""
+    state = _STATE
+    smoothed, n_a = state['smoothed'], state['n_a']
+    n_sims, gene_length = len(smoothed), len(state['total']) // 2
+    rng = np.random.default_rng(seed)
+    position_counts = np.zeros(gene_length, dtype=np.int64)
+    window_counts = np.zeros(state['window_observed'].shape, dtype=np.int64)
+    for start in range(0, n_permutations, state['batch_size']):
+        size = min(state['batch_size'], n_permutations - start)
+        members = np.zeros((size, n_sims), dtype=smoothed.dtype)
+        np.put_along_axis(members, rng.random((size, n_sims)).argsort(axis=1)[:, :n_a], 1, axis=1)
+        _, _, difference = _curve(members @ smoothed, state['total'], n_a, state['n_b'], state['curve'])
+        position_counts += (np.abs(difference) >= state['observed']).sum(axis=0)
+        window_counts += (_window_stats(difference, state['windows']) >= state['window_observed']).sum(axis=0)
+    return position_counts, window_counts
+
+
+def permutation_test(polii_a, ser7p_a, polii_b, ser7p_b, curve='ratio', sigma=5, windows=((1, 50),),
+                     n_permutations=10000, correction='bh', batch_size=250, seed=None, n_workers=None):
+    """Permutation tests of the *curve* difference between two sets of simulations.
+
+    ``*_a`` and ``*_b`` are the unpacked (sims x gene_length) occupancy
+    matrices of the two models.  *windows* are inclusive ``(first, last)``
+    ranges of 1-based positions.  Returns a :class:`PermutationResult`:
+    the curves of both models, their difference, and two-sided
+    p-values (``(1 + exceedances) / (1 + n_permutations)``) per position and
+    per window and metric, raw and adjusted (*correction* for positions,
+    Holm for windows).
+    """
+    from scipy.ndimage import gaussian_filter1d
+
+    if curve not in CURVES:
+        raise ValueError(f'unknown curve {curve!r}, expected one of {CURVES}')
+    n_a, gene_length = np.shape(polii_a)
+    windows = [(max(int(first), 1), min(int(last), gene_length)) for first, last in windows]
+    if any(first > last for first, last in windows):
+        raise ValueError(f'empty window in {windows} for gene length {gene_length}')
+    rows = np.concatenate([np.concatenate([polii_a, polii_b]), np.concatenate([ser7p_a, ser7p_b])], axis=1)
+    rows = rows.astype(np.float32)
+    if sigma > 0:
+        # smooth Pol II and Ser7P halves separately so neither leaks into the other
+        rows = np.concatenate([gaussian_filter1d(half, sigma, axis=-1) for half in np.split(rows, 2, axis=1)],
+                              axis=1)
+    n_b = len(rows) - n_a
+    total = rows.sum(axis=0, dtype=np.float64)
+    identity = np.zeros((1, len(rows)), dtype=rows.dtype)
+    identity[0, :n_a] = 1
+    # the observed split goes through the same float32 product as the permuted ones
+    curve_a, curve_b, difference = _curve(identity @ rows, total, n_a, n_b, curve)
+    observed = np.abs(difference[0])
+    window_observed = _window_stats(difference, windows)[0]
+
+    tasks = [min(TASK_SIZE, n_permutations - start) for start in range(0, n_permutations, TASK_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    # rounding scales with the curves, not with their difference, which is zero for identical models
+    scale = np.abs(curve_a[0]) + np.abs(curve_b[0]) + observed
+    options = (rows, n_a, curve, windows, observed - TIES * scale,
+               window_observed - TIES * _window_stats(scale[None], windows)[0], batch_size)
+    n_workers = min(n_workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if n_workers == 1:
+        _init(*options)
+        counts = [_count(task_seed, size) for task_seed, size in zip(seeds, tasks)]
+    else:
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(n_workers, mp_context=context, initializer=_init, initargs=options) as pool:
+            counts = list(pool.map(_count, seeds, tasks))
+    position_counts = sum(count[0] for count in counts)
+    window_counts = sum(count[1] for count in counts)
+
+    p_values = (1 + position_counts) / (1 + n_permutations)
+    window_p_values = (1 + window_counts) / (1 + n_permutations)
+    return PermutationResult(curve, sigma, n_permutations, curve_a[0], curve_b[0], difference[0], p_values,
+                             adjust_pvalues(p_values, correction), np.array(windows, dtype=np.int64),
+                             window_observed, window_p_values, adjust_pvalues(window_p_values, 'holm'))
+
+
+def save_permutation_test(filename, result, **arrays):
+    """Write a :class:`PermutationResult` as an ``.npz``, with any extra *arrays*."""
+    np.savez(filename, positions=np.arange(1, len(result.observed) + 1), metrics=np.array(METRICS),
+             **result._asdict(), **arrays)
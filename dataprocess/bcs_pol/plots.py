@@ -0,0 +1,239 @@
+"""The ``snapshot`` and ``density8graphs`` figures, drawn from arrays.
+
+Same panels, titles and colours as the scripts.  :mod:`matplotlib.pyplot`
+is imported when a figure is drawn, not when this module is imported; pick
+the backend (e.g. ``Agg`` for batch jobs) before calling.
+
+:class:`SnapshotLayout` and :class:`DensityLayout` build the same figures
+once and then only swap in the data of each report, for rendering many
+reports in a row (see :mod:`bcs_pol.reports`).  The snapshot bars are
+drawn as one filled step outline per panel instead of a patch per
+position, and dense line art can be rasterized to keep vector files small.
+"""
+import numpy as np
+
+from .bootstrap import CURVES
+
+ZOOM = 50  # positions shown in the zoomed-in panels
+
+# curve, colour, line style, legend label, y label, title, reference line (y, label)
+_DENSITY_PANELS = (
+    ((('polii', 'blue', '-', 'Pol II (density)'), ('ser7p', 'red', '--', 'Ser7P (density)')),
+     'Density', 'Smoothed Pol II and Ser7P Density (σ={sigma})', 'Smoothed Pol II and Ser7P Density', None),
+    ((('ratio', 'orange', '-', None),),
+     'Normalized Ser7P / Normalized Pol II Ratio',
+     'Ratio of Normalized Densities (Smoothed by components, σ={sigma})', 'Ratio of Normalized Densities',
+     (1, 'Ratio = 1')),
+    ((('log2_ratio', 'green', '-', None),),
+     'Log2 (Normalized Ser7P / Normalized Pol II Ratio)',
+     'Log2 Ratio of Normalized Densities (Smoothed by components, σ={sigma})',
+     'Log2 Ratio of Normalized Densities', (0, 'Log2 Ratio = 0 (Ratio = 1)')),
+    ((('difference', 'darkcyan', '-', None),),
+     'Difference in Density (Ser7P - Pol II)', 'Difference in Density (Ser7P - Pol II) (σ={sigma})',
+     'Difference in Density (Ser7P - Pol II)', (0, 'Difference = 0')),
+)
+
+
+def snapshot_figure(polii_total, ser7p_total, sim_number):
+    """The 2 x 2 bar chart of ``snapshot_cis.py``; returns the figure."""
+    import matplotlib.pyplot as plt
+
+    positions = np.arange(1, len(polii_total) + 1)
+    fig = plt.figure(figsize=(15, 10))
+    panels = (
+        (polii_total / max(sim_number, 1), 'blue', 'Average Pol II count per simulation',
+         f'Pol II Density vs Position (Averaged over {sim_number} simulations)'),
+        (ser7p_total / max(sim_number, 1), 'red', 'Average Ser7P count per simulation',
+         f'Ser7P Density vs Position (p=1 only, averaged over {sim_number} simulations)'),
+        (polii_total, 'darkblue', 'Total Pol II count across all simulations',
+         f'Pol II Density vs Position (Total counts from {sim_number} simulations)'),
+        (ser7p_total, 'darkred', 'Total Ser7P count across all simulations',
+         f'Ser7P Density vs Position (Total counts from {sim_number} simulations)'),
+    )
+    for k, (values, color, ylabel, title) in enumerate(panels):
+        ax = fig.add_subplot(2, 2, k + 1)
+        ax.bar(positions, values, alpha=0.7, color=color)
+        ax.set_xlabel('Position along gene')
+        ax.set_ylabel(ylabel)
+        ax.set_title(title)
+        ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    return fig
+
+
+def density_figure(curves, bands=None, sigma=5, zoom=ZOOM):
+    """The full-gene and zoomed-in panels of ``density8graphs_*.py``; returns the figure.
+
+    *curves* is a dict from :func:`bcs_pol.bootstrap.density_curves` and
+    *bands* optionally one from :func:`bcs_pol.bootstrap.bootstrap_bands`
+    (the difference panels have no band, as in the scripts).
+    """
+    import matplotlib.pyplot as plt
+
+    positions = np.arange(1, len(curves['polii']) + 1)
+    fig = plt.figure(figsize=(18, 22))
+    for row, (lines, ylabel, title, zoom_title, reference) in enumerate(_DENSITY_PANELS):
+        for column, stop in enumerate((len(positions), zoom)):
+            ax = fig.add_subplot(5, 2, 2 * row + column + 1)
+            for name, color, style, label in lines:
+                ax.plot(positions[:stop], curves[name][:stop], color=color, linestyle=style, label=label)
+                if bands is not None and name != 'difference':
+                    ax.fill_between(positions[:stop], bands[name][0][:stop], bands[name][1][:stop], color=color,
+                                    alpha=0.2)
+            if reference is not None:
+                ax.axhline(y=reference[0], color='gray', linestyle='--', label=reference[1])
+            ax.set_xlabel('Position along gene')
+            ax.set_ylabel(ylabel)
+            ax.set_title(title.format(sigma=sigma) if column == 0 else f'Zoomed-in (Positions 1-{zoom}) {zoom_title}')
+            ax.legend()
+            ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    return fig
+
+
+def compare_figure(curves_by_label, sigma=5, zoom=ZOOM):
+    """Normalised densities and log2 ratio of several models overlaid; returns the figure."""
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(18, 14))
+    rows = (('polii', 'Pol II density'), ('ser7p', 'Ser7P density'), ('log2_ratio', 'Log2 (Ser7P / Pol II)'))
+    for row, (name, ylabel) in enumerate(rows):
+        for column in range(2):
+            ax = fig.add_subplot(3, 2, 2 * row + column + 1)
+            for label, curves in curves_by_label.items():
+                stop = len(curves[name]) if column == 0 else zoom
+                ax.plot(np.arange(1, stop + 1), curves[name][:stop], label=label)
+            if name == 'log2_ratio':
+                ax.axhline(y=0, color='gray', linestyle='--')
+            ax.set_xlabel('Position along gene')
+            ax.set_ylabel(ylabel)
+            ax.set_title(f'{ylabel} (σ={sigma})' if column == 0 else f'Zoomed-in (Positions 1-{zoom}) {ylabel}')
+            ax.legend()
+            ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    return fig
+
+
+def binned_figure(pyramids_by_label, bin_bp):
+    """Pol II, Ser7P and Ser7P / Pol II per *bin_bp* bin of several models; returns the figure.
+
+    Reads the bins straight from each :class:`bcs_pol.pyramid.DensityPyramid`,
+    on the scale of ChIP-seq or NET-seq data binned the same way.
+    """
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(12, 12))
+    rows = (('polii', 'Average Pol II count per site'), ('ser7p', 'Average Ser7P count per site'),
+            (None, 'Ser7P / Pol II'))
+    for row, (species, ylabel) in enumerate(rows):
+        ax = fig.add_subplot(3, 1, row + 1)
+        for label, pyramid in pyramids_by_label.items():
+            if species is None:
+                polii = pyramid.level('polii', bin_bp)
+                values = np.divide(pyramid.level('ser7p', bin_bp), polii, out=np.zeros_like(polii), where=polii > 0)
+            else:
+                values = pyramid.level(species, bin_bp, average=True)
+            ax.stairs(values, pyramid.bin_edges(bin_bp) / 1000, label=label)
+        ax.set_xlabel('Position along gene (kb)')
+        ax.set_ylabel(ylabel)
+        ax.set_title(f'{ylabel} in {bin_bp / 1000:g} kb bins')
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    return fig
+
+
+def _rescale(ax):
+    ax.relim()
+    ax.autoscale_view()
+
+
+class SnapshotLayout:
+    """Reusable :func:`snapshot_figure` layout; :meth:`update` draws one report."""
+
+    _PANELS = (('blue', 'Average Pol II count per simulation',
+                'Pol II Density vs Position (Averaged over {sims} simulations)'),
+               ('red', 'Average Ser7P count per simulation',
+                'Ser7P Density vs Position (p=1 only, averaged over {sims} simulations)'),
+               ('darkblue', 'Total Pol II count across all simulations',
+                'Pol II Density vs Position (Total counts from {sims} simulations)'),
+               ('darkred', 'Total Ser7P count across all simulations',
+                'Ser7P Density vs Position (Total counts from {sims} simulations)'))
+
+    def __init__(self, gene_length, rasterize=False):
+        import matplotlib.pyplot as plt
+
+        self.gene_length = gene_length
+        self.fig = plt.figure(figsize=(15, 10))
+        self.axes, self.steps = [], []
+        edges = np.arange(gene_length + 1) + 0.5
+        for k, (color, ylabel, _) in enumerate(self._PANELS):
+            ax = self.fig.add_subplot(2, 2, k + 1)
+            self.steps.append(ax.stairs(np.zeros(gene_length), edges, fill=True, alpha=0.7, color=color,
+                                        rasterized=rasterize))
+            ax.set_xlabel('Position along gene')
+            ax.set_ylabel(ylabel)
+            ax.grid(True, alpha=0.3)
+            self.axes.append(ax)
+        self.update(np.ones(gene_length), np.ones(gene_length), 1)
+        self.fig.tight_layout()
+        self.bbox = self.fig.get_tightbbox().padded(0.1)  # saved area, measured once
+
+    def update(self, polii_total, ser7p_total, sim_number):
+        average = max(sim_number, 1)
+        for ax, step, values, (_, _, title) in zip(self.axes, self.steps,
+                                                   (polii_total / average, ser7p_total / average,
+                                                    polii_total, ser7p_total), self._PANELS):
+            step.set_data(values)
+            ax.set_title(title.format(sims=sim_number))
+            _rescale(ax)
+        return self.fig
+
+
+class DensityLayout:
+    """Reusable :func:`density_figure` layout; :meth:`update` draws one report."""
+
+    def __init__(self, gene_length, zoom=ZOOM, rasterize=False):
+        import matplotlib.pyplot as plt
+
+        self.gene_length = gene_length
+        self.zoom = zoom
+        self.rasterize = rasterize
+        self.positions = np.arange(1, gene_length + 1)
+        self.fig = plt.figure(figsize=(18, 22))
+        self.panels = []  # (axes, stop, lines, title, zoom title)
+        self.bands = []
+        for row, (lines, ylabel, title, zoom_title, reference) in enumerate(_DENSITY_PANELS):
+            for column, stop in enumerate((gene_length, zoom)):
+                ax = self.fig.add_subplot(5, 2, 2 * row + column + 1)
+                drawn = []
+                for name, color, style, label in lines:
+                    line, = ax.plot(self.positions[:stop], np.zeros(len(self.positions[:stop])), color=color,
+                                    linestyle=style, label=label, rasterized=rasterize)
+                    drawn.append((name, color, line))
+                if reference is not None:
+                    ax.axhline(y=reference[0], color='gray', linestyle='--', label=reference[1])
+                ax.set_xlabel('Position along gene')
+                ax.set_ylabel(ylabel)
+                ax.legend()
+                ax.grid(True, alpha=0.3)
+                self.panels.append((ax, stop, drawn, title if column == 0 else None,
+                                    f'Zoomed-in (Positions 1-{zoom}) {zoom_title}'))
+        self.update({name: np.ones(gene_length) for name in CURVES})
+        self.fig.tight_layout()
+        self.bbox = self.fig.get_tightbbox().padded(0.1)  # saved area, measured once
+
+    def update(self, curves, bands=None, sigma=5):
+        for band in self.bands:
+            band.remove()
+        self.bands = []
+        for ax, stop, drawn, title, zoom_title in self.panels:
+            for name, color, line in drawn:
+                line.set_ydata(curves[name][:stop])
+                if bands is not None and name != 'difference':
+                    self.bands.append(ax.fill_between(self.positions[:stop], bands[name][0][:stop],
+                                                      bands[name][1][:stop], color=color, alpha=0.2,
+                                                      rasterized=self.rasterize))
+            ax.set_title(title.format(sigma=sigma) if title is not None else zoom_title)
+            _rescale(ax)
+        return self.fig
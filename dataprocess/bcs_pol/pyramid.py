@@ -0,0 +1,128 @@
+"""Pol II and Ser7P counts at several resolutions, with prefix sums.
+
+A model site is :data:`SITE_BP` = 100 bp, while ChIP-seq and NET-seq data
+come in 1 kb or 10 kb bins.  A :class:`DensityPyramid` keeps the counts at
+every resolution in :data:`LEVELS_BP` plus the whole gene, and the prefix
+sums of the site counts, so the total of any window of sites is two
+lookups and any bin width that is a whole number of sites is one
+difference of the prefix sums at the bin edges.  Extraction writes the
+pyramid into the ``*_polii_ser7p_density_arrays.npz`` next to the site
+counts (see :func:`bcs_pol.aggregate.save_densities`); :meth:`DensityPyramid.load`
+reads it back, or builds it for files written before.
+
+Counts are along the last axis, so the 2-D files of ``sweep_parameters.py``
+give one pyramid row per sweep point.
+"""
+import numpy as np
+
+SPECIES = ('polii', 'ser7p')
+SITE_BP = 100  # bp per model site ("bp x 100" in the model headers)
+LEVELS_BP = (1000, 10000)  # precomputed bin widths besides single sites and the whole gene
+
+
+class DensityPyramid:
+    """Total counts of *sims* simulations binned at every level.
+
+    *polii* and *ser7p* are the per-site totals (``polii_density_total`` and
+    ``ser7p_density_total``).  Positions are 1-based sites; bin widths are
+    in bp and must be a multiple of *site_bp*.
+    """
+
+    def __init__(self, polii, ser7p, sims=1, site_bp=SITE_BP, levels_bp=LEVELS_BP):
+        self.sims = sims
+        self.site_bp = site_bp
+        self.prefix = {}
+        for name, counts in zip(SPECIES, (polii, ser7p)):
+            counts = np.asarray(counts, dtype=np.float64)
+            self.prefix[name] = np.concatenate([np.zeros(counts.shape[:-1] + (1,)), np.cumsum(counts, axis=-1)],
+                                               axis=-1)
+        self.gene_length = self.prefix['polii'].shape[-1] - 1
+        self.levels = {}
+        for bin_bp in tuple(levels_bp) + (self.gene_bp,):
+            self.levels[bin_bp] = {name: self._bins(name, bin_bp) for name in SPECIES}
+
+    @property
+    def gene_bp(self):
+        return self.gene_length * self.site_bp
+
+    def _sites(self, bin_bp):
+        sites, remainder = divmod(int(bin_bp), self.site_bp)
+        if remainder or sites < 1:
+            raise ValueError(f'bin of {bin_bp} bp is not a whole number of {self.site_bp} bp sites')
+        return sites
+
+    def _bins(self, species, bin_bp):
+        edges = np.minimum(np.arange(0, self.gene_length + self._sites(bin_bp), self._sites(bin_bp)),
+                           self.gene_length)
+        return np.diff(self.prefix[species][..., edges], axis=-1)
+
+    def bin_edges(self, bin_bp):
+        """Bin edges in bp; the last bin is cut short when *bin_bp* does not divide the gene."""
+        return np.minimum(np.arange(0, self.gene_bp + bin_bp, self._sites(bin_bp) * self.site_bp), self.gene_bp)
+
+    def level(self, species, bin_bp=None, average=False):
+        """Counts of *species* per bin of *bin_bp*, summed over sites and simulations.
+
+        Stored levels are returned as they are; other widths come from the
+        prefix sums.  With *average*, counts are per simulation and per site,
+        the scale of ``polii_density_avg``.
+        """
+        bin_bp = self.site_bp if bin_bp is None else bin_bp
+        if bin_bp in self.levels:
+            counts = self.levels[bin_bp][species]
+        elif bin_bp == self.site_bp:
+            counts = np.diff(self.prefix[species], axis=-1)
+        else:
+            counts = self._bins(species, bin_bp)
+        if average:
+            counts = counts / (np.diff(self.bin_edges(bin_bp)) // self.site_bp) / max(self.sims, 1)
+        return counts
+
+    def window_total(self, species, first, last):
+        """Counts of *species* over sites *first* to *last* (1-based, inclusive).
+
+        *first* and *last* may be arrays, for many windows at once.
+        """
+        first = np.clip(first, 1, self.gene_length)
+        last = np.clip(last, 0, self.gene_length)
+        prefix = self.prefix[species]
+        return np.where(last >= first, prefix[..., last] - prefix[..., first - 1], 0)
+
+    def window_average(self, species, first, last):
+        """:meth:`window_total` per simulation and per site."""
+        width = np.maximum(np.clip(last, 0, self.gene_length) - np.clip(first, 1, self.gene_length) + 1, 1)
+        return self.window_total(species, first, last) / width / max(self.sims, 1)
+
+    def arrays(self):
+        """The pyramid as ``.npz`` arrays, to store next to the site counts."""
+        arrays = {'pyramid_site_bp': self.site_bp, 'pyramid_levels_bp': np.array(sorted(self.levels))}
+        for name in SPECIES:
+            arrays[f'{name}_prefix'] = self.prefix[name]
+            for bin_bp, counts in self.levels.items():
+                arrays[f'{name}_level_{bin_bp}bp'] = counts[name]
+        return arrays
+
+    @classmethod
+    def load(cls, filename):
+        """The pyramid of a density ``.npz``, built from its totals if it has none stored."""
+        from .aggregate import stored_sims
+
+        with np.load(filename) as data:
+            if 'polii_density_total' in data:
+                polii, ser7p = data['polii_density_total'], data['ser7p_density_total']
+                sims = stored_sims(data)
+            else:
+                # sweep batches written before they kept totals only have averages; their simulation
+                # count is lost, so the averages are taken as the counts of one simulation
+                polii, ser7p = data['polii_density_avg'], data['ser7p_density_avg']
+                sims = 1
+            if 'polii_prefix' not in data:
+                return cls(polii, ser7p, sims)
+            pyramid = cls.__new__(cls)
+            pyramid.sims = sims
+            pyramid.site_bp = int(data['pyramid_site_bp'])
+            pyramid.prefix = {name: data[f'{name}_prefix'] for name in SPECIES}
+            pyramid.gene_length = pyramid.prefix['polii'].shape[-1] - 1
+            pyramid.levels = {int(bin_bp): {name: data[f'{name}_level_{bin_bp}bp'] for name in SPECIES}
+                              for bin_bp in data['pyramid_levels_bp']}
+        return pyramid
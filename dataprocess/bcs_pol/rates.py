@@ -0,0 +1,190 @@
+"""Event-rate timelines of every model action.
+
+Each event line is mapped to a code in :data:`ACTIONS` through a table
+built once per chunk from its distinct action names (``release`` of
+``RNAPolII_prePause`` is ``pause_release``), and all of a chunk's events
+are binned by time, and optionally by position, with one ``bincount``.
+:func:`extract_rates` does this in the same pass that replays the
+``Pol_ii`` rows for the final densities, and keeps the counts of every
+simulation, so averaged and per-simulation curves come from one read.
+"""
+import collections
+
+import numpy as np
+
+from .compressed import open_trace
+from .index import load_index
+from .parser import ACTIONS as _MODEL_ACTIONS, DEFAULT_CHUNK_SIZE, apply_moves, iter_blocks, parse_event_rows
+
+# names of the action codes; release of RNAPolII_prePause is told apart as pause_release
+ACTIONS = tuple('pause_release' if (name, process) == ('release', 'RNAPolII_prePause') else name
+                for name, process in _MODEL_ACTIONS)
+_CODES = {name.encode(): code for code, name in enumerate(ACTIONS)}
+_PAUSE_RELEASE = ACTIONS.index('pause_release')
+_POLII = ACTIONS.index('Pol_ii')
+
+RateResult = collections.namedtuple('RateResult', ['timeline', 'polii_final', 'ser7p_final'])
+
+
+def action_codes(action, process):
+    """Code in :data:`ACTIONS` of each event (-1 for actions not in the models)."""
+    names, inverse = np.unique(action, return_inverse=True)
+    code = np.array([_CODES.get(bytes(name), -1) for name in names], dtype=np.int64)[inverse]
+    code[(code == _CODES[b'release']) & (process == b'RNAPolII_prePause')] = _PAUSE_RELEASE
+    return code
+
+
+class RateTimeline:
+    """Event counts per (simulation, action, time bin), and per position bin if asked.
+
+    *time_bin* is the width of a time bin in seconds; events after *t_max*
+    are ignored.  With *position_bin* set, counts summed over simulations
+    are also kept per bin of that many sites (events without ``i``, such as
+    ``repairedPos``, have no position and are left out there).
+    """
+
+    def __init__(self, gene_length, t_max, time_bin, position_bin=None):
+        self.gene_length = gene_length
+        self.position_bin = position_bin
+        self.time_edges = np.arange(0, t_max + time_bin, time_bin, dtype=np.float64)
+        n_time = len(self.time_edges) - 1
+        self.sim_counts = []
+        self.current = np.zeros((len(ACTIONS), n_time), dtype=np.int64)
+        self.position_counts = None
+        if position_bin is not None:
+            self.position_counts = np.zeros((len(ACTIONS), n_time, gene_length // position_bin + 1),
+                                            dtype=np.int64)
+
+    @property
+    def n_sims(self):
+        return len(self.sim_counts)
+
+    def add(self, code, time, i):
+        """Count events of the current simulation."""
+        n_time = len(self.time_edges) - 1
+        bins = np.searchsorted(self.time_edges, time, side='right') - 1
+        keep = (code >= 0) & (bins >= 0) & (bins < n_time)
+        keys = code[keep] * n_time + bins[keep]
+        self.current += np.bincount(keys, minlength=self.current.size).reshape(self.current.shape)
+        if self.position_counts is not None:
+            keep &= i >= 0
+            n_positions = self.position_counts.shape[2]
+            keys = (code[keep] * n_time + bins[keep]) * n_positions + np.minimum(i[keep] // self.position_bin,
+                                                                                 n_positions - 1)
+            self.position_counts += np.bincount(keys, minlength=self.position_counts.size).reshape(
+                self.position_counts.shape)
+
+    def end_simulation(self):
+        self.sim_counts.append(self.current.astype(np.int32))
+        self.current[:] = 0
+
+    def merge(self, other):
+        """Add the simulations of another timeline on the same grid."""
+        self.sim_counts.extend(other.sim_counts)
+        if self.position_counts is not None:
+            self.position_counts += other.position_counts
+
+    def counts(self, actions, per_sim=False):
+        """Events of *actions* (a name or a tuple of names) per time bin.
+
+        Summed over simulations, or one row per simulation with *per_sim*.
+        """
+        if isinstance(actions, str):
+            actions = (actions,)
+        codes = [ACTIONS.index(name) for name in actions]
+        n_time = len(self.time_edges) - 1
+        stacked = np.array(self.sim_counts).reshape(self.n_sims, len(ACTIONS), n_time)
+        per_action = stacked[:, codes].sum(axis=1)
+        return per_action if per_sim else per_action.sum(axis=0)
+
+    def rate(self, actions, per_sim=False):
+        """Events of *actions* per second, averaged over simulations unless *per_sim*."""
+        rate = self.counts(actions, per_sim) / np.diff(self.time_edges)
+        return rate if per_sim else rate / max(self.n_sims, 1)
+
+    def dissociation_rate(self, per_sim=False):
+        """``release1`` + ``release2`` per second: polymerases falling off the gene."""
+        return self.rate(('release1', 'release2'), per_sim)
+
+    def damage_remaining(self, per_sim=False):
+        """Damage sites left at the end of each time bin, averaged unless *per_sim*."""
+        remaining = np.cumsum(self.counts('damageDNA', per_sim) - self.counts('repairedPos', per_sim), axis=-1)
+        return remaining if per_sim else remaining / max(self.n_sims, 1)
+
+    def save(self, filename):
+        """Write the timeline, its per-simulation counts and the averaged rates as a compressed ``.npz``."""
+        n_time = len(self.time_edges) - 1
+        arrays = {}
+        if self.position_counts is not None:
+            arrays['position_counts'] = self.position_counts
+        np.savez_compressed(filename,
+                            actions=np.array(ACTIONS),
+                            time_edges=self.time_edges,
+                            gene_length=self.gene_length,
+                            position_bin=-1 if self.position_bin is None else self.position_bin,
+                            sim_counts=np.array(self.sim_counts, dtype=np.int32).reshape(self.n_sims, len(ACTIONS),
+                                                                                         n_time),
+                            rate_avg=np.array([self.rate(name) for name in ACTIONS]).reshape(len(ACTIONS), n_time),
+                            damage_remaining_avg=self.damage_remaining(),
+                            **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """Reopen a saved timeline so more simulations can be added to it."""
+        with np.load(filename) as data:
+            if tuple(data['actions']) != ACTIONS:
+                raise ValueError(f'{filename} was written with actions {tuple(data["actions"])}')
+            time_edges = data['time_edges']
+            position_bin = int(data['position_bin'])
+            timeline = cls(int(data['gene_length']), time_edges[-1], time_edges[1] - time_edges[0],
+                           None if position_bin < 0 else position_bin)
+            timeline.time_edges = time_edges
+            timeline.sim_counts = list(data['sim_counts'])
+            if 'position_counts' in data:
+                timeline.position_counts = data['position_counts']
+        return timeline
+
+
+def extract_rates(path, gene_length, time_bin, t_max=None, position_bin=None, sim_number=None, timeline=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE):
+    """Action timelines and final densities of *path* in one streaming pass.
+
+    *t_max* defaults to the last event time recorded in the trace index.
+    Pass an existing *timeline* to add this trace's simulations to it.
+    Returns a :class:`RateResult`; its densities are those of
+    :func:`bcs_pol.parser.extract_counts`, with the same block and
+    *sim_number* handling.
+    """
+    if timeline is None:
+        if t_max is None:
+            t_max = np.nanmax(load_index(path, chunk_size).final_time)
+        timeline = RateTimeline(gene_length, t_max, time_bin, position_bin)
+    polii_all, ser7p_all = np.zeros(gene_length), np.zeros(gene_length)
+    polii_sim, ser7p_sim = np.zeros(gene_length), np.zeros(gene_length)
+    current = 0
+
+    def close_block():
+        polii_all[:] += polii_sim
+        ser7p_all[:] += ser7p_sim
+        if current > 0:
+            timeline.end_simulation()
+        timeline.current[:] = 0
+
+    with open_trace(path) as f:
+        for block, segment in iter_blocks(f, chunk_size):
+            if block != current:
+                close_block()
+                polii_sim[:] = 0
+                ser7p_sim[:] = 0
+                current = block
+            if sim_number is not None and block > sim_number:
+                break
+            columns = parse_event_rows(segment)
+            code = action_codes(columns['action'], columns['process'])
+            timeline.add(code, columns['time'], columns['i'])
+            moves = (code == _POLII) & (columns['p'] >= 0)
+            apply_moves(polii_sim, columns['i'][moves])
+            apply_moves(ser7p_sim, columns['i'][moves & (columns['p'] == 1)])
+        else:
+            close_block()
+    return RateResult(timeline, polii_all, ser7p_all)
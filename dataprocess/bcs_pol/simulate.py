@@ -0,0 +1,419 @@
+"""Batched NumPy simulator for the cis and trans Pol II models.
+
+This is an in-process stand-in for running ``bcs`` on ``cis.bc`` or
+``trans.bc``.  It follows the same processes:
+
+* ``MakeDamage`` lays a damage beacon on each site with probability
+  ``1 / (uv_distance + 1)`` and then launches ``start``.
+* ``RNAPolII_pool`` / ``RNAPolII_prePause`` cycle through initiation,
+  pause termination and pause release.  These steps never interact with
+  other polymerases, so each trip from the pool to pause release is
+  sampled in one go.
+* ``RNAPolII_postPause`` emits ``Pol_ii`` on entering a site, waits while
+  the next site carries a ``location`` beacon, elongates past undamaged
+  sites, reacts to ``damage`` (cis: ``p=1``; trans: launch ``phos`` once,
+  ``d=1``), picks up ``phos`` at ``i==2`` (trans) and dissociates at rate
+  ``1 / dissociation_time``.
+* ``RepairDamage`` removes one damage site, chosen uniformly, at rate
+  ``1 / repair_half_life``.
+
+Steps at rate ``fast`` are taken as instantaneous, with their branch chosen
+with the same probabilities as in ``bcs``.  All simulations of a batch
+advance together: every iteration applies the next event of each
+simulation as array operations over (simulations x polymerases) state.
+
+``python -m bcs_pol.simulate -s SIMS -t THREADS -o TRACE MODEL`` takes the
+arguments of ``bcs`` (see :data:`bcs_pol.sweep.BCS_COMMAND`) and writes
+the trace a batch at a time, so sweeps and calibrations can run without
+``bcs`` installed.
+"""
+import argparse
+import collections
+import sys
+
+import numpy as np
+
+from .parallel import extract_occupancy
+from .parser import ACTIONS
+
+FREE, MOVING, BLOCKED, STUCK = range(4)  # polymerase states outside the pool are MOVING..STUCK
+
+_CODE = {action: code for code, action in enumerate(ACTIONS)}  # keyed by (action, process)
+_PROCESS = dict(reversed(ACTIONS))  # process of each action name, the first listed for release
+
+SimulationResult = collections.namedtuple('SimulationResult', ['polii_rows', 'ser7p_rows', 'n_events'])
+
+
+class _EventLog:
+    """Events of one batch, kept as arrays until they are written out."""
+
+    def __init__(self):
+        self.parts = []
+        self.seq = 0
+
+    def add(self, sims, times, action, i=None, p=None, d=None, process=None):
+        n = len(sims)
+        if n == 0:
+            return
+        fill = np.full(n, -1, dtype=np.int64)
+        code = _CODE[action, process or _PROCESS[action]]
+        self.parts.append((np.asarray(sims), np.asarray(times, dtype=np.float64), np.full(n, code),
+                           fill if i is None else i, fill if p is None else p, fill if d is None else d,
+                           np.arange(self.seq, self.seq + n)))
+        self.seq += n
+
+    def write(self, f, n_sims, variant, t_max):
+        """Append the batch to the text file *f* in ``bcs`` trace layout."""
+        sims, times, actions, i, p, d, seq = (np.concatenate(column) for column in zip(*self.parts))
+        order = np.lexsort((seq, times, sims))
+        order = order[times[order] <= t_max]
+        starts = np.searchsorted(sims[order], np.arange(n_sims + 1))
+        for sim in range(n_sims):
+            f.write('>=======\n')
+            for k in order[starts[sim]:starts[sim + 1]]:
+                action, process = ACTIONS[actions[k]]
+                if process == 'RNAPolII_postPause':
+                    params = f'\ti\t{i[k]}\tp\t{p[k]}' + (f'\td\t{d[k]}' if variant == 'trans' else '')
+                elif i[k] >= 0:
+                    params = f'\ti\t{i[k]}'
+                else:
+                    params = ''
+                f.write(f'{times[k]:.6f}\t{action}\t{process}{params}\n')
+
+
+class _Batch:
+    """State of a batch of simulations advanced in lock step."""
+
+    def __init__(self, params, variant, n_sims, t_max, rng, log):
+        self.rng = rng
+        self.log = log
+        self.trans = variant == 'trans'
+        self.t_max = t_max
+        self.gene_length = G = int(params['gene_length'])
+        self.n_pols = P = int(params['polymerase_count'])
+        self.pause_location = int(params['pause_location'])
+        self.initiation_freq = params['initiation_freq']
+        self.pause_dwell_time = params['pause_dwell_time']
+        self.release_probability = params['pause_release_probability'] / (
+            params['pause_release_probability'] + params['pause_termination_probability'])
+        self.elongation_speed = params['elongation_speed']
+        self.dissociation_time = params['dissociation_time']
+        self.repair_half_life = params['repair_half_life']
+        fast = params['fast']
+        self.n_events = 0
+
+        # MakeDamage walks along the gene: damage![i] at fast/uv_distance races pass at fast
+        S = n_sims
+        damage_rate = fast / params['uv_distance']
+        steps = rng.exponential(1.0 / (damage_rate + fast), (S, G))
+        damaged = rng.random((S, G)) < damage_rate / (damage_rate + fast)
+        beacon_time = np.cumsum(steps + damaged * rng.exponential(1.0 / fast, (S, G)), axis=1)
+        self.damage = np.zeros((S, G + 2), dtype=bool)
+        self.damage[:, :G] = damaged
+        self.damage_time = np.full((S, G + 2), np.inf)
+        self.damage_time[:, :G] = np.where(damaged, beacon_time, np.inf)
+        t_start = beacon_time[:, -1] + rng.exponential(1.0 / fast, S)
+        if log is not None:
+            sims, sites = np.nonzero(damaged)
+            log.add(sims, beacon_time[sims, sites], 'damageDNA', i=sites)
+            sims, sites = np.nonzero(~damaged)
+            log.add(sims, beacon_time[sims, sites], 'pass', i=sites)
+
+        self.t_repair = self.damage_time.min(axis=1) + rng.exponential(self.repair_half_life, S)
+
+        self.loc = np.zeros((S, G + 2), dtype=bool)
+        self.n_blocked = np.zeros((S, G + 2), dtype=np.int64)
+        self.phos = np.zeros(S, dtype=bool)
+        self.state = np.full((S, P), FREE)
+        self.pos = np.zeros((S, P), dtype=np.int64)
+        self.p = np.zeros((S, P), dtype=np.int64)
+        self.d = np.zeros((S, P), dtype=np.int64)
+        self.t_next = np.empty((S, P))
+        sims = np.repeat(np.arange(S), P)
+        self.t_next.ravel()[:] = self._free_phase(sims, np.repeat(t_start, P))
+        self.occ_polii = np.zeros((S, G), dtype=np.uint8)
+        self.occ_ser7p = np.zeros((S, G), dtype=np.uint8)
+
+    # --- pool and pause -------------------------------------------------
+
+    def _free_phase(self, sims, t0):
+        """Time at which polymerases that left for the pool re-enter postPause."""
+        rng = self.rng
+        n = len(t0)
+        if self.log is None:
+            cycles = rng.geometric(self.release_probability, n)
+            t = t0 + rng.gamma(cycles, 1.0 / self.initiation_freq)
+            if self.pause_location:
+                t += rng.gamma(cycles * self.pause_location, 10.0 / self.elongation_speed)
+            return t + rng.exponential(self.pause_dwell_time, n)
+
+        # step through the cycles so every action can be logged
+        t = np.array(t0, dtype=np.float64)
+        live = np.ones(n, dtype=bool)
+        while live.any():
+            idx = np.flatnonzero(live)
+            t[idx] += rng.exponential(1.0 / self.initiation_freq, len(idx))
+            self.log.add(sims[idx], t[idx], 'reuse')
+            for step in range(self.pause_location):
+                t[idx] += rng.exponential(10.0 / self.elongation_speed, len(idx))
+                self.log.add(sims[idx], t[idx], 'elongation1', i=np.full(len(idx), step))
+            site = np.full(len(idx), self.pause_location)
+            released = rng.random(len(idx)) < self.release_probability
+            self.log.add(sims[idx[~released]], t[idx[~released]], 'terminate', i=site[~released])
+            done = idx[released]
+            self.log.add(sims[done], t[done], 'release', i=site[released], process='RNAPolII_prePause')
+            t[done] += rng.exponential(self.pause_dwell_time, len(done))
+            self.log.add(sims[done], t[done], 'dwell', i=site[released])
+            live[done] = False
+        return t
+
+    # --- postPause ------------------------------------------------------
+
+    def _emit(self, action, s, k, t):
+        self.n_events += len(s)
+        if self.log is not None:
+            self.log.add(s, t, action, i=self.pos[s, k], p=self.p[s, k], d=self.d[s, k])
+
+    def _wait(self, s, k, t, state):
+        self.state[s, k] = state
+        if state == BLOCKED:
+            np.add.at(self.n_blocked, (s, self.pos[s, k]), 1)
+        self.t_next[s, k] = t + self.rng.exponential(self.dissociation_time, len(s))
+
+    def _to_pool(self, s, k, t):
+        self.state[s, k] = FREE
+        self.t_next[s, k] = self._free_phase(s, t)
+
+    def _enter(self, s, k, t):
+        """``RNAPolII_postPause[i,...]``: launch location, emit Pol_ii, then decide."""
+        G = self.gene_length
+        while len(s):
+            i = self.pos[s, k]
+            self.loc[s, i] = True
+            end = i >= G
+            if end.any():
+                self._emit('unbind', s[end], k[end], t[end])
+                self.loc[s[end], G] = False
+                self._to_pool(s[end], k[end], t[end])
+            s, k, t, i = s[~end], k[~end], t[~end], i[~end]
+            self._emit('Pol_ii', s, k, t)
+            self.occ_polii[s[i > 0], i[i > 0] - 1] = 0
+            self.occ_polii[s, i] = 1
+            ser7p = self.p[s, k] == 1
+            self.occ_ser7p[s[ser7p & (i > 0)], i[ser7p & (i > 0)] - 1] = 0
+            self.occ_ser7p[s[ser7p], i[ser7p]] = 1
+
+            blocked = self.loc[s, i + 1]
+            self._wait(s[blocked], k[blocked], t[blocked], BLOCKED)
+            s, k, t = self._choose(s[~blocked], k[~blocked], t[~blocked])
+
+    def _choose(self, s, k, t):
+        """Inner choice once the next site is free; returns the re-entering polymerases."""
+        i = self.pos[s, k]
+        damaged = self.damage[s, i + 1]
+        if not self.trans:
+            move = ~damaged
+            reenter = damaged & (self.p[s, k] == 0)
+            self.p[s[reenter], k[reenter]] = 1
+            stuck = damaged & ~reenter
+        else:
+            options = np.stack([~damaged,
+                                damaged & (self.d[s, k] == 0),
+                                (i == 2) & (self.p[s, k] == 0) & self.phos[s]], axis=1)
+            n_options = options.sum(axis=1)
+            # fast branches have equal rates, so each enabled one is equally likely
+            pick = np.floor(self.rng.random(len(s)) * n_options)
+            chosen = (np.cumsum(options, axis=1) > pick[:, None]) & options
+            chosen &= np.cumsum(chosen, axis=1) == 1
+            move, signal, take = chosen.T
+            self.d[s[signal], k[signal]] = 1
+            self.p[s[take], k[take]] = 1
+            reenter = signal | take
+            stuck = n_options == 0
+
+        self.state[s[move], k[move]] = MOVING
+        self.t_next[s[move], k[move]] = t[move] + self.rng.exponential(1.0 / self.elongation_speed, move.sum())
+        self._wait(s[stuck], k[stuck], t[stuck], STUCK)
+
+        s_re, k_re, t_re = s[reenter], k[reenter], t[reenter]
+        # re-entering polymerases get their state back from _enter
+        self.state[s_re, k_re] = MOVING
+        if self.trans and signal.any():
+            # a new phos beacon wakes polymerases already waiting at i==2 with p==0
+            new = np.unique(s[signal][~self.phos[s[signal]]])
+            self.phos[s[signal]] = True
+            if len(new):
+                t_sim = np.full(len(self.phos), np.nan)
+                t_sim[s[signal]] = t[signal]
+                rows, cols = np.nonzero((self.state[new] == STUCK) & (self.pos[new] == 2) & (self.p[new] == 0))
+                ws, wk = new[rows], cols
+                self.p[ws, wk] = 1
+                s_re = np.concatenate([s_re, ws])
+                k_re = np.concatenate([k_re, wk])
+                t_re = np.concatenate([t_re, t_sim[ws]])
+        return s_re, k_re, t_re
+
+    def _wake(self, s, site, t, state):
+        """Re-evaluate polymerases in *state* waiting at ``site - 1`` of sims *s*."""
+        if state == BLOCKED:
+            # most moves leave nobody behind, so skip the polymerase scan for those
+            waiting = self.n_blocked[s, site - 1] > 0
+            s, site, t = s[waiting], site[waiting], t[waiting]
+            self.n_blocked[s, site - 1] = 0
+        rows, cols = np.nonzero((self.state[s] == state) & (self.pos[s] == (site - 1)[:, None]))
+        if len(rows):
+            self._enter(*self._choose(s[rows], cols, t[rows]))
+
+    # --- main loop ------------------------------------------------------
+
+    def run(self):
+        S = len(self.t_next)
+        sims = np.arange(S)
+        while True:
+            k = self.t_next.argmin(axis=1)
+            t_pol = self.t_next[sims, k]
+            t = np.minimum(t_pol, self.t_repair)
+            if not (t <= self.t_max).any():
+                break
+            repair = (self.t_repair < t_pol) & (t <= self.t_max)
+            event = (t_pol <= self.t_repair) & (t <= self.t_max)
+
+            s, k, t_ev = sims[event], k[event], t_pol[event]
+            state = self.state[s, k]
+            free = state == FREE
+            if free.any():
+                sf, kf = s[free], k[free]
+                self.pos[sf, kf] = self.pause_location + 1
+                self.p[sf, kf] = 0
+                self.d[sf, kf] = 0
+                self._enter(sf, kf, t_ev[free])
+            moving = state == MOVING
+            if moving.any():
+                sm, km, tm = s[moving], k[moving], t_ev[moving]
+                site = self.pos[sm, km]
+                self._emit('elongation2', sm, km, tm)
+                self.loc[sm, site] = False
+                self.pos[sm, km] += 1
+                self.d[sm, km] = 0
+                self._enter(sm, km, tm)
+                self._wake(sm, site, tm, BLOCKED)
+            waiting = (state == BLOCKED) | (state == STUCK)
+            if waiting.any():
+                sw, kw, tw = s[waiting], k[waiting], t_ev[waiting]
+                site = self.pos[sw, kw]
+                self._emit('release', sw, kw, tw)
+                stuck = state[waiting] == STUCK
+                self._emit('release1', sw[stuck], kw[stuck], tw[stuck])
+                self._emit('release2', sw[~stuck], kw[~stuck], tw[~stuck])
+                np.subtract.at(self.n_blocked, (sw[~stuck], site[~stuck]), 1)
+                self.loc[sw, site] = False
+                self._to_pool(sw, kw, tw)
+                self._wake(sw, site, tw, BLOCKED)
+
+            for sim in np.flatnonzero(repair):
+                self._repair(sim, self.t_repair[sim])
+
+    def _repair(self, sim, t):
+        candidates = np.flatnonzero(self.damage[sim] & (self.damage_time[sim] <= t))
+        x = self.rng.choice(candidates)
+        self.damage[sim, x] = False
+        self.n_events += 1
+        if self.log is not None:
+            self.log.add([sim], [t], 'repairedPos')
+        remaining = self.damage[sim].any()
+        self.t_repair[sim] = t + self.rng.exponential(self.repair_half_life) if remaining else np.inf
+        # polymerases held by this damage site now see ~damage?[x]
+        self._wake(np.array([sim]), np.array([x]), np.array([t]), STUCK)
+
+
+def simulate(params, variant, n_sims, t_max, seed=None, trace=None, batch_size=100):
+    """Run *n_sims* simulations of the model up to time *t_max*.
+
+    *params* is the header of ``cis.bc`` / ``trans.bc`` as returned by
+    :func:`bcs_pol.model.read_parameters` and *variant* is ``'cis'`` or
+    ``'trans'``.  Simulations run *batch_size* at a time.  The final
+    occupancy of each simulation is returned as it would be extracted from
+    the trace; if *trace* is a path, the events are also written there in
+    ``bcs`` layout, flushed after each batch.
+    """
+    rng = np.random.default_rng(seed)
+    polii_rows, ser7p_rows = [], []
+    n_events = 0
+    out = open(trace, 'w') if trace is not None else None
+    try:
+        for start in range(0, n_sims, batch_size):
+            size = min(batch_size, n_sims - start)
+            log = _EventLog() if out is not None else None
+            batch = _Batch(params, variant, size, t_max, rng, log)
+            batch.run()
+            polii_rows.append(batch.occ_polii)
+            ser7p_rows.append(batch.occ_ser7p)
+            n_events += batch.n_events
+            if out is not None:
+                log.write(out, size, variant, t_max)
+                out.flush()
+    finally:
+        if out is not None:
+            out.close()
+    G = int(params['gene_length'])
+    return SimulationResult(np.concatenate(polii_rows) if polii_rows else np.zeros((0, G), dtype=np.uint8),
+                            np.concatenate(ser7p_rows) if ser7p_rows else np.zeros((0, G), dtype=np.uint8),
+                            n_events)
+
+
+def occupancy_z_scores(rows_a, rows_b):
+    """Per-position two-sample z-scores of mean occupancy between two runs."""
+    a = np.asarray(rows_a, dtype=np.float64)
+    b = np.asarray(rows_b, dtype=np.float64)
+    se = np.sqrt(a.var(axis=0, ddof=1) / len(a) + b.var(axis=0, ddof=1) / len(b))
+    diff = a.mean(axis=0) - b.mean(axis=0)
+    return np.divide(diff, se, out=np.zeros_like(diff), where=se > 0)
+
+
+def check_against_trace(trace_path, params, variant, n_sims, t_max, seed=None):
+    """Compare simulated occupancy with a ``bcs`` trace of the same model.
+
+    Returns per-position z-scores for Pol II and Ser7P occupancy and the
+    fraction of positions beyond |z| > 3, which should stay near the 0.3 %
+    expected by chance when the simulator agrees with ``bcs``, and the
+    two-sample Kolmogorov-Smirnov p-values of the number of Pol II and
+    Ser7P molecules on the gene per simulation.
+    """
+    from scipy.stats import ks_2samp
+
+    gene_length = int(params['gene_length'])
+    polii_ref, ser7p_ref = extract_occupancy(trace_path, gene_length)
+    result = simulate(params, variant, n_sims, t_max, seed)
+    z_polii = occupancy_z_scores(result.polii_rows, polii_ref)
+    z_ser7p = occupancy_z_scores(result.ser7p_rows, ser7p_ref)
+    return {
+        'z_polii': z_polii,
+        'z_ser7p': z_ser7p,
+        'polii_outliers': np.mean(np.abs(z_polii) > 3),
+        'ser7p_outliers': np.mean(np.abs(z_ser7p) > 3),
+        'polii_ks_p': ks_2samp(result.polii_rows.sum(axis=1), polii_ref.sum(axis=1), method='asymp').pvalue,
+        'ser7p_ks_p': ks_2samp(result.ser7p_rows.sum(axis=1), ser7p_ref.sum(axis=1), method='asymp').pvalue,
+    }
+
+
+def main(argv=None):
+    """``bcs``-style command line: simulate a model file and write its trace."""
+    from .model import load_model
+
+    parser = argparse.ArgumentParser(prog='python -m bcs_pol.simulate',
+                                     description='Stand-in for bcs: simulate a cis/trans model and write a trace.')
+    parser.add_argument('model', help='cis.bc or trans.bc (with any header values)')
+    parser.add_argument('-s', '--sims', type=int, required=True, help='number of simulations')
+    parser.add_argument('-o', '--output', required=True, help='trace written in bcs layout')
+    parser.add_argument('-t', '--threads', type=int, default=1, help='accepted for bcs compatibility, unused')
+    parser.add_argument('--t-max', type=float, default=3600, help='seconds of simulated time (default 3600)')
+    parser.add_argument('--batch-size', type=int, default=20, help='simulations per written batch (default 20)')
+    parser.add_argument('--seed', type=int, help='random seed')
+    args = parser.parse_args(argv)
+    _, params, variant = load_model(args.model)
+    simulate(params, variant, args.sims, args.t_max, args.seed, args.output, args.batch_size)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""One trace read in one of the ways offered by the snapshot scripts.
+
+:func:`extract_snapshot` counts the final Pol II and Ser7P occupancy of a
+trace with exactly one reading mode (:data:`MODES`): a subset of the
+simulations through the index, the columnar store, per-simulation rows,
+densities at time checkpoints, or action timelines.  Each needs its own
+pass over the trace, so asking for two is an error rather than one
+silently winning.  Averages are always over the simulations actually
+read.  :func:`save_snapshot` writes the density arrays and whatever the
+mode recorded on the way; ``bcs-pol extract`` calls both for traces given
+on their own.
+"""
+import collections
+import os
+
+import numpy as np
+
+from .aggregate import DENSITY_SUFFIX, save_densities
+from .bootstrap import pack_occupancy
+from .parallel import extract_counts_parallel, extract_occupancy, extract_sims
+from .rates import extract_rates
+from .store import count_store, ensure_store
+from .timecourse import checkpoint_grid, extract_timecourse
+
+MODES = ('sim_subset', 'use_store', 'keep_per_sim', 'snapshot_interval', 'rate_time_bin')
+
+# per_sim rows, timecourse and rates are None unless their mode was used
+Snapshot = collections.namedtuple('Snapshot', ['polii', 'ser7p', 'sims', 'polii_per_sim', 'ser7p_per_sim',
+                                               'timecourse', 'rates'])
+
+
+def extract_snapshot(path, gene_length, sim_number=None, n_workers=1, sim_subset=None, use_store=False,
+                     keep_per_sim=False, snapshot_interval=None, rate_time_bin=None, rate_position_bin=None):
+    """Final occupancy of simulations 1..*sim_number* of *path*, or of *sim_subset*.
+
+    At most one of *sim_subset* (1-based simulation numbers), *use_store*,
+    *keep_per_sim*, *snapshot_interval* (seconds between checkpoints) and
+    *rate_time_bin* (seconds per time bin) may be set; without any, the
+    trace is counted by *n_workers* processes.  Returns a :class:`Snapshot`.
+    """
+    chosen = [name for name, value in zip(MODES, (sim_subset, use_store or None, keep_per_sim or None,
+                                                  snapshot_interval, rate_time_bin)) if value is not None]
+    if len(chosen) > 1:
+        raise ValueError(f"{' and '.join(chosen)} each read the trace their own way; set at most one of them")
+    polii_per_sim = ser7p_per_sim = timecourse = rates = None
+    if snapshot_interval is not None:
+        timecourse = extract_timecourse(path, gene_length, checkpoint_grid(path, snapshot_interval), sim_number)
+        polii, ser7p, sims = timecourse.polii_final, timecourse.ser7p_final, timecourse.sims
+    elif rate_time_bin is not None:
+        rates = extract_rates(path, gene_length, rate_time_bin, position_bin=rate_position_bin,
+                              sim_number=sim_number)
+        polii, ser7p, sims = rates.polii_final, rates.ser7p_final, rates.timeline.n_sims
+    elif use_store:
+        store = ensure_store(path)
+        polii, ser7p = count_store(store, gene_length, sim_number)
+        # sim_offset has a row per block, block 0 included, and one past the end
+        sims = max(len(store.sim_offset) - 2, 0)
+        sims = sims if sim_number is None else min(sim_number, sims)
+    elif keep_per_sim:
+        polii_per_sim, ser7p_per_sim = extract_occupancy(path, gene_length, sim_number, n_workers)
+        polii = polii_per_sim.sum(axis=0, dtype=np.float64)
+        ser7p = ser7p_per_sim.sum(axis=0, dtype=np.float64)
+        sims = len(polii_per_sim)
+    elif sim_subset is None:
+        polii, ser7p, sims = extract_counts_parallel(path, gene_length, sim_number, n_workers, count_sims=True)
+    else:
+        # seeks straight to the chosen simulations through the <file>.idx.npz sidecar index
+        polii, ser7p = extract_sims(path, gene_length, sim_subset, n_workers)
+        sims = len(np.unique(list(sim_subset)))
+    return Snapshot(polii, ser7p, sims, polii_per_sim, ser7p_per_sim, timecourse, rates)
+
+
+def save_snapshot(output_dir, label, snapshot):
+    """Write *snapshot* as ``<label>`` outputs in *output_dir*; returns the filenames.
+
+    These are the density ``.npz`` and ``.txt`` of ``extract`` and, when
+    recorded, ``<label>_polii_ser7p_density_timecourse.npz`` (one row per
+    checkpoint) and ``<label>_action_rates.npz``.
+    """
+    filenames = [os.path.join(output_dir, label + DENSITY_SUFFIX),
+                 os.path.join(output_dir, f'{label}_polii_ser7p_density_data.txt')]
+    per_sim = {}
+    if snapshot.polii_per_sim is not None:
+        per_sim = dict(polii_per_sim_packed=pack_occupancy(snapshot.polii_per_sim),
+                       ser7p_per_sim_packed=pack_occupancy(snapshot.ser7p_per_sim))
+    save_densities(*filenames, snapshot.polii, snapshot.ser7p, snapshot.sims, **per_sim)
+
+    timecourse = snapshot.timecourse
+    if timecourse is not None:
+        filenames.append(os.path.join(output_dir, f'{label}_polii_ser7p_density_timecourse.npz'))
+        sims = max(snapshot.sims, 1)
+        np.savez(filenames[-1], checkpoints=timecourse.checkpoints,
+                 positions=np.arange(1, len(snapshot.polii) + 1),
+                 polii_density_avg=timecourse.polii / sims, ser7p_density_avg=timecourse.ser7p / sims,
+                 polii_density_total=timecourse.polii, ser7p_density_total=timecourse.ser7p,
+                 sims_reached=timecourse.sims_reached)
+    if snapshot.rates is not None:
+        filenames.append(os.path.join(output_dir, f'{label}_action_rates.npz'))
+        snapshot.rates.timeline.save(filenames[-1])
+    return filenames
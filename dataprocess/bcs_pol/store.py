@@ -0,0 +1,134 @@
+"""Columnar binary event store converted once from a ``.bcs`` trace.
+
+The store is a directory, ``<trace>.store/`` by default, holding one raw
+binary file per column:
+
+    time.bin        float64 event time
+    action.bin      uint8 code into ``meta['actions']``
+    process.bin     uint32 code into ``meta['processes']``
+    i.bin, p.bin, d.bin
+                    int32 process parameters, -1 where the process has none
+    sim_offset.bin  int64 first row of each block, plus the total row count
+
+and a ``meta.json`` with the row count, the name tables and the size and
+mtime of the source trace.  Block 0 is anything before the first ``>``
+header and block k the k-th simulation, as in :mod:`bcs_pol.parser`.
+Columns are opened with ``np.memmap``, so extraction reads zero-copy slices
+instead of re-parsing the text.
+"""
+import collections
+import json
+import os
+
+import numpy as np
+
+from .compressed import open_trace
+from .parser import DEFAULT_CHUNK_SIZE, final_occupancy, iter_blocks, parse_event_rows
+
+STORE_SUFFIX = '.store'
+
+COLUMNS = {
+    'time': np.float64,
+    'action': np.uint8,
+    'process': np.uint32,
+    'i': np.int32,
+    'p': np.int32,
+    'd': np.int32,
+}
+
+EventStore = collections.namedtuple('EventStore', [*COLUMNS, 'sim_offset', 'actions', 'processes'])
+
+
+def convert(path, store_dir=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Convert the trace *path* into a columnar store and return its directory."""
+    store_dir = store_dir or path + STORE_SUFFIX
+    os.makedirs(store_dir, exist_ok=True)
+    meta_path = os.path.join(store_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)  # an interrupted conversion must not look complete
+    stat = os.stat(path)
+
+    tables = {'action': {}, 'process': {}}
+    sim_offset = [0]
+    rows = 0
+    outs = {name: open(os.path.join(store_dir, name + '.bin'), 'wb') for name in COLUMNS}
+    try:
+        with open_trace(path) as f:
+            for block, segment in iter_blocks(f, chunk_size):
+                while len(sim_offset) <= block:
+                    sim_offset.append(rows)
+                columns = parse_event_rows(segment)
+                for name, table in tables.items():
+                    names, inverse = np.unique(columns[name], return_inverse=True)
+                    codes = np.array([table.setdefault(bytes(n), len(table)) for n in names], dtype=np.int64)
+                    columns[name] = codes[inverse]
+                for name, dtype in COLUMNS.items():
+                    outs[name].write(columns[name].astype(dtype).tobytes())
+                rows += len(columns['time'])
+    finally:
+        for out in outs.values():
+            out.close()
+    if len(tables['action']) > np.iinfo(COLUMNS['action']).max + 1:
+        raise ValueError(f"{len(tables['action'])} distinct actions do not fit the action code type")
+    sim_offset.append(rows)
+    np.array(sim_offset, dtype=np.int64).tofile(os.path.join(store_dir, 'sim_offset.bin'))
+
+    meta = {
+        'rows': rows,
+        'actions': [name.decode('utf-8', 'replace') for name in tables['action']],
+        'processes': [name.decode('utf-8', 'replace') for name in tables['process']],
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return store_dir
+
+
+def open_store(store_dir):
+    """Open a converted store with its columns memory-mapped read only."""
+    with open(os.path.join(store_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    columns = {}
+    for name, dtype in COLUMNS.items():
+        if meta['rows']:
+            columns[name] = np.memmap(os.path.join(store_dir, name + '.bin'), dtype=dtype, mode='r',
+                                      shape=(meta['rows'],))
+        else:
+            columns[name] = np.empty(0, dtype=dtype)
+    sim_offset = np.fromfile(os.path.join(store_dir, 'sim_offset.bin'), dtype=np.int64)
+    return EventStore(sim_offset=sim_offset, actions=meta['actions'], processes=meta['processes'], **columns)
+
+
+def ensure_store(path, store_dir=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Return the store of *path*, converting it first if missing or stale."""
+    store_dir = store_dir or path + STORE_SUFFIX
+    stat = os.stat(path)
+    try:
+        with open(os.path.join(store_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['source_size'] == stat.st_size and meta['source_mtime_ns'] == stat.st_mtime_ns:
+            return open_store(store_dir)
+    except (OSError, KeyError, ValueError):
+        pass
+    return open_store(convert(path, store_dir, chunk_size))
+
+
+def count_store(store, gene_length, sim_number=None):
+    """Store-backed equivalent of :func:`bcs_pol.parser.extract_counts`."""
+    n_blocks = len(store.sim_offset) - 1
+    if sim_number is not None:
+        n_blocks = min(n_blocks, sim_number + 1)
+    polii_all = np.zeros(gene_length)
+    ser7p_all = np.zeros(gene_length)
+    if 'Pol_ii' not in store.actions or n_blocks == 0:
+        return polii_all, ser7p_all
+
+    stop = store.sim_offset[n_blocks]
+    rows = np.flatnonzero((store.action[:stop] == store.actions.index('Pol_ii')) & (store.p[:stop] >= 0))
+    block = np.searchsorted(store.sim_offset, rows, side='right') - 1
+    i = store.i[rows].astype(np.int64)
+    ser7p = store.p[rows] == 1
+    polii_all += final_occupancy(block, i, n_blocks, gene_length).sum(axis=0)
+    ser7p_all += final_occupancy(block[ser7p], i[ser7p], n_blocks, gene_length).sum(axis=0)
+    return polii_all, ser7p_all
@@ -0,0 +1,331 @@
+"""Mean-field surrogate of the cis and trans models for parameter screening.
+
+:func:`solve` integrates deterministic rate equations for the expected
+state of one gene, averaged over simulations, from ``t = 0`` to ``t_max``:
+
+* the pool / prePause cycle (``initiation_freq``, ``pause_location`` steps
+  at ``elongation_speed / 10``, release with probability
+  ``release / (release + termination)``, ``pause_dwell_time``) is linear,
+  so its compartments are exact in expectation;
+* postPause polymerases hop at ``elongation_speed`` onto a free site,
+  TASEP-style, with the mean occupancy of the next site as the exclusion
+  factor, and dissociate at ``1 / dissociation_time`` while blocked;
+* each site carries damage with probability ``1 / (uv_distance + 1)``;
+  ``RepairDamage`` takes one damage every ``repair_half_life`` on average,
+  so the fraction of sites still damaged and the per-site repair hazard
+  follow from a binomial damage count and a Poisson repair count;
+* a polymerase arriving in front of a damage either becomes the one held
+  by it (cis: re-entering with ``p=1``; trans: launching ``phos``) or
+  queues behind the one already there.  Held and queued polymerases
+  dissociate, the next in the queue takes over, and all of them elongate
+  again once the damage is repaired;
+* trans: whether ``phos`` has been launched in a simulation is tracked as a
+  probability, and ``p==0`` polymerases at ``i==2`` pick it up.
+
+The densities are the marks a trace replay leaves behind (see
+:mod:`bcs_pol.parser`): a ``Pol_ii`` on a site sets it and clears the site
+before, so each site's mark is a race between the two, and a polymerase
+leaving without a ``Pol_ii`` ahead (dissociating, or at the end of the
+gene) leaves its mark behind.  Sites are otherwise independent, so the
+surrogate gets the shape of the profiles right rather than every position;
+:func:`deviation` measures how far it is from stochastic results.
+
+Against 200 :func:`bcs_pol.simulate.simulate` runs of the shipped models
+(1000 sites, one hour, ``sigma=5``), the curve L1 distance / total ratio
+is 0.19 / 1.17 (cis) and 0.15 / 1.05 (trans) for Pol II, and 0.46 / 0.79
+(cis) and 0.20 / 1.10 (trans) for Ser7P.  Queues are mean-field and the
+front of the polymerases does not spread, so Pol II is overestimated far
+down the gene; cis Ser7P, marked mostly at damage sites, is the least
+accurate.  Use it to rank points, then confirm candidates with
+:func:`bcs_pol.simulate.simulate` or ``bcs``.  One point takes about half
+a second, a batch of points about a quarter of a second each.
+
+Any parameter in :data:`PARAMETERS` may be an array: all points are solved
+together, one row per point, as long as ``gene_length`` and
+``pause_location`` are shared.
+"""
+import collections
+
+import numpy as np
+from scipy.stats import binom, poisson
+
+from .aggregate import save_densities
+from .bootstrap import density_curves
+
+PARAMETERS = ('polymerase_count', 'initiation_freq', 'pause_dwell_time', 'pause_termination_probability',
+              'pause_release_probability', 'elongation_speed', 'uv_distance', 'repair_half_life',
+              'dissociation_time')
+
+SurrogateResult = collections.namedtuple('SurrogateResult', ['polii', 'ser7p', 'times', 'polii_time',
+                                                             'ser7p_time'])
+Deviation = collections.namedtuple('Deviation', ['rmse', 'max_abs', 'curve_l1', 'total_ratio'])
+
+_TINY = 1e-12
+
+
+def _damage_schedule(gene_length, uv_distance, repair_half_life, times):
+    """Fraction of sites still damaged and the per-site repair hazard at *times*.
+
+    With ``N`` damages laid down and ``K ~ Poisson(t / repair_half_life)``
+    repairs, ``E[(N - K)+] / gene_length`` of the sites are damaged and each
+    is repaired at ``P(N > K) / (repair_half_life E[(N - K)+])``.  Arrays
+    have shape ``(points, times)``.
+    """
+    q = 1.0 / (uv_distance + 1)
+    n = np.arange(int(binom.ppf(1 - 1e-12, gene_length, q.max())) + 2)
+    p_n = binom.pmf(n, gene_length, q[:, None])  # (points, n)
+    # E[(N - k)+] and P(N > k) for k = 0, 1, ...
+    excess = np.stack([(p_n * np.maximum(n - k, 0)).sum(axis=1) for k in n], axis=1)
+    above = np.stack([p_n[:, k + 1:].sum(axis=1) for k in n], axis=1)
+    p_k = poisson.pmf(n, (times / repair_half_life[:, None])[..., None])  # (points, times, k)
+    remaining = np.einsum('ptk,pk->pt', p_k, excess)
+    hazard = np.einsum('ptk,pk->pt', p_k, above) / (repair_half_life[:, None] * np.maximum(remaining, _TINY))
+    return remaining / gene_length, hazard
+
+
+def _race(marked, rest, gain, loss, to_rest, bound, dt):
+    """One step of a site mark split into "polymerase present" and "left behind".
+
+    *gain* sets the mark, *loss* clears a present mark and *to_rest* turns
+    it into a left-behind one, which *gain* also clears; all are rates per
+    site.  Left-behind marks are capped at *bound*, the chance that a
+    polymerase got there at all.
+    """
+    rate = gain + loss + to_rest
+    target = np.minimum(gain / np.maximum(rate, _TINY), 1)
+    created = marked * to_rest * dt
+    marked = target + (marked - target) * np.exp(-rate * dt)
+    rest = rest * np.exp(-gain * dt) + created
+    return marked, np.maximum(np.minimum(rest, bound - marked), 0)
+
+
+def solve(params, variant, t_max, dt=2.0, record_every=None):
+    """Expected Pol II and Ser7P densities of *params* at time *t_max*.
+
+    *params* is a model header (see :func:`bcs_pol.model.read_parameters`)
+    in which any of :data:`PARAMETERS` may be a sequence, one value per
+    point.  Returns a :class:`SurrogateResult` whose ``polii`` and ``ser7p``
+    have shape ``(points, gene_length)``, or ``(gene_length,)`` when every
+    parameter is a scalar, comparable with the ``*_density_avg`` arrays of
+    ``snapshot_cis.py``.  With *record_every* seconds, the densities are
+    also kept at those times in ``polii_time`` / ``ser7p_time``.
+    """
+    trans = variant == 'trans'
+    G = int(params['gene_length'])
+    entry = int(params['pause_location']) + 1
+    scalar = all(np.ndim(params[name]) == 0 for name in PARAMETERS)
+    values = np.broadcast_arrays(*(np.atleast_1d(np.asarray(params[name], dtype=np.float64))
+                                   for name in PARAMETERS))
+    n_pols, initiation, dwell, termination, release, speed, uv_distance, repair, dissociation = values
+    B = len(n_pols)
+    release = release / (release + termination)
+    step_rate = speed / 10
+    k_off = 1.0 / dissociation[:, None]
+    v = speed[:, None]
+
+    n_steps = max(1, int(np.ceil(t_max / dt)))
+    dt = t_max / n_steps
+    damaged, repair_hazard = _damage_schedule(G, uv_distance, repair, (np.arange(n_steps) + 0.5) * dt)
+    per_damaged = np.divide(1.0, damaged, out=np.zeros_like(damaged), where=damaged > 0)
+    ahead = np.ones(G)  # damage on site j+1 holds a polymerase on site j
+    ahead[G - 1] = 0
+
+    # sites a polymerase can have reached by each step, with a wide margin for the spread of the hops
+    travelled = speed.max() * np.arange(1, n_steps + 1) * dt
+    widths = np.minimum(G, entry + 16 + (travelled + 10 * np.sqrt(travelled)).astype(np.int64))
+
+    # free polymerases: pool, prePause steps, pause dwell
+    pool = n_pols.copy()
+    prepause = np.zeros((B, entry - 1))
+    pausing = np.zeros(B)
+    # elongating (or blocked) polymerases per site, p==0 and p==1
+    moving = np.zeros((2, B, G))
+    # polymerases held or queued by a damage on the next site, p==0 and p==1
+    stopped = np.zeros((2, B, G))
+    reached = np.zeros((B, G))  # damage ahead and its site marked (Pol II)
+    reached_ser7p = np.zeros((B, G))  # damage ahead and its site marked (Ser7P)
+    # marks of elongating polymerases, Pol II and Ser7P: present / left behind
+    mark, left = np.zeros((2, B, G)), np.zeros((2, B, G))
+    phos = np.zeros(B)  # probability that phos has been launched
+    distance = np.maximum(np.arange(G) - entry, 0)
+
+    record = []
+    record_step = max(1, int(round(record_every / dt))) if record_every else 0
+    for step in range(n_steps):
+        W = widths[step]
+        delta = damaged[:, step:step + 1] * ahead[:W]
+        # x / delta where there is damage ahead; every such x is 0 where there is none
+        per_damage = per_damaged[:, step:step + 1] * ahead[:W]
+        # a site is reachable when no damage is left between the first site and it
+        reach = (1 - damaged[:, step:step + 1]) ** distance[:W]
+        mu = repair_hazard[:, step:step + 1]
+        # chance of at least one polymerase, Pol II and Ser7P, placed independently
+        occupied = np.empty((2, B, W))
+        np.add(moving[0, :, :W], moving[1, :, :W], out=occupied[0])
+        occupied[1] = moving[1, :, :W]
+        occupied = np.maximum(-np.expm1(-occupied), _TINY)
+        # a polymerase waits while the next site has a location beacon; the beacon is set and
+        # cleared with the Pol II mark, except that dissociating clears only the beacon
+        beacon_ahead = np.zeros((B, W))
+        beacon_ahead[:, :W - 1] = mark[0, :, 1:W]
+
+        # hops j -> j+1 (the last site leaves the gene) and dissociation of blocked polymerases
+        hop = v * moving[:, :, :W] * (1 - beacon_ahead)
+        blocked_off = k_off * moving[:, :, :W] * beacon_ahead
+
+        arrive = np.zeros((2, B, W))
+        arrive[:, :, 1:] = hop[:, :, :W - 1]
+        entering = pausing / dwell
+        arrive_free = np.zeros((2, B, W))  # arrivals that do not wait for a free site
+        arrive_free[0, :, entry] = entering
+        took = np.zeros((B, W))  # p==0 -> 1 at i==2 on the way through (trans)
+        if trans and entry <= 2:
+            # a p==0 polymerase choosing at i==2 takes phos half of the time
+            took[:, 2] = 0.5 * phos * (arrive[0, :, 2] + arrive_free[0, :, 2]) * (1 - delta[:, 2])
+
+        # arrivals in front of a damage: the first is held by it, later ones queue
+        arrivals = arrive + arrive_free
+        stop = arrivals * delta
+        total_stopped = stopped[0, :, :W] + stopped[1, :, :W]
+        vacant = np.maximum(1 - total_stopped * per_damage, 0)
+        first = (stop[0] + stop[1]) * vacant
+        # the held one gets p=1: cis on meeting the damage, trans at i==2 once phos is there,
+        # which holding it there launches anyway
+        if not trans:
+            converted = stop[0] * vacant
+        else:
+            converted = np.zeros((B, W))
+            if entry <= 2:
+                converted[:, 2] = stop[0, :, 2]
+        # a held polymerase that dissociates is replaced from the queue (cis: p=1 again)
+        held = np.minimum(total_stopped, delta)
+        replaced = k_off * held * np.minimum((total_stopped - held) * per_damage, 1)
+        if not trans:
+            converted += np.minimum(replaced, stopped[0, :, :W] * k_off)
+        stopped_off = k_off * stopped[:, :, :W]
+        released = mu * stopped[:, :, :W]
+
+        # Pol_ii re-emitted in place with p=1 (converted or took), and the marks at damage sites
+        reenter_ser7p = converted + took
+        reached_now, reached_ser7p_now = reached[:, :W], reached_ser7p[:, :W]
+        reached_gain = first * (1 - reached_now * per_damage)
+        ser7p_first = np.maximum((stop[1] + converted) * (1 - reached_ser7p_now * per_damage), 0)
+        # only simulations without damage before a site reach it, so its mark is bounded by reach too
+        reached[:, :W] = np.maximum(np.minimum(reached_now + (reached_gain - mu * reached_now) * dt, delta * reach), 0)
+        reached_ser7p[:, :W] = np.maximum(np.minimum(reached_ser7p_now + (ser7p_first - mu * reached_ser7p_now) * dt,
+                                                     reached[:, :W]), 0)
+
+        # marks of elongating polymerases, Pol II and Ser7P
+        passing = 1 - delta
+        departed = np.zeros((2, B, W))
+        np.add(hop[0, :, :W - 1], hop[1, :, :W - 1], out=departed[0, :, :W - 1])
+        np.add(hop[1, :, :W - 1], reenter_ser7p[:, 1:], out=departed[1, :, :W - 1])
+        lost = np.empty((2, B, W))
+        np.add(blocked_off[0], blocked_off[1], out=lost[0])
+        lost[1] = blocked_off[1]
+        if W == G:
+            lost[0, :, G - 1] += hop[0, :, G - 1] + hop[1, :, G - 1]
+            lost[1, :, G - 1] += hop[1, :, G - 1]
+        # a Pol_ii on the site sets its mark, one on the next site clears it; sites holding several
+        # polymerases are common, so marks race against departures rather than follow occupancy
+        into_moving = arrivals * passing
+        gain = np.empty((2, B, W))
+        np.add(into_moving[0], into_moving[1], out=gain[0])
+        np.add(into_moving[1], took, out=gain[1])
+        mark[:, :, :W], left[:, :, :W] = _race(mark[:, :, :W], left[:, :, :W], gain, departed / occupied,
+                                               lost / occupied, reach, dt)
+
+        # populations
+        into_moving[0] -= took
+        into_moving[1] += took
+        into_stopped = stop
+        into_stopped[0] -= converted
+        into_stopped[1] += converted
+        moving[:, :, :W] += (into_moving - hop - blocked_off + released) * dt
+        stopped[:, :, :W] += (into_stopped - stopped_off - released) * dt
+        np.maximum(moving[:, :, :W], 0, out=moving[:, :, :W])
+        np.maximum(stopped[:, :, :W], 0, out=stopped[:, :, :W])
+
+        returned = blocked_off.sum(axis=(0, 2)) + stopped_off.sum(axis=(0, 2))
+        if W == G:
+            returned += hop[:, :, G - 1].sum(axis=0)
+        started = initiation * pool
+        if prepause.shape[1]:
+            flow = step_rate[:, None] * prepause
+            decided = flow[:, -1]
+            prepause[:, 0] += (started - flow[:, 0]) * dt
+            prepause[:, 1:] += (flow[:, :-1] - flow[:, 1:]) * dt
+        else:
+            decided = started
+        pool += (returned + (1 - release) * decided - started) * dt
+        pausing += (release * decided - entering) * dt
+        if trans:
+            phos += (1 - phos) * (1 - np.exp(-first.sum(axis=1) * dt))
+
+        if record_step and (step + 1) % record_step == 0:
+            record.append(((step + 1) * dt,) + _marks(mark, left, reached, reached_ser7p))
+
+    polii, ser7p = _marks(mark, left, reached, reached_ser7p)
+    record_times = np.array([t for t, _, _ in record])
+    polii_time = np.array([a for _, a, _ in record]).reshape(len(record), B, G)
+    ser7p_time = np.array([b for _, _, b in record]).reshape(len(record), B, G)
+    if scalar:
+        return SurrogateResult(polii[0], ser7p[0], record_times, polii_time[:, 0], ser7p_time[:, 0])
+    return SurrogateResult(polii, ser7p, record_times, polii_time, ser7p_time)
+
+
+def _marks(mark, left, reached, reached_ser7p):
+    return np.minimum(mark[0] + left[0] + reached, 1.0), np.minimum(mark[1] + left[1] + reached_ser7p, 1.0)
+
+
+def save_surrogate(npz_path, polii, ser7p, **arrays):
+    """Write one point (or a batch, one row per point) as a ``*_polii_ser7p_density_arrays.npz``.
+
+    The expected densities are the averages; they are stored as the totals
+    of a single simulation, and ``surrogate=True`` tells them apart from
+    extracted counts.
+    """
+    save_densities(npz_path, None, np.asarray(polii, dtype=np.float64), np.asarray(ser7p, dtype=np.float64), 1,
+                   surrogate=True, **arrays)
+
+
+def deviation(polii, ser7p, polii_ref, ser7p_ref, sigma=5, window=None):
+    """How far surrogate densities are from stochastic ones, per quantity.
+
+    Returns ``{'polii': Deviation, 'ser7p': Deviation}`` with the RMS and
+    largest absolute difference of the average occupancy, the L1 distance
+    between the smoothed, normalised curves of ``density8graphs_*.py`` (0
+    for the same shape, at most 2) and the ratio of the summed densities.
+    *window* is an inclusive ``(first, last)`` range of 1-based positions.
+    """
+    first, last = window or (1, len(polii))
+    part = slice(first - 1, last)
+    curves = density_curves(np.asarray(polii, dtype=np.float64), np.asarray(ser7p, dtype=np.float64), sigma)
+    curves_ref = density_curves(np.asarray(polii_ref, dtype=np.float64), np.asarray(ser7p_ref, dtype=np.float64),
+                                sigma)
+    result = {}
+    for name, values, reference in (('polii', polii, polii_ref), ('ser7p', ser7p, ser7p_ref)):
+        difference = (np.asarray(values, dtype=np.float64) - reference)[part]
+        total = np.sum(reference[part])
+        result[name] = Deviation(float(np.sqrt(np.mean(difference ** 2))), float(np.abs(difference).max()),
+                                 float(np.abs(curves[name] - curves_ref[name])[part].sum()),
+                                 float(np.sum(values[part]) / total) if total > 0 else np.nan)
+    return result
+
+
+def check_against_simulation(params, variant, t_max, n_sims=200, seed=None, sigma=5, window=None, dt=2.0):
+    """:func:`deviation` of the surrogate from :func:`bcs_pol.simulate.simulate` runs of *params*."""
+    from .simulate import simulate
+
+    reference = simulate(params, variant, n_sims, t_max, seed)
+    result = solve(params, variant, t_max, dt)
+    return deviation(result.polii, result.ser7p, reference.polii_rows.mean(axis=0),
+                     reference.ser7p_rows.mean(axis=0), sigma, window)
+
+
+def check_against_densities(npz_path, params, variant, t_max, sigma=5, window=None, dt=2.0):
+    """:func:`deviation` from a density ``.npz`` extracted from ``bcs`` runs lasting *t_max*."""
+    with np.load(npz_path) as data:
+        polii_ref, ser7p_ref = data['polii_density_avg'], data['ser7p_density_avg']
+    result = solve(params, variant, t_max, dt)
+    return deviation(result.polii, result.ser7p, polii_ref, ser7p_ref, sigma, window)
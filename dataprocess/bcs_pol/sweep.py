@@ -0,0 +1,125 @@
+"""Parameter sweeps over the model header with a content-addressed result cache.
+
+Each sweep point is a copy of ``cis.bc`` / ``trans.bc`` with some header
+values replaced.  It is simulated with an external command (``bcs`` by
+default; any program taking the same arguments can stand in), the trace goes
+straight through :func:`bcs_pol.parser.extract_counts`, and the densities are
+stored as ``<cache_dir>/<key>.npz``.  The key hashes the rewritten model
+text, its parameters, the simulation count, the simulator command and
+``EXTRACTOR_VERSION``, so a point finished by any earlier sweep with the
+same simulator is loaded instead of run again.
+:data:`NUMPY_COMMAND` runs :mod:`bcs_pol.simulate` in place of ``bcs``.
+"""
+import collections
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from .model import read_parameters, write_parameters
+from .parser import EXTRACTOR_VERSION, extract_counts
+
+# {sims}, {threads}, {output} and {model} are filled in for every run
+BCS_COMMAND = ('bcs', '-s', '{sims}', '-t', '{threads}', '-o', '{output}', '{model}')
+NUMPY_COMMAND = (sys.executable, '-m', 'bcs_pol.simulate') + BCS_COMMAND[1:]
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SweepPoint = collections.namedtuple('SweepPoint', ['overrides', 'params', 'key', 'polii', 'ser7p', 'sim_number',
+                                                   'cached'])
+
+
+def grid(**values):
+    """Every combination of the given parameter values, as a list of dicts."""
+    names = list(values)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(values[name] for name in names))]
+
+
+def cache_key(text, sim_number, command=BCS_COMMAND):
+    """Hex digest identifying the result of *sim_number* runs of model *text* by *command*.
+
+    The command is part of the key so that ``bcs`` never loads results of a
+    stand-in such as :data:`NUMPY_COMMAND`; only the name of its program
+    counts, not the directory it was found in.
+    """
+    simulator = [os.path.basename(command[0])] + list(command[1:])
+    payload = json.dumps({'model': text, 'params': read_parameters(text), 'sims': sim_number,
+                          'simulator': simulator, 'extractor': EXTRACTOR_VERSION}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def simulator_environment():
+    """Environment for simulator commands, with this package importable for :data:`NUMPY_COMMAND`."""
+    path = os.environ.get('PYTHONPATH')
+    return dict(os.environ, PYTHONPATH=_PACKAGE_ROOT if not path else os.pathsep.join([_PACKAGE_ROOT, path]))
+
+
+def load_point(path):
+    """``(polii, ser7p)`` totals of a cached point, or ``None`` if it is missing or unreadable."""
+    try:
+        with np.load(path) as data:
+            return data['polii'], data['ser7p']
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _run_point(text, key, sim_number, cache_dir, command, threads, keep_trace):
+    """Simulate, extract and cache one point; returns ``(polii, ser7p)``."""
+    params = read_parameters(text)
+    with tempfile.TemporaryDirectory(prefix=key[:12], dir=cache_dir) as work:
+        model = os.path.join(work, 'model.bc')
+        trace = os.path.join(work, 'trace.bcs')
+        with open(model, 'w') as f:
+            f.write(text)
+        args = [arg.format(sims=sim_number, threads=threads, output=trace, model=model) for arg in command]
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL, env=simulator_environment())
+        polii, ser7p = extract_counts(trace, int(params['gene_length']), sim_number)
+
+        tmp = os.path.join(work, 'result.npz')
+        np.savez(tmp, polii=polii, ser7p=ser7p, sim_number=sim_number, params=json.dumps(params),
+                 model=text, extractor_version=EXTRACTOR_VERSION)
+        os.replace(tmp, os.path.join(cache_dir, key + '.npz'))
+        if keep_trace:
+            os.replace(trace, os.path.join(cache_dir, key + '.bcs'))
+    return polii, ser7p
+
+
+def run_sweep(model_path, points, sim_number, cache_dir, command=BCS_COMMAND, cores=None, threads_per_run=1,
+              keep_traces=False):
+    """Run every parameter override in *points* against the model *model_path*.
+
+    Points already in *cache_dir* are loaded, duplicates are run once, and
+    the rest run concurrently, ``cores // threads_per_run`` at a time
+    (*cores* defaults to all CPUs).  Returns one :class:`SweepPoint` per
+    entry of *points*, in order.  With *keep_traces* the ``.bcs`` output is
+    kept next to the cached densities as ``<key>.bcs``.
+    """
+    with open(model_path) as f:
+        base = f.read()
+    os.makedirs(cache_dir, exist_ok=True)
+    texts = [write_parameters(base, overrides) for overrides in points]
+    keys = [cache_key(text, sim_number, command) for text in texts]
+
+    results, cached = {}, set()
+    for key in set(keys):
+        loaded = load_point(os.path.join(cache_dir, key + '.npz'))
+        if loaded is not None:
+            results[key] = loaded
+            cached.add(key)
+
+    pending = {key: text for key, text in zip(keys, texts) if key not in results}
+    n_parallel = max(1, (cores or os.cpu_count() or 1) // threads_per_run)
+    with concurrent.futures.ThreadPoolExecutor(n_parallel) as executor:
+        futures = {key: executor.submit(_run_point, text, key, sim_number, cache_dir, command, threads_per_run,
+                                        keep_traces)
+                   for key, text in pending.items()}
+        for key, future in futures.items():
+            results[key] = future.result()
+
+    return [SweepPoint(dict(overrides), read_parameters(text), key, *results[key], sim_number, key in cached)
+            for overrides, text, key in zip(points, texts, keys)]
@@ -0,0 +1,165 @@
+"""Synthetic ``.bcs`` traces for benchmarking the extraction pipeline.
+
+The traces have the layout ``bcs`` writes for ``cis.bc`` / ``trans.bc``:
+a ``>`` header per simulation, then tab-separated
+``time  action  process  [i <i>  [p <p>  [d <d>]]]`` lines.  Each
+simulation starts with the ``MakeDamage`` pass over the gene, followed by
+polymerases that leave the pool, elongate one site per ``elongation2`` /
+``Pol_ii`` pair, and either ``unbind`` at the end of the gene or stall at a
+damage site (re-entering with ``p=1``, or ``d=1`` in trans) and dissociate.
+The event mix and rates are plausible, not a simulation of the model; use
+:mod:`bcs_pol.simulate` when the statistics matter.
+"""
+import numpy as np
+
+ARRIVAL_INTERVAL = 0.7  # seconds between polymerases leaving the pause site
+STEP_TIME = 3.0  # seconds per elongation step
+DISSOCIATION_STEPS = 1800  # mean steps before a polymerase dissociates on its own
+STALL_PROBABILITY = 0.7  # chance that a damage site ahead (not yet repaired) stalls a polymerase
+UV_DISTANCE = 200
+
+# code -> (action, process, parameters written); 'ipd' adds d in trans traces
+_EVENTS = (
+    ('pass', 'MakeDamage', 'i'),
+    ('damageDNA', 'MakeDamage', 'i'),
+    ('reuse', 'RNAPolII_pool', ''),
+    ('elongation1', 'RNAPolII_prePause', 'i'),
+    ('release', 'RNAPolII_prePause', 'i'),
+    ('dwell', 'RNAPolII_prePause', 'i'),
+    ('Pol_ii', 'RNAPolII_postPause', 'ipd'),
+    ('elongation2', 'RNAPolII_postPause', 'ipd'),
+    ('release', 'RNAPolII_postPause', 'ipd'),
+    ('release1', 'RNAPolII_postPause', 'ipd'),
+    ('release2', 'RNAPolII_postPause', 'ipd'),
+    ('unbind', 'RNAPolII_postPause', 'ipd'),
+    ('repairedPos', 'RepairDamage', ''),
+)
+(PASS, DAMAGE, REUSE, ELONGATION1, PAUSE_RELEASE, DWELL, POLII, ELONGATION2,
+ RELEASE, RELEASE1, RELEASE2, UNBIND, REPAIRED) = range(len(_EVENTS))
+
+
+def _runs(rng, n_runs, t0, damage_sites, gene_length, trans):
+    """Event columns of *n_runs* polymerases leaving the pause site after *t0*."""
+    start = t0 + np.cumsum(rng.exponential(ARRIVAL_INTERVAL, n_runs))
+    ahead = damage_sites[damage_sites > 2] - 1
+    passed = rng.geometric(STALL_PROBABILITY, n_runs) - 1
+    if len(ahead) == 0:
+        stall = np.full_like(passed, gene_length)  # no damage ahead: every run reaches the end of the gene
+    else:
+        stall = np.where(passed < len(ahead), ahead[np.minimum(passed, len(ahead) - 1)], gene_length)
+    drop = 2 + rng.geometric(1.0 / DISSOCIATION_STEPS, n_runs)
+    end = np.minimum(stall, drop)
+    outcome = np.where(end == gene_length, UNBIND, np.where(end == stall, RELEASE1, RELEASE2))
+    p = (trans & (rng.random(n_runs) < 0.3)).astype(np.int64)
+
+    moves = end - 2
+    # per run: 4 pause lines, Pol_ii at 2, 2 lines per move, then the closing lines;
+    # entering the end of the gene gives unbind in place of the last Pol_ii
+    closing = np.where(outcome == UNBIND, 0, np.where(outcome == RELEASE1, 3, 2))
+    length = 5 + 2 * moves + closing
+    run = np.repeat(np.arange(n_runs), length)
+    k = np.arange(len(run)) - np.repeat(np.cumsum(length) - length, length)
+
+    step = k - 4  # 0 = Pol_ii at 2, odd = elongation2, even > 0 = Pol_ii
+    in_walk = (step >= 0) & (step <= 2 * moves[run])
+    code = np.full(len(run), POLII)
+    code[k == 0], code[k == 1], code[k == 2], code[k == 3] = REUSE, ELONGATION1, PAUSE_RELEASE, DWELL
+    code[in_walk & (step % 2 == 1)] = ELONGATION2
+    tail = step - 2 * moves[run]  # 1.. for the closing lines
+    last = outcome[run]
+    code[(tail == 0) & (last == UNBIND)] = UNBIND
+    code[(tail == 1) & (last == RELEASE2)] = RELEASE
+    code[(tail == 2) & (last == RELEASE2)] = RELEASE2
+    code[(tail == 1) & (last == RELEASE1)] = POLII  # re-entry at the damage site
+    code[(tail == 2) & (last == RELEASE1)] = RELEASE
+    code[(tail == 3) & (last == RELEASE1)] = RELEASE1
+
+    i = np.where(step >= 0, 2 + np.clip(step, 0, None) // 2, np.where(k == 1, 0, 1))
+    i = np.minimum(i, end[run])
+    i[(tail >= 1)] = end[run][tail >= 1]
+    p_col = np.repeat(p, length)
+    d_col = np.zeros(len(run), dtype=np.int64)
+    stalled = (tail >= 1) & (last == RELEASE1)
+    if trans:
+        d_col[stalled] = 1
+    else:
+        p_col[stalled] = 1
+
+    # pause steps are quick, each elongation step and the final wait take longer
+    delay = rng.exponential(0.3, len(run))
+    delay[in_walk & (step % 2 == 1)] = rng.exponential(STEP_TIME, np.count_nonzero(in_walk & (step % 2 == 1)))
+    waiting = (tail >= 1) & (code == RELEASE)
+    delay[waiting] = rng.exponential(600.0, np.count_nonzero(waiting))
+    time = np.cumsum(delay)
+    time += np.repeat(start - time[np.cumsum(length) - length], length)
+    return time, code, i, p_col, d_col
+
+
+def simulation_events(rng, n_events, gene_length=1000, variant='cis'):
+    """Time-ordered event columns ``(time, code, i, p, d)`` of one simulation."""
+    trans = variant == 'trans'
+    damaged = rng.random(gene_length) < 1.0 / (UV_DISTANCE + 1)
+    setup_time = np.cumsum(rng.exponential(1e-3, gene_length))
+    columns = [(setup_time, np.where(damaged, DAMAGE, PASS), np.arange(gene_length),
+                np.zeros(gene_length, dtype=np.int64), np.zeros(gene_length, dtype=np.int64))]
+    damage_sites = np.flatnonzero(damaged)
+
+    remaining = n_events - gene_length
+    t0 = setup_time[-1]
+    while remaining > 0:
+        mean_length = 2 * min(gene_length, DISSOCIATION_STEPS) // 3 + 8
+        run = _runs(rng, max(1, remaining // mean_length + 1), t0, damage_sites, gene_length, trans)
+        columns.append(run)
+        remaining -= len(run[0])
+        t0 = run[0].max(initial=t0)
+    n_repairs = len(damage_sites)
+    columns.append((rng.uniform(setup_time[-1], t0, n_repairs), np.full(n_repairs, REPAIRED),
+                    np.full(n_repairs, -1), np.zeros(n_repairs, dtype=np.int64), np.zeros(n_repairs, dtype=np.int64)))
+
+    time, code, i, p, d = (np.concatenate(column) for column in zip(*columns))
+    order = np.argsort(time, kind='stable')[:n_events]
+    return time[order], code[order], i[order], p[order], d[order]
+
+
+def format_events(time, code, i, p, d, variant='cis'):
+    """Render event columns as trace lines (a single string)."""
+    heads = []
+    for action, process, params in _EVENTS:
+        if params == 'ipd':
+            heads.append((f'\t{action}\t{process}\ti\t', 'trans' if variant == 'trans' else 'cis'))
+        else:
+            heads.append((f'\t{action}\t{process}' + ('\ti\t' if params else ''), params))
+    lines = []
+    for t, c, site, pp, dd in zip(time.tolist(), code.tolist(), i.tolist(), p.tolist(), d.tolist()):
+        head, params = heads[c]
+        if params == 'cis':
+            lines.append(f'{t:.6f}{head}{site}\tp\t{pp}\n')
+        elif params == 'trans':
+            lines.append(f'{t:.6f}{head}{site}\tp\t{pp}\td\t{dd}\n')
+        elif params:
+            lines.append(f'{t:.6f}{head}{site}\n')
+        else:
+            lines.append(f'{t:.6f}{head}\n')
+    return ''.join(lines)
+
+
+def write_trace(path, n_sims=None, target_bytes=None, events_per_sim=20000, gene_length=1000,
+                variant='cis', seed=0):
+    """Write a synthetic trace to *path* and return the number of simulations.
+
+    Give either *n_sims*, or *target_bytes* to keep adding simulations until
+    the file reaches that size.
+    """
+    if (n_sims is None) == (target_bytes is None):
+        raise ValueError('give exactly one of n_sims and target_bytes')
+    rng = np.random.default_rng(seed)
+    written = 0
+    sims = 0
+    with open(path, 'w') as f:
+        while (n_sims is not None and sims < n_sims) or (target_bytes is not None and written < target_bytes):
+            text = '>=======\n' + format_events(*simulation_events(rng, events_per_sim, gene_length, variant),
+                                                 variant=variant)
+            f.write(text)
+            written += len(text)
+            sims += 1
+    return sims
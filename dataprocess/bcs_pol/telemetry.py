@@ -0,0 +1,198 @@
+"""Stage timers and progress reporting for long extractions.
+
+A :class:`Telemetry` object times named stages (wall and CPU seconds) and,
+while a stage is running, counts what the trace readers pull from disk:
+every file opened through :func:`bcs_pol.compressed.open_trace` is wrapped
+so each chunk read (tens of MB) adds its bytes, newlines and ``>`` headers.
+Nothing is timed per line, so it is cheap enough to leave on.  A progress
+line with percent complete, rates, ETA and peak memory is printed at most
+every *interval* seconds, and :meth:`Telemetry.summary` returns everything
+as a JSON-ready dict.
+
+Byte ranges read by worker processes in :mod:`bcs_pol.parallel` are
+counted in the parent when each range finishes.
+"""
+import contextlib
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_active = None
+
+
+def active():
+    """The telemetry of the running stage, or ``None``."""
+    return _active
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (NaN if unknown)."""
+    if resource is None:
+        return float('nan')
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is bytes on macOS, KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def _duration(seconds):
+    seconds = int(seconds)
+    return f'{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+class _CountingReader:
+    """Binary file wrapper that reports each chunk read to a :class:`Telemetry`."""
+
+    def __init__(self, f, telemetry, size):
+        self._f = f
+        self._telemetry = telemetry
+        self._size = size
+        self._position = 0
+        self._line_start = True
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        if data:
+            self._position += len(data)
+            headers = data.count(b'\n>') + (self._line_start and data[:1] == b'>')
+            self._line_start = data[-1:] == b'\n'
+            self._telemetry.add(len(data), data.count(b'\n'), headers, self._position, self._size)
+        return data
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def watch(f, size=None):
+    """Wrap the binary file *f* for the running stage; *f* itself if none."""
+    return f if _active is None else _CountingReader(f, _active, size)
+
+
+class Telemetry:
+    """Per-stage timers, byte/line/simulation counters and progress lines.
+
+    Call :meth:`begin` with a stage name to start timing (ending the stage
+    before it) and :meth:`finish` at the end, or use :meth:`stage` as a
+    context manager.  Progress lines go to *stream* (stderr by default)
+    at most every *interval* seconds; ``None`` disables them.
+    """
+
+    def __init__(self, interval=30.0, stream=None):
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.stages = {}
+        self.bytes_read = 0
+        self.lines = 0
+        self.sims = 0
+        self._current = None
+        self._previous = None
+        self._started = time.perf_counter()
+
+    def begin(self, name):
+        global _active
+        self.end()
+        self._previous, _active = _active, self
+        self._current = name
+        self._stage_wall = time.perf_counter()
+        self._stage_cpu = time.process_time()
+        self._stage_counts = (self.bytes_read, self.lines, self.sims)
+        self._pass_wall = self._stage_wall
+        self._next_report = self._stage_wall + (self.interval or 0)
+
+    def end(self):
+        """Stop timing the running stage, if any."""
+        global _active
+        if self._current is None:
+            return
+        wall = time.perf_counter() - self._stage_wall
+        cpu = time.process_time() - self._stage_cpu
+        stage = self.stages.setdefault(self._current, {'wall_s': 0.0, 'cpu_s': 0.0, 'bytes': 0, 'lines': 0,
+                                                       'sims': 0})
+        stage['wall_s'] += wall
+        stage['cpu_s'] += cpu
+        for key, before, now in zip(('bytes', 'lines', 'sims'), self._stage_counts,
+                                    (self.bytes_read, self.lines, self.sims)):
+            stage[key] += now - before
+        self._current = None
+        _active = self._previous
+
+    def finish(self):
+        """End the running stage and print a closing summary line."""
+        self.end()
+        if self.interval is not None:
+            total = time.perf_counter() - self._started
+            stages = ', '.join(f"{name} {stage['wall_s']:.1f}s" for name, stage in self.stages.items())
+            print(f'[telemetry] done in {total:.1f}s ({stages}), peak RSS {peak_rss_mb():.0f} MB', file=self.stream)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.begin(name)
+        try:
+            yield self
+        finally:
+            self.end()
+
+    def add(self, n_bytes=0, lines=0, sims=0, position=None, size=None):
+        """Count work done; prints a progress line when one is due."""
+        self.bytes_read += n_bytes
+        self.lines += lines
+        self.sims += sims
+        if position is not None and position <= n_bytes:
+            self._pass_wall = time.perf_counter()  # a new file pass started
+        if self.interval is None:
+            return
+        now = time.perf_counter()
+        if now >= self._next_report:
+            self._next_report = now + self.interval
+            self._progress(now, position, size)
+
+    def _progress(self, now, position, size):
+        elapsed = now - self._stage_wall
+        done_bytes = self.bytes_read - self._stage_counts[0]
+        parts = [f'[{self._current}] {_duration(elapsed)}', f'{done_bytes / 1e6:.0f} MB read']
+        if position is not None and size:
+            fraction = min(position / size, 1.0)
+            parts.append(f'{100 * fraction:.1f}%')
+            pass_elapsed = now - self._pass_wall
+            if fraction > 0:
+                parts.append(f'ETA {_duration(pass_elapsed * (1 - fraction) / fraction)}')
+        if elapsed > 0:
+            parts.append(f'{done_bytes / 1e6 / elapsed:.1f} MB/s')
+            parts.append(f'{(self.lines - self._stage_counts[1]) / elapsed:.0f} lines/s')
+            parts.append(f'{(self.sims - self._stage_counts[2]) / elapsed:.2f} sims/s')
+        parts.append(f'peak RSS {peak_rss_mb():.0f} MB')
+        print('  '.join(parts), file=self.stream, flush=True)
+
+    def summary(self):
+        """Everything measured so far, as a dict of plain numbers."""
+        stages = {}
+        for name, stage in self.stages.items():
+            stage = dict(stage)
+            wall = stage['wall_s']
+            stage['mb_per_s'] = stage['bytes'] / 1e6 / wall if wall > 0 else None
+            stage['lines_per_s'] = stage['lines'] / wall if wall > 0 else None
+            stage['sims_per_s'] = stage['sims'] / wall if wall > 0 else None
+            stages[name] = stage
+        return {
+            'stages': stages,
+            'wall_s': time.perf_counter() - self._started,
+            'bytes_read': self.bytes_read,
+            'lines': self.lines,
+            'sims': self.sims,
+            'peak_rss_mb': peak_rss_mb(),
+            'pid': os.getpid(),
+        }
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=1)
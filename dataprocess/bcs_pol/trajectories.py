@@ -0,0 +1,335 @@
+"""Per-polymerase trajectory tables from ``.bcs`` traces.
+
+``bcs`` writes the *name* of the process that performed each action
+(``RNAPolII_postPause`` and so on), not an instance id, so trajectories
+are rebuilt from the process states.  Every event moves one polymerase
+from one state to the next::
+
+    reuse                     -> prePause i=0
+    elongation1 / release     prePause i -> prePause i+1 / released i
+    dwell                     released i -> arriving at i+1, p=0
+    Pol_ii                    arriving at i (or held at i) -> at i, (p, d)
+    elongation2               at i, (p, d) -> arriving at i+1, (p, 0)
+    release                   at i -> dissociating at i
+    terminate, release1/2, unbind        -> pool, end of the trajectory
+
+A ``Pol_ii`` that no arrival accounts for is the polymerase re-entering
+its site after reacting to damage (cis: ``p`` 0 -> 1, trans: ``d``
+0 -> 1) or picking up ``phos`` at ``i==2`` (trans: ``p`` 0 -> 1, also
+with ``d=1`` already set).
+Polymerases in the same state on the same site are interchangeable, so
+each state's producers and consumers are paired first in, first out; a
+consumer with nothing to pair with (a trace that starts mid-run) starts a
+trajectory of its own with no ``start`` time.  A trip through the pool
+cannot be told apart from any other, so each trip from ``reuse`` back to
+the pool is one row, and recycling is counted per simulation
+(:func:`trips_per_polymerase`).
+
+All of a simulation's events are linked at once with array operations and
+the rows appended to a :class:`TrajectoryTable`, whose column buffers grow
+by doubling, so memory is one simulation's events plus the table.
+"""
+import numpy as np
+
+from .compressed import open_trace
+from .parser import DEFAULT_CHUNK_SIZE, iter_blocks, parse_event_rows
+
+EXITS = ('bound', 'terminate', 'release1', 'release2', 'unbind')  # 'bound': still on the gene at the end
+
+# name -> dtype of the table columns; times in seconds, NaN where an event did not happen
+COLUMNS = {
+    'sim': np.int32,  # simulation number in the trace
+    'start': np.float64,  # reuse, leaving the pool
+    'pause_release': np.float64,  # dwell, entering the gene body
+    'end': np.float64,  # back in the pool
+    'exit': np.int8,  # index into EXITS
+    'furthest': np.int32,  # furthest site reached in the gene body, -1 if none
+    'steps': np.int32,  # elongation2 steps taken
+    'phos_time': np.float64,  # first event with p=1
+    'damage_site': np.int32,  # site of the first reaction to damage, -1 if none
+    'damage_time': np.float64,
+    'stalled': np.float64,  # total time held at damage, up to leaving the site
+    'longest_dwell': np.float64,  # longest time from arriving at a site to leaving it
+}
+
+# (action, process) -> event code
+_EVENTS = (
+    (b'reuse', b'RNAPolII_pool'),
+    (b'elongation1', b'RNAPolII_prePause'),
+    (b'release', b'RNAPolII_prePause'),
+    (b'dwell', b'RNAPolII_prePause'),
+    (b'terminate', b'RNAPolII_prePause'),
+    (b'Pol_ii', b'RNAPolII_postPause'),
+    (b'elongation2', b'RNAPolII_postPause'),
+    (b'release', b'RNAPolII_postPause'),
+    (b'release1', b'RNAPolII_postPause'),
+    (b'release2', b'RNAPolII_postPause'),
+    (b'unbind', b'RNAPolII_postPause'),
+)
+(_REUSE, _ELONGATION1, _PAUSE_RELEASE, _DWELL, _TERMINATE, _POLII, _ELONGATION2, _RELEASE, _RELEASE1,
+ _RELEASE2, _UNBIND) = range(len(_EVENTS))
+_PRE, _RELEASED, _ARRIVING, _AT, _LEAVING = range(5)  # polymerase states, keyed with (i, p, d)
+
+
+class TrajectoryTable:
+    """Struct-of-arrays table with one row per trip from the pool and back.
+
+    Columns are listed in :data:`COLUMNS` and read with ``table['name']``.
+    """
+
+    def __init__(self, capacity=1024):
+        self._size = 0
+        self._buffers = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, name):
+        return self._buffers[name][:self._size]
+
+    def append(self, columns):
+        """Add rows given as a dict of equally long arrays, one per column."""
+        n = len(columns['sim'])
+        capacity = len(self._buffers['sim'])
+        if self._size + n > capacity:
+            capacity = max(2 * capacity, self._size + n)
+            for name, buffer in self._buffers.items():
+                grown = np.empty(capacity, dtype=buffer.dtype)
+                grown[:self._size] = buffer[:self._size]
+                self._buffers[name] = grown
+        for name, buffer in self._buffers.items():
+            buffer[self._size:self._size + n] = columns[name]
+        self._size += n
+
+    def save(self, filename):
+        """Write the columns (and :data:`EXITS`) as a compressed ``.npz``."""
+        np.savez_compressed(filename, exits=np.array(EXITS), **{name: self[name] for name in COLUMNS})
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            table = cls(len(data['sim']))
+            table.append({name: data[name] for name in COLUMNS})
+        return table
+
+
+def _ranks(groups, selected):
+    """0-based rank of each *selected* entry among the selected entries of its group."""
+    count = np.cumsum(selected)
+    start = np.r_[True, groups[1:] != groups[:-1]]
+    before = (count - selected)[start]
+    return count - before[np.cumsum(start) - 1] - 1
+
+
+def _fifo_match(produce, consume):
+    """Pair each event's consumed state with the event that produced it.
+
+    *produce* and *consume* hold one state key per event (-1 for none).
+    Within a key, the k-th consumption that has something to take is
+    paired with the k-th production.  Returns the producing event of each
+    event, -1 where there is none.
+    """
+    made, taken = np.flatnonzero(produce >= 0), np.flatnonzero(consume >= 0)
+    keys = np.concatenate([produce[made], consume[taken]])
+    events = np.concatenate([made, taken])
+    step = np.concatenate([np.ones(len(made), dtype=np.int64), -np.ones(len(taken), dtype=np.int64)])
+    # sort by key, then event, with an event's consumption before its production
+    order = np.argsort((keys * len(produce) + events) * 2 + (step > 0))
+    keys, events, step = keys[order], events[order], step[order]
+    start = np.r_[True, keys[1:] != keys[:-1]]
+    group = np.cumsum(start) - 1
+
+    # a consumption finds nothing to take where the running minimum of the
+    # produced-minus-consumed count (starting at 0) drops
+    level = np.cumsum(step)
+    level -= (level - step)[start][group]
+    span = 2 * len(step) + 2
+    low = np.minimum(np.minimum.accumulate(level - group * span) + group * span, 0)
+    previous = np.r_[0, low[:-1]]
+    previous[start] = 0
+    matched = (step < 0) & (low == previous)
+
+    productions = np.flatnonzero(step > 0)
+    first = np.searchsorted(group[productions], group[matched])
+    parent = np.full(len(produce), -1, dtype=np.int64)
+    parent[events[matched]] = events[productions[first + _ranks(group, matched)[matched]]]
+    return parent
+
+
+def _link(code, i, p, d):
+    """Producing event of each event of one simulation.
+
+    Also returns which ``Pol_ii`` events re-enter a site after ``d`` or
+    after ``p`` flipped.
+    """
+    n = len(code)
+    i, p, d = np.maximum(i, 0), np.maximum(p, 0), np.maximum(d, 0)
+    span = 4 * (int(i.max(initial=0)) + 2)
+
+    def key(state, site, p_flag, d_flag):
+        return state * span + 4 * site + 2 * p_flag + d_flag
+
+    produce = np.full(n, -1, dtype=np.int64)
+    consume = np.full(n, -1, dtype=np.int64)
+    zero = np.zeros(n, dtype=np.int64)
+    for c, taken, made in (
+            (_REUSE, None, key(_PRE, zero, 0, 0)),
+            (_ELONGATION1, key(_PRE, i, 0, 0), key(_PRE, i + 1, 0, 0)),
+            (_PAUSE_RELEASE, key(_PRE, i, 0, 0), key(_RELEASED, i, 0, 0)),
+            (_DWELL, key(_RELEASED, i, 0, 0), key(_ARRIVING, i + 1, 0, 0)),
+            (_TERMINATE, key(_PRE, i, 0, 0), None),
+            (_POLII, key(_ARRIVING, i, p, d), key(_AT, i, p, d)),
+            (_ELONGATION2, key(_AT, i, p, d), key(_ARRIVING, i + 1, p, 0)),
+            (_RELEASE, key(_AT, i, p, d), key(_LEAVING, i, p, d)),
+            (_RELEASE1, key(_LEAVING, i, p, d), None),
+            (_RELEASE2, key(_LEAVING, i, p, d), None),
+            (_UNBIND, key(_ARRIVING, i, p, d), None)):
+        sel = code == c
+        if taken is not None:
+            consume[sel] = taken[sel]
+        if made is not None:
+            produce[sel] = made[sel]
+
+    # a Pol_ii that no arrival accounts for re-enters from the state before its last flag flipped;
+    # with both flags set that is d, unless only a polymerase that already had d is waiting (phos in trans)
+    polii = code == _POLII
+    reentry = polii & (_fifo_match(produce, consume) < 0)
+    flip_d = reentry & (d == 1)
+    flip_p = reentry & ~flip_d & (p == 1)
+    consume[reentry] = -1
+    consume[flip_d] = key(_AT, i, p, 0)[flip_d]
+    consume[flip_p] = key(_AT, i, 0, d)[flip_p]
+    parent = _fifo_match(produce, consume)
+    retry = flip_d & (p == 1) & (parent < 0)
+    if retry.any():
+        flip_d &= ~retry
+        flip_p |= retry
+        consume[retry] = key(_AT, i, 0, d)[retry]
+        parent = _fifo_match(produce, consume)
+    return parent, flip_d, flip_p
+
+
+def _trajectories(sim, time, code, i, p, d):
+    """Table columns of the trajectories in one simulation's events."""
+    parent, flip_d, flip_p = _link(code, i, p, d)
+    reentry = flip_d | flip_p
+    n = len(code)
+    events = np.arange(n)
+    root = np.where(parent >= 0, parent, events)
+    while True:
+        up = root[root]
+        if (up == root).all():
+            break
+        root = up
+    moving = code >= 0
+    roots, row = np.unique(root[moving], return_inverse=True)
+    rows = np.full(n, -1, dtype=np.int64)
+    rows[moving] = row
+    m = len(roots)
+
+    # per visit to a site: when the polymerase arrived and since when it is held at damage
+    has_parent = parent >= 0
+    arrived = np.full(n, np.nan)
+    held = np.full(n, np.nan)
+    first_visit = (code == _POLII) & ~reentry & has_parent
+    arrived[first_visit] = time[parent[first_visit]]
+    damage = flip_d if (d >= 0).any() else flip_p  # trans traces carry d
+    held[damage] = time[damage]
+    for _ in range(3):  # re-entries chain at most three deep on one site
+        later = reentry & has_parent
+        arrived[later] = arrived[parent[later]]
+        held[later & ~damage] = held[parent[later & ~damage]]
+    leaving = ((code == _ELONGATION2) | (code == _RELEASE)) & has_parent
+    arrived[leaving] = arrived[parent[leaving]]
+    held[leaving] = held[parent[leaving]]
+
+    columns = {'sim': np.full(m, sim, dtype=np.int32)}
+    columns['start'] = np.where(code[roots] == _REUSE, time[roots], np.nan)
+    for name, codes in (('pause_release', (_DWELL,)),
+                        ('end', (_TERMINATE, _RELEASE1, _RELEASE2, _UNBIND))):
+        column = np.full(m, np.nan)
+        sel = np.isin(code, codes)
+        column[rows[sel]] = time[sel]
+        columns[name] = column
+    exits = np.zeros(m, dtype=np.int8)
+    for k, c in enumerate((_TERMINATE, _RELEASE1, _RELEASE2, _UNBIND)):
+        exits[rows[code == c]] = k + 1
+    columns['exit'] = exits
+
+    body = (code == _POLII) | (code == _UNBIND)
+    furthest = np.full(m, -1, dtype=np.int32)
+    np.maximum.at(furthest, rows[body], i[body])
+    columns['furthest'] = furthest
+    columns['steps'] = np.bincount(rows[code == _ELONGATION2], minlength=m).astype(np.int32)
+    phos_time = np.full(m, np.inf)
+    sel = body & (p == 1)
+    np.minimum.at(phos_time, rows[sel], time[sel])
+    columns['phos_time'] = np.where(np.isinf(phos_time), np.nan, phos_time)
+
+    # events are in time order, so the first damage of a trajectory is written last when reversed
+    damage_site = np.full(m, -1, dtype=np.int32)
+    damage_time = np.full(m, np.nan)
+    first = np.flatnonzero(damage)[::-1]
+    damage_site[rows[first]] = i[first]
+    damage_time[rows[first]] = time[first]
+    columns['damage_site'], columns['damage_time'] = damage_site, damage_time
+    stall = leaving & ~np.isnan(held)
+    columns['stalled'] = np.bincount(rows[stall], time[stall] - held[stall], minlength=m)
+    dwell = np.full(m, -np.inf)
+    sel = leaving & ~np.isnan(arrived)
+    np.maximum.at(dwell, rows[sel], time[sel] - arrived[sel])
+    columns['longest_dwell'] = np.where(np.isinf(dwell), np.nan, dwell)
+    return columns
+
+
+def _event_codes(columns):
+    code = np.full(len(columns['time']), -1, dtype=np.int64)
+    for c, (action, process) in enumerate(_EVENTS):
+        code[(columns['action'] == action) & (columns['process'] == process)] = c
+    return code
+
+
+def extract_trajectories(path, sim_number=None, table=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """One row per polymerase trip in *path*, read in one streaming pass.
+
+    Rows are appended to *table* (a new :class:`TrajectoryTable` by
+    default), which is returned.  Each simulation's events are gathered
+    and linked when its block ends.  Block and *sim_number* handling
+    follow :func:`bcs_pol.parser.extract_counts`.
+    """
+    if table is None:
+        table = TrajectoryTable()
+    parts = []
+    current = 0
+
+    def close_block():
+        if parts:
+            columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+            code = _event_codes(columns)
+            table.append(_trajectories(current, columns['time'], code, columns['i'], columns['p'],
+                                       columns['d']))
+            parts.clear()
+
+    with open_trace(path) as f:
+        for block, segment in iter_blocks(f, chunk_size):
+            if block != current:
+                close_block()
+                current = block
+            if sim_number is not None and block > sim_number:
+                break
+            parts.append(parse_event_rows(segment))
+        else:
+            close_block()
+    return table
+
+
+def effective_speed(table):
+    """Sites per second from pause release to leaving the gene body (NaN while bound)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return table['steps'] / (table['end'] - table['pause_release'])
+
+
+def trips_per_polymerase(table, polymerase_count):
+    """Mean trips from the pool per polymerase, one value per simulation in the table."""
+    sims, counts = np.unique(table['sim'], return_counts=True)
+    return sims, counts / polymerase_count
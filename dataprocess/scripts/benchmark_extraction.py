@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.benchmark import STAGES, compare, format_results, run_benchmarks, save_baseline
+
+work_dir = 'YOURPATHWAY/TO/BENCHMARK/DIRECTORY' #synthetic traces are generated here once and reused
+
+sizes_mb = [10, 100] #synthetic trace sizes
+stages = STAGES #parse, accumulate, smooth, plot
+variant = 'cis' #layout of the synthetic traces, cis or trans
+repeats = 3 #best of this many runs per stage
+baseline_file = os.path.join(work_dir, 'benchmark_baseline.json')
+save_as_baseline = False #overwrite the baseline with this run
+
+os.makedirs(work_dir, exist_ok=True)
+results = run_benchmarks(work_dir, sizes_mb, stages, variant, repeats=repeats)
+print(format_results(results))
+
+results_filename = os.path.join(work_dir, 'benchmark_results.json')
+save_baseline(results, results_filename)
+print(f"Results saved to: {results_filename}")
+
+if save_as_baseline:
+    save_baseline(results, baseline_file)
+    print(f"Baseline saved to: {baseline_file}")
+elif os.path.exists(baseline_file):
+    for row in compare(results, baseline_file):
+        flag = '  <-- slower' if row['regression'] else ''
+        print(f"{row['size_mb']:>6}MB {row['stage']:<11} time x{row['time_ratio']:.2f}  "
+              f"peak RSS x{row['rss_ratio']:.2f}{flag}")
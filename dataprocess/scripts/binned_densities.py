@@ -0,0 +1,50 @@
+import matplotlib.pyplot as plt
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.plots import binned_figure
+from bcs_pol.pyramid import DensityPyramid
+
+# --- Configuration ---
+# Density arrays written by snapshot_cis.py / snapshot_dataextract_trans.py or bcs-pol extract
+npz_filenames = {
+    'cis': 'YOURPATHWAY/TO/CIS/MODEL/RESULTS/DIRECTORY/cis_polii_ser7p_density_arrays.npz',
+    'trans': 'YOURPATHWAY/TO/TRANS/MODEL/RESULTS/DIRECTORY/trans_polii_ser7p_density_arrays.npz',
+}
+output_dir = 'YOURPATHWAY/TO/COMPARISON/DIRECTORY'
+bin_bps = [1000, 10000] #bin widths of the experimental data (ChIP-seq / NET-seq), multiples of 100 bp
+windows = [(1, 50), (1, 10), (11, 1000)] #site windows (1-based, inclusive) whose totals are printed
+
+# Stored levels are read as they are; files without a pyramid get one built from their totals
+pyramids = {label: DensityPyramid.load(filename) for label, filename in npz_filenames.items()}
+gene_bps = {label: pyramid.gene_bp for label, pyramid in pyramids.items()}
+if len(set(gene_bps.values())) > 1:
+    raise ValueError(f'the models are tabulated on shared bins, but their genes differ: {gene_bps} bp')
+os.makedirs(output_dir, exist_ok=True)
+
+for label, pyramid in pyramids.items():
+    print(f"\n--- {label}: {pyramid.sims} simulations, {pyramid.gene_bp / 1000:g} kb ---")
+    for first, last in windows:
+        polii = pyramid.window_total('polii', first, last)
+        ser7p = pyramid.window_total('ser7p', first, last)
+        print(f"Sites {first}-{last}: Pol II {polii:.0f}, Ser7P {ser7p:.0f}, "
+              f"average per site {pyramid.window_average('polii', first, last):.4f} / "
+              f"{pyramid.window_average('ser7p', first, last):.4f}")
+
+for bin_bp in bin_bps:
+    labels = list(pyramids)
+    edges = pyramids[labels[0]].bin_edges(bin_bp)
+    levels = [pyramids[label].level(name, bin_bp, average=True) for label in labels for name in ('polii', 'ser7p')]
+    data_filename = os.path.join(output_dir, f"{'_'.join(labels)}_polii_ser7p_{bin_bp}bp_bins.txt")
+    with open(data_filename, 'w') as f:
+        f.write("# Start_bp\tEnd_bp" + ''.join(f"\t{label}_PolII_Avg\t{label}_Ser7P_Avg" for label in labels) + "\n")
+        for k in range(len(edges) - 1):
+            f.write(f"{edges[k]}\t{edges[k + 1]}" + ''.join(f"\t{level[k]:.6f}" for level in levels) + "\n")
+    print(f"Data saved to: {data_filename}")
+
+    fig = binned_figure(pyramids, bin_bp)
+    output_filename = os.path.join(output_dir, f"{'_'.join(labels)}_polii_ser7p_{bin_bp}bp_bins.pdf")
+    fig.savefig(output_filename, dpi=300, bbox_inches='tight')
+    plt.close(fig)
+    print(f"Plot saved to: {output_filename}")
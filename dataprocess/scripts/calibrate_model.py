@@ -0,0 +1,56 @@
+import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.calibrate import calibrate, load_target, save_calibration
+from bcs_pol.sweep import BCS_COMMAND, NUMPY_COMMAND
+
+model_filename = 'YOURPATHWAY/TO/bcs_Pol_ii_models/trans.bc' #cis.bc or trans.bc
+target_filename = 'YOURPATHWAY/TO/EXPERIMENTAL/PROFILE.txt' #start_bp end_bp PolII Ser7P columns, or a density .npz
+target_bin_bp = None #bin width for a density .npz target; None for one site (100 bp)
+output_dir = 'YOURPATHWAY/TO/CALIBRATION/OUTPUT/DIRECTORY'
+cache_dir = os.path.join(output_dir, 'sweep_cache') #shared with sweep_parameters.py; finished runs are reused
+
+# uniform priors; names in log_scale are log-uniform
+bounds = {
+    'uv_distance': (50, 800),
+    'repair_half_life': (3600, 57600),
+    'dissociation_time': (150, 2400),
+    'initiation_freq': (0.1, 1.6),
+}
+log_scale = ('uv_distance', 'repair_half_life', 'dissociation_time', 'initiation_freq')
+
+sim_number = 200 #simulations per run
+population_size = 50 #accepted runs per generation
+n_generations = 6
+quantile = 0.5 #next tolerance: this quantile of the generation's distances
+max_runs = 2000 #budget of runs started, None for no limit
+digits = 3 #significant digits of proposed values; repeats are loaded from the cache
+early_stop = True #stop runs whose partial profile already rules them out
+safety = 2.0 #larger keeps more borderline runs going
+cores = None #core budget, None for all CPUs
+threads_per_run = 1 #passed to bcs -t
+simulator_command = ('YOURPATHWAY/TO/bcs/bin/bcs',) + BCS_COMMAND[1:] #or NUMPY_COMMAND + ('--t-max', '3600') without bcs
+seed = None
+
+target = load_target(target_filename, target_bin_bp)
+result = calibrate(model_filename, target, bounds, sim_number, cache_dir, simulator_command, log_scale,
+                   population_size, n_generations, quantile, max_runs=max_runs, digits=digits, early_stop=early_stop,
+                   safety=safety, cores=cores, threads_per_run=threads_per_run, seed=seed, log=print)
+
+os.makedirs(output_dir, exist_ok=True)
+output_filename = os.path.join(output_dir, 'calibration.npz')
+save_calibration(output_filename, result)
+print(f"{len(result.evaluations)} runs, {sum(e.stopped for e in result.evaluations)} stopped early, "
+      f"{sum(e.cached for e in result.evaluations)} from the cache -> {output_filename}")
+
+for k, name in enumerate(result.names):
+    values = result.population[:, k]
+    order = np.argsort(values)
+    cumulative = np.cumsum(result.weights[order])
+    low, median, high = (values[order][np.searchsorted(cumulative, q)] for q in (0.05, 0.5, 0.95))
+    print(f"{name}: weighted median {median:.4g}, 90% interval {low:.4g}-{high:.4g}")
+best = np.argmin(result.distances)
+print("Closest run: " + ', '.join(f"{name} = {result.population[best, k]:.4g}" for k, name in enumerate(result.names))
+      + f" (distance {result.distances[best]:.4f})")
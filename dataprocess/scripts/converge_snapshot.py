@@ -0,0 +1,56 @@
+import os
+import signal
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.aggregate import save_densities
+from bcs_pol.convergence import ConvergenceMonitor, converge_trace
+from bcs_pol.follow import follow_counts
+
+gene_length = 1000 #length of the gene in 100 bp
+
+input_dir = 'YOURPATHWAY/TO/TRANS/MODEL/RESULTS/DIRECTORY'
+bcs_filename = os.path.join(input_dir, 'filename.bcs')
+variant = 'cis' #prefix of the output files, cis or trans
+
+sim_number = 500 #upper limit; reading stops earlier once converged
+targets = {'ratio': 0.05, 'polii': 0.10} #largest accepted CI half-width relative to the mean over the window
+window = (1, 50) #positions checked, first and last inclusive; None for the whole gene
+confidence_level = 0.95
+sigma_smoothing = 5 #smoothing of the ratio, as in density8graphs
+min_sims = 20 #no decision before this many simulations
+check_every = 10 #simulations between checks when reading a finished trace
+
+# Following a trace bcs is still writing: the run is stopped as soon as the targets are met
+follow = False
+bcs_pid = None #process id of the running bcs, sent SIGTERM once converged
+poll_interval = 5 #seconds
+
+monitor = ConvergenceMonitor(gene_length, targets, window, sigma_smoothing, confidence_level, min_sims)
+if follow:
+    def bcs_finished():
+        try:
+            os.kill(bcs_pid, 0)
+        except (OSError, TypeError):
+            return True
+        return False
+
+    result = follow_counts(bcs_filename, gene_length, sim_number=sim_number, poll_interval=poll_interval,
+                           finished=bcs_finished, monitor=monitor)
+    converged = monitor.converged()
+    if converged and not bcs_finished():
+        os.kill(bcs_pid, signal.SIGTERM)
+        print(f"Converged: stopped bcs (pid {bcs_pid})")
+else:
+    result = converge_trace(bcs_filename, gene_length, monitor, sim_number, check_every)
+    converged = result.converged
+
+for name, width in monitor.relative_widths().items():
+    print(f"{name}: relative CI half-width {width:.4f} (target {targets[name]})")
+print(f"{'Converged' if converged else 'Not converged'} after {result.sims} simulations")
+
+npz_filename = os.path.join(input_dir, f'{variant}_polii_ser7p_density_arrays.npz')
+data_filename = os.path.join(input_dir, f'{variant}_polii_ser7p_density_data.txt')
+save_densities(npz_filename, data_filename, result.polii, result.ser7p, result.sims)
+print(f"NumPy arrays saved to: {npz_filename}")
+print(f"Data saved to: {data_filename}")
@@ -0,0 +1,31 @@
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.curves import select, stack_densities, write_curves
+from bcs_pol.telemetry import Telemetry
+
+input_dir = 'YOURPATHWAY/TO/SWEEP/RESULTS/DIRECTORY'
+npz_filenames = sorted(glob.glob(os.path.join(input_dir, '*_density_arrays.npz'))) #1-D files and 2-D sweep batches
+output_dir = os.path.join(input_dir, 'density_curves') #one <curve>.npy per curve and a meta.json
+
+sigmas = [2, 5, 10, 20] #Gaussian smoothing in positions; 5 is the density8graphs default
+batch_size = 64 #runs smoothed together
+progress_interval = None #seconds between progress lines; None for quiet
+
+telemetry = Telemetry(progress_interval)
+telemetry.begin('load')
+labels, polii_avg, ser7p_avg = stack_densities(npz_filenames)
+print(f"{len(labels)} runs from {len(npz_filenames)} files, gene length {polii_avg.shape[1]}")
+
+# polii, ser7p, ratio, log2_ratio and difference of every run at every sigma, memory-mapped on disk;
+# reopen later with bcs_pol.curves.open_curves and pick curves with select(bank, curve, labels, sigmas)
+telemetry.begin('curves')
+bank = write_curves(output_dir, labels, polii_avg, ser7p_avg, sigmas, batch_size)
+telemetry.finish()
+print(f"Curves saved to: {output_dir}")
+
+log2_ratio = select(bank, 'log2_ratio')
+for k, sigma in enumerate(bank.sigmas):
+    print(f"sigma={sigma:g}: log2 ratio over positions 1-50, mean {log2_ratio[:, k, :50].mean():.4f}")
@@ -0,0 +1,33 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.follow import follow_counts
+from bcs_pol.telemetry import Telemetry
+
+gene_length = 1000 #length of the gene in 100 bp
+
+input_dir = 'YOURPATHWAY/TO/TRANS/MODEL/RESULTS/DIRECTORY'
+bcs_filename = os.path.join(input_dir, 'filename.bcs') #bcs output that is still being written (uncompressed)
+variant = 'cis' #prefix of the output files, cis or trans
+
+sim_number = 500 #stop after this many simulations
+poll_interval = 5 #seconds between checks for new output
+refresh_interval = 60 #seconds between rewrites of the .npz/.txt outputs and the offset checkpoint
+idle_timeout = 1800 #seconds without growth after which bcs is taken to be done; None to follow until Ctrl-C
+progress_interval = 300 #seconds between progress lines; None for quiet
+
+# Densities of the simulations finished so far, in the same files snapshot_cis.py writes;
+# restarting this script resumes from <file>.follow.npz instead of re-reading the trace
+npz_filename = os.path.join(input_dir, f'{variant}_polii_ser7p_density_arrays.npz')
+data_filename = os.path.join(input_dir, f'{variant}_polii_ser7p_density_data.txt')
+
+telemetry = Telemetry(progress_interval)
+telemetry.begin('follow')
+result = follow_counts(bcs_filename, gene_length, npz_filename, data_filename, sim_number=sim_number,
+                       poll_interval=poll_interval, refresh_interval=refresh_interval, idle_timeout=idle_timeout)
+telemetry.finish()
+
+print(f"{result.sims} simulations counted ({result.offset} bytes)")
+print(f"NumPy arrays saved to: {npz_filename}")
+print(f"Data saved to: {data_filename}")
@@ -0,0 +1,53 @@
+import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.bootstrap import unpack_occupancy
+from bcs_pol.permutation import METRICS, permutation_test, save_permutation_test
+from bcs_pol.telemetry import Telemetry
+
+# --- Configuration ---
+# Density arrays written by snapshot_cis.py / snapshot_dataextract_trans.py with keep_per_sim = True
+cis_npz = 'YOURPATHWAY/TO/CIS/MODEL/RESULTS/DIRECTORY/cis_polii_ser7p_density_arrays.npz'
+trans_npz = 'YOURPATHWAY/TO/TRANS/MODEL/RESULTS/DIRECTORY/trans_polii_ser7p_density_arrays.npz'
+output_dir = 'YOURPATHWAY/TO/COMPARISON/DIRECTORY'
+output_filename = os.path.join(output_dir, 'cis_vs_trans_permutation_test.npz')
+
+curve = 'ratio' #'polii', 'ser7p', 'ratio', 'log2_ratio' or 'difference' of density8graphs
+sigma = 5 #Gaussian smoothing in positions, as in density8graphs
+windows = [(1, 50), (1, 1000)] #inclusive 1-based positions tested as a whole; 1-50 covers the i==2 phosphorylation site
+n_permutations = 10000 #random splits of the pooled simulations
+correction = 'bh' #position-wise correction: 'bh', 'by', 'holm' or 'bonferroni'; windows always use Holm
+alpha = 0.05
+seed = None
+n_workers = None #None for one per CPU
+progress_interval = None #seconds between progress lines; None for quiet
+
+os.makedirs(output_dir, exist_ok=True)
+telemetry = Telemetry(progress_interval)
+telemetry.begin('load')
+rows = []
+for npz_filename in (cis_npz, trans_npz):
+    with np.load(npz_filename) as data:
+        if 'polii_per_sim_packed' not in data:
+            sys.exit(f"{npz_filename} has no per-simulation occupancy; re-extract with keep_per_sim = True")
+        gene_length = len(data['positions'])
+        rows.append(unpack_occupancy(data['polii_per_sim_packed'], gene_length))
+        rows.append(unpack_occupancy(data['ser7p_per_sim_packed'], gene_length))
+print(f"cis: {len(rows[0])} simulations, trans: {len(rows[2])} simulations, gene length {gene_length}")
+
+telemetry.begin('permutations')
+result = permutation_test(*rows, curve=curve, sigma=sigma, windows=windows, n_permutations=n_permutations,
+                          correction=correction, seed=seed, n_workers=n_workers)
+save_permutation_test(output_filename, result)
+telemetry.finish()
+print(f"Results saved to: {output_filename}")
+
+significant = np.flatnonzero(result.p_adjusted < alpha) + 1
+print(f"{len(significant)} positions with {correction}-adjusted p < {alpha}: {significant[:20].tolist()}"
+      f"{' ...' if len(significant) > 20 else ''}")
+for k, (first, last) in enumerate(result.windows):
+    for m, metric in enumerate(METRICS):
+        print(f"positions {first}-{last}, {metric}: observed {result.window_observed[k, m]:.4g}, "
+              f"p = {result.window_p_values[k, m]:.4g}, Holm p = {result.window_p_adjusted[k, m]:.4g}")
@@ -0,0 +1,34 @@
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.aggregate import make_partials, reduce_partials, save_partial_densities
+
+gene_length = 1000 #length of the gene in 100 bp
+
+input_dir = 'YOURPATHWAY/TO/TRANS/MODEL/RESULTS/DIRECTORY'
+bcs_filenames = sorted(glob.glob(os.path.join(input_dir, '*.bcs'))) #every bcs job of the run, in a fixed order
+variant = 'cis' #prefix of the output files, cis or trans
+
+sim_number = None #simulations used from each file; None for all of them
+keep_per_sim = True #carry bit-packed per-simulation occupancy (gives bootstrap bands in density8graphs)
+n_workers = None #processes extracting traces and threads merging partials; None for all CPUs
+partial_dir = None #where partials go; None for next to each trace, or the temporary directory if input_dir is read-only
+
+# Map: one <file>.partial.npz per trace (sums, simulation count, per-sim rows), reused while the trace is
+# unchanged; partials written on other nodes can be listed in partial_filenames directly instead
+partial_filenames = make_partials(bcs_filenames, gene_length, sim_number, keep_per_sim, n_workers,
+                                  cache_dir=partial_dir)
+
+# Reduce: merged group by group in bounded memory; averages are over the simulations actually found
+total = reduce_partials(partial_filenames, n_workers)
+for source, sims in zip(total.sources, total.source_sims):
+    print(f"{sims:>6} simulations  {source}")
+print(f"{total.sims} simulations in {len(partial_filenames)} files")
+
+npz_filename = os.path.join(input_dir, f'{variant}_polii_ser7p_density_arrays.npz')
+data_filename = os.path.join(input_dir, f'{variant}_polii_ser7p_density_data.txt')
+save_partial_densities(npz_filename, data_filename, total)
+print(f"NumPy arrays saved to: {npz_filename}")
+print(f"Data saved to: {data_filename}")
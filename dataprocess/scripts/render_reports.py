@@ -0,0 +1,24 @@
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.reports import render_reports
+
+input_dir = 'YOURPATHWAY/TO/DENSITY/ARRAYS/DIRECTORY'
+npz_filenames = sorted(glob.glob(os.path.join(input_dir, '*_polii_ser7p_density_arrays.npz')))
+output_dir = os.path.join(input_dir, 'figures')
+
+sigma = 5 #Gaussian smoothing of the density8graphs curves
+n_bootstrap = 0 #bootstrap resamples for confidence bands; 0 for none (needs per-simulation occupancy)
+seed = None
+fmt = 'pdf' #'pdf', 'svg' or 'png'
+dpi = 300
+rasterize = False #embed curves and bars as images at dpi; worth it for long genes or many bands
+n_workers = None #None for one per CPU
+
+# snapshot and density8graphs figures of every file, drawn headless in a process pool
+for filenames in render_reports(npz_filenames, output_dir, fmt, dpi, sigma, rasterize=rasterize,
+                                n_boot=n_bootstrap, seed=seed, n_workers=n_workers):
+    for filename in filenames:
+        print(f"Plot saved to: {filename}")
@@ -0,0 +1,40 @@
+import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.aggregate import save_densities
+from bcs_pol.bootstrap import pack_occupancy
+from bcs_pol.model import load_model
+from bcs_pol.simulate import check_against_trace, simulate
+
+model_filename = 'YOURPATHWAY/TO/bcs_Pol_ii_models/cis.bc' #cis.bc or trans.bc; the variant is read from the model
+output_dir = 'YOURPATHWAY/TO/SIMULATION/OUTPUT/DIRECTORY'
+
+sim_number = 500
+t_max = 3600 #seconds of simulated time
+seed = None #set an integer for reproducible runs
+batch_size = 500 #simulations advanced together; larger batches are faster per simulation
+write_trace = False #also write a .bcs-format event trace (slower, large files)
+reference_bcs = None #path to a bcs trace of the same model to compare against
+
+text, params, variant = load_model(model_filename)
+
+trace_filename = os.path.join(output_dir, f'{variant}_numpy.bcs') if write_trace else None
+result = simulate(params, variant, sim_number, t_max, seed, trace_filename, batch_size)
+print(f"{sim_number} {variant} simulations, {result.n_events} events")
+
+RNApolIIcount_all = result.polii_rows.sum(axis=0, dtype=np.float64)
+Ser7Pcount_all = result.ser7p_rows.sum(axis=0, dtype=np.float64)
+
+# same layout as the snapshot scripts, so density8graphs can plot it directly
+npz_filename = os.path.join(output_dir, f'{variant}_polii_ser7p_density_arrays.npz')
+save_densities(npz_filename, None, RNApolIIcount_all, Ser7Pcount_all, sim_number,
+               polii_per_sim_packed=pack_occupancy(result.polii_rows),
+               ser7p_per_sim_packed=pack_occupancy(result.ser7p_rows))
+print(f"NumPy arrays saved to: {npz_filename}")
+
+if reference_bcs is not None:
+    check = check_against_trace(reference_bcs, params, variant, sim_number, t_max, seed)
+    print(f"positions with |z| > 3: Pol II {check['polii_outliers']:.3%}, Ser7P {check['ser7p_outliers']:.3%}")
+    print(f"KS p-value of molecules per simulation: Pol II {check['polii_ks_p']:.3g}, Ser7P {check['ser7p_ks_p']:.3g}")
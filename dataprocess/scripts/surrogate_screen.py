@@ -0,0 +1,55 @@
+import numpy as np
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.model import load_model
+from bcs_pol.surrogate import PARAMETERS, check_against_simulation, save_surrogate, solve
+from bcs_pol.sweep import grid
+
+model_filename = 'YOURPATHWAY/TO/bcs_Pol_ii_models/cis.bc' #cis.bc or trans.bc
+output_dir = 'YOURPATHWAY/TO/SURROGATE/OUTPUT/DIRECTORY'
+
+t_max = 3600 #seconds, the time the bcs runs being screened for would last
+sweep = grid(uv_distance=[100, 200, 400], repair_half_life=[3600, 14400]) #or a list of dicts
+write_points = True #one *_polii_ser7p_density_arrays.npz per point, readable by density8graphs_*.py
+check_sims = 0 #stochastic simulations per point to measure the surrogate's deviation, 0 to skip
+
+text, params, variant = load_model(model_filename)
+names = sorted({name for overrides in sweep for name in overrides})
+fixed = set(names) - set(PARAMETERS)
+if fixed:
+    raise ValueError(f'{sorted(fixed)} cannot vary within one screen; run one screen per value')
+
+# every point is solved in one vectorised pass
+batch = dict(params)
+for name in names:
+    batch[name] = np.array([overrides.get(name, params[name]) for overrides in sweep], dtype=np.float64)
+start = time.perf_counter()
+result = solve(batch, variant, t_max)
+elapsed = time.perf_counter() - start
+polii, ser7p = np.atleast_2d(result.polii), np.atleast_2d(result.ser7p)
+print(f"{len(sweep)} points solved in {elapsed:.2f} s ({elapsed / len(sweep):.3f} s per point)")
+print("The surrogate overestimates Pol II far down the gene and is least accurate for cis Ser7P "
+      "(see bcs_pol.surrogate); confirm candidates with simulate_numpy.py or bcs, or set check_sims")
+
+os.makedirs(output_dir, exist_ok=True)
+parameter_values = np.array([[dict(params, **overrides)[name] for name in names] for overrides in sweep],
+                            dtype=np.float64).reshape(len(sweep), len(names))
+for k, overrides in enumerate(sweep):
+    print(f"{overrides}: mean Pol II {polii[k].sum():.2f}, mean Ser7P {ser7p[k].sum():.2f}")
+    if write_points:
+        save_surrogate(os.path.join(output_dir, f'{variant}_surrogate_{k:03d}_polii_ser7p_density_arrays.npz'),
+                       polii[k], ser7p[k], t_max=t_max, parameter_names=np.array(names),
+                       parameter_values=parameter_values[k])
+    if check_sims:
+        deviations = check_against_simulation(dict(params, **overrides), variant, t_max, check_sims, seed=k)
+        for name, d in deviations.items():
+            print(f"    {name}: RMSE {d.rmse:.4f}, max |diff| {d.max_abs:.4f}, curve L1 {d.curve_l1:.4f}, "
+                  f"total ratio {d.total_ratio:.3f}")
+
+npz_filename = os.path.join(output_dir, f'{variant}_surrogate_density_arrays.npz')
+save_surrogate(npz_filename, polii, ser7p, t_max=t_max, parameter_names=np.array(names),
+               parameter_values=parameter_values)
+print(f"NumPy arrays saved to: {npz_filename}")
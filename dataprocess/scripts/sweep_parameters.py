@@ -0,0 +1,39 @@
+import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.aggregate import save_densities
+from bcs_pol.model import load_model
+from bcs_pol.sweep import BCS_COMMAND, grid, run_sweep
+
+model_filename = 'YOURPATHWAY/TO/bcs_Pol_ii_models/cis.bc' #cis.bc or trans.bc
+output_dir = 'YOURPATHWAY/TO/SWEEP/OUTPUT/DIRECTORY'
+cache_dir = os.path.join(output_dir, 'sweep_cache') #finished points are reused by later sweeps
+
+sim_number = 500
+sweep = grid(uv_distance=[100, 200, 400], repair_half_life=[3600, 14400]) #or a list of dicts
+cores = None #core budget for the whole sweep, None for all CPUs
+threads_per_run = 1 #passed to bcs -t
+simulator_command = ('YOURPATHWAY/TO/bcs/bin/bcs',) + BCS_COMMAND[1:] #any stand-in taking the same arguments
+keep_traces = False #keep each .bcs trace in the cache next to its densities
+
+text, params, variant = load_model(model_filename)
+
+points = run_sweep(model_filename, sweep, sim_number, cache_dir, simulator_command, cores, threads_per_run,
+                   keep_traces)
+for point in points:
+    status = 'cached' if point.cached else 'simulated'
+    print(f"{point.overrides}: {status}, mean Pol II {point.polii.sum() / sim_number:.2f}, "
+          f"mean Ser7P {point.ser7p.sum() / sim_number:.2f}")
+
+# one row per sweep point, parameter columns alongside
+names = sorted({name for overrides in sweep for name in overrides})
+npz_filename = os.path.join(output_dir, f'{variant}_sweep_density_arrays.npz')
+save_densities(npz_filename, None, np.array([point.polii for point in points], dtype=np.float64),
+               np.array([point.ser7p for point in points], dtype=np.float64), sim_number,
+               parameter_names=np.array(names),
+               parameter_values=np.array([[point.params[name] for name in names] for point in points],
+                                         dtype=np.float64),
+               cache_keys=np.array([point.key for point in points]))
+print(f"NumPy arrays saved to: {npz_filename}")
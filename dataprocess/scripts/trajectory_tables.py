@@ -0,0 +1,31 @@
+import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bcs_pol.trajectories import EXITS, effective_speed, extract_trajectories, trips_per_polymerase
+
+input_dir = 'YOURPATHWAY/TO/CIS/MODEL/RESULTS/DIRECTORY'
+bcs_filename = os.path.join(input_dir, 'filename.bcs')
+variant = 'cis' #prefix of the output file, cis or trans
+
+sim_number = 500 #simulations read from the trace, None for all
+polymerase_count = 250 #from the model header, for the trips per polymerase
+
+table = extract_trajectories(bcs_filename, sim_number=sim_number)
+npz_filename = os.path.join(input_dir, f'{variant}_trajectories.npz')
+table.save(npz_filename)
+print(f"{len(table)} trajectories saved to: {npz_filename}")
+
+exits = table['exit']
+for k, name in enumerate(EXITS):
+    print(f"{name:<10}{np.count_nonzero(exits == k):>10}")
+
+stalled = table['stalled'][(exits == EXITS.index('release1')) & (table['damage_site'] >= 0)]
+if len(stalled):
+    print(f"Held at damage before release1: median {np.median(stalled):.1f} s, mean {stalled.mean():.1f} s")
+speed = effective_speed(table)[(exits == EXITS.index('unbind'))]
+if len(speed):
+    print(f"Pause release to unbind: median {np.median(speed):.4f} sites/s ({100 * np.median(speed):.1f} bp/s)")
+sims, trips = trips_per_polymerase(table, polymerase_count)
+print(f"Trips from the pool per polymerase: mean {trips.mean():.2f} over {len(sims)} simulations")
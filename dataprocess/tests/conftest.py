@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from bcs_pol.model import load_model
+from bcs_pol.synthetic import write_trace
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'bcs_Pol_ii_models')
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# a short gene with dense damage: a few seconds per 100 simulations of either model
+SMALL = dict(gene_length=30, uv_distance=5)
+SMALL_T_MAX = 150
+
+TRACE_GENE_LENGTH = 120
+TRACE_SIMS = 9
+
+# Pol_ii rows before the first header (block 0, counted by snapshot_cis.py) and lines its loop skips:
+# a time that is not a number, too few fields
+PRELUDE = ('0.100000\tPol_ii\tRNAPolII_postPause\ti\t3\tp\t1\n'
+           '0.200000\tPol_ii\tRNAPolII_postPause\ti\t4\tp\t0\n'
+           'time\tPol_ii\tRNAPolII_postPause\ti\t7\tp\t1\n')
+SKIPPED = '2.500000\tPol_ii\tRNAPolII_postPause\ti\t9\n'
+
+
+def model_path(variant):
+    return os.path.join(MODELS_DIR, f'{variant}.bc')
+
+
+@pytest.fixture(params=['cis', 'trans'])
+def small_model(request):
+    """``(variant, params)`` of a repository model with the :data:`SMALL` header values."""
+    _, params, variant = load_model(model_path(request.param))
+    return variant, dict(params, **SMALL)
+
+
+@pytest.fixture(params=['cis', 'trans'])
+def trace(request, tmp_path):
+    """Path of a synthetic trace of :data:`TRACE_SIMS` simulations on :data:`TRACE_GENE_LENGTH` sites.
+
+    It starts with :data:`PRELUDE` and has a :data:`SKIPPED` line inside
+    its second simulation.
+    """
+    path = str(tmp_path / f'{request.param}.bcs')
+    write_trace(path, n_sims=TRACE_SIMS, events_per_sim=400, gene_length=TRACE_GENE_LENGTH,
+                variant=request.param, seed=1)
+    with open(path) as f:
+        first, second, rest = f.read().split('\n>', 2)
+    with open(path, 'w') as f:
+        f.write(PRELUDE + first + '\n>' + second.replace('\n', '\n' + SKIPPED, 1) + '\n>' + rest)
+    return path
@@ -0,0 +1,69 @@
+"""A small ABC-SMC fit with :data:`bcs_pol.sweep.NUMPY_COMMAND` standing in for ``bcs``.
+
+One fit of ``uv_distance`` on the :data:`SMALL` trans model covers the
+asynchronous submission of runs, stopping runs that are already ruled
+out and, run again on the same cache, loading finished runs; a different
+simulator command must not load them.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from bcs_pol.calibrate import STOPPED_SUFFIX, Target, _binned, calibrate
+from bcs_pol.model import read_parameters, write_parameters
+from bcs_pol.pyramid import SITE_BP
+from bcs_pol.simulate import simulate
+from bcs_pol.sweep import BCS_COMMAND, NUMPY_COMMAND, cache_key
+
+from conftest import SMALL, model_path
+
+SIM_NUMBER = 40
+T_MAX = 30  # seconds; short runs, written in batches of 10 simulations so they can be stopped early
+COMMAND = NUMPY_COMMAND + ('--t-max', str(T_MAX), '--batch-size', '10', '--seed', '0')
+FIT = dict(bounds={'uv_distance': (2, 40)}, log_scale=('uv_distance',), population_size=4, n_generations=2,
+           digits=2, max_runs=60, safety=0.5, cores=3, poll_interval=0.02, seed=1)
+
+
+@pytest.fixture(scope='module')
+def small_trans(tmp_path_factory):
+    with open(model_path('trans')) as f:
+        text = write_parameters(f.read(), SMALL)
+    path = str(tmp_path_factory.mktemp('model') / 'trans.bc')
+    with open(path, 'w') as f:
+        f.write(text)
+    result = simulate(read_parameters(text), 'trans', 200, T_MAX, seed=0)
+    edges = np.arange(0, SMALL['gene_length'] + 1, 5) * SITE_BP
+    counts = result.polii_rows.sum(axis=0, dtype=np.float64), result.ser7p_rows.sum(axis=0, dtype=np.float64)
+    return path, text, Target(edges, *_binned(*counts, Target(edges, None, None)))
+
+
+def test_cache_key_depends_on_simulator(small_trans):
+    _, text, _ = small_trans
+    assert cache_key(text, SIM_NUMBER, BCS_COMMAND) != cache_key(text, SIM_NUMBER, NUMPY_COMMAND)
+    # where bcs was found does not matter
+    assert cache_key(text, SIM_NUMBER, BCS_COMMAND) == cache_key(text, SIM_NUMBER,
+                                                                 ('/opt/bcs/bin/bcs',) + BCS_COMMAND[1:])
+
+
+def test_calibrate_with_numpy_command(small_trans, tmp_path):
+    path, _, target = small_trans
+    cache_dir = str(tmp_path / 'cache')
+    first = calibrate(path, target, sim_number=SIM_NUMBER, cache_dir=cache_dir, command=COMMAND, **FIT)
+    assert first.population.shape == (4, 1) and len(first.epsilons) == 2
+    assert np.all((first.population >= 2) & (first.population <= 40))
+    # three workers get through more runs only by taking new proposals as earlier runs return
+    assert sum(not e.cached for e in first.evaluations) > FIT['cores']
+    assert any(e.stopped for e in first.evaluations)
+    for e in first.evaluations:
+        if not e.cached:
+            assert os.path.exists(os.path.join(cache_dir, e.key + (STOPPED_SUFFIX if e.stopped else '.npz')))
+
+    second = calibrate(path, target, sim_number=SIM_NUMBER, cache_dir=cache_dir, command=COMMAND, **FIT)
+    # the same seed proposes the same first points, which are loaded
+    assert sum(e.cached for e in second.evaluations) >= FIT['cores']
+
+    with pytest.raises(FileNotFoundError):
+        # a bcs run must simulate rather than load what the stand-in left in the cache
+        calibrate(path, target, sim_number=SIM_NUMBER, cache_dir=cache_dir,
+                  command=(str(tmp_path / 'no_bcs'),) + BCS_COMMAND[1:], **dict(FIT, max_runs=FIT['cores']))
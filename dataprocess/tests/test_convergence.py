@@ -0,0 +1,66 @@
+"""Streaming statistics of :class:`bcs_pol.convergence.ConvergenceMonitor`.
+
+Batches merged with the Welford/Chan formulas, in any split, must give the
+means, squared deviations and co-moments computed directly from all rows,
+and a monitor restored from a saved state must carry on the same way.
+"""
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter1d
+
+from bcs_pol.convergence import ConvergenceMonitor
+
+GENE_LENGTH = 80
+SIMS = 37
+SIGMA = 3
+
+
+def _rows(seed=0):
+    rng = np.random.default_rng(seed)
+    density = np.linspace(0.6, 0.1, GENE_LENGTH)
+    polii = (rng.random((SIMS, GENE_LENGTH)) < density).astype(np.uint8)
+    ser7p = polii * (rng.random((SIMS, GENE_LENGTH)) < 0.4)
+    return polii, ser7p
+
+
+def _direct(polii, ser7p):
+    raw = np.stack([polii, ser7p], axis=1).astype(np.float64)
+    smooth_polii = gaussian_filter1d(polii.astype(np.float64), SIGMA, axis=-1)
+    smooth_ser7p = gaussian_filter1d(ser7p.astype(np.float64), SIGMA, axis=-1)
+    smooth = np.stack([smooth_polii, smooth_ser7p,
+                       np.broadcast_to(smooth_polii.sum(axis=1, keepdims=True), smooth_polii.shape),
+                       np.broadcast_to(smooth_ser7p.sum(axis=1, keepdims=True), smooth_ser7p.shape)], axis=-1)
+    centred = smooth - smooth.mean(axis=0)
+    return dict(n=len(polii), mean_raw=raw.mean(axis=0), m2_raw=((raw - raw.mean(axis=0)) ** 2).sum(axis=0),
+                mean_smooth=smooth.mean(axis=0), comoment_smooth=np.einsum('sgi,sgj->gij', centred, centred))
+
+
+def _assert_state(state, expected):
+    assert state['n'] == expected['n']
+    for name in ('mean_raw', 'm2_raw', 'mean_smooth', 'comoment_smooth'):
+        np.testing.assert_allclose(state[name], expected[name], rtol=1e-10, atol=1e-10, err_msg=name)
+
+
+@pytest.mark.parametrize('splits', [[SIMS], [1] * SIMS, [1, 2, 10, 24], [20, 0, 17]])
+def test_merge_matches_direct(splits):
+    polii, ser7p = _rows()
+    monitor = ConvergenceMonitor(GENE_LENGTH, {'ratio': 0.05}, sigma=SIGMA)
+    for batch in np.split(np.arange(SIMS), np.cumsum(splits)[:-1]):
+        monitor.update(polii[batch], ser7p[batch])
+    _assert_state(monitor.state(), _direct(polii, ser7p))
+
+    widths = monitor.half_widths()
+    np.testing.assert_allclose(widths['polii'], monitor.z * polii.std(axis=0, ddof=1) / np.sqrt(SIMS), rtol=1e-10)
+
+
+def test_restore_continues(tmp_path):
+    polii, ser7p = _rows(seed=1)
+    first = ConvergenceMonitor(GENE_LENGTH, {'polii': 0.1}, sigma=SIGMA)
+    first.update(polii[:15], ser7p[:15])
+    np.savez(tmp_path / 'state.npz', **first.state())
+
+    resumed = ConvergenceMonitor(GENE_LENGTH, {'polii': 0.1}, sigma=SIGMA)
+    with np.load(tmp_path / 'state.npz') as data:
+        resumed.restore(dict(data))
+    resumed.update(polii[15:], ser7p[15:])
+    _assert_state(resumed.state(), _direct(polii, ser7p))
@@ -0,0 +1,42 @@
+"""Batched curves against :func:`bcs_pol.bootstrap.density_curves`.
+
+Sigmas on both sides of :data:`bcs_pol.curves.FFT_RADIUS` are compared on
+dense densities and on sparse ones, where most sites are beyond the reach
+of any molecule and the direct convolution of ``density_curves`` gives
+exact zeros that the ratios divide by.
+"""
+import numpy as np
+import pytest
+
+from bcs_pol.bootstrap import CURVES, density_curves
+from bcs_pol.curves import FFT_RADIUS, TRUNCATE, compute_curves
+
+GENE_LENGTH = 1000
+SIGMAS = [1, 5, 8, 10, 25, 60]
+
+
+def _densities(sparse, seed=0):
+    rng = np.random.default_rng(seed)
+    if not sparse:
+        return rng.poisson(3, (4, GENE_LENGTH)) / 50, rng.poisson(2, (4, GENE_LENGTH)) / 50
+    polii, ser7p = np.zeros((4, GENE_LENGTH)), np.zeros((4, GENE_LENGTH))
+    for row in range(4):
+        polii[row, rng.choice(GENE_LENGTH, 5, replace=False)] = rng.integers(1, 20, 5) / 50
+        ser7p[row, rng.choice(GENE_LENGTH, 5, replace=False)] = rng.integers(1, 20, 5) / 50
+    return polii, ser7p
+
+
+def test_sigmas_cover_both_paths():
+    assert any(TRUNCATE * sigma <= FFT_RADIUS for sigma in SIGMAS)
+    assert any(TRUNCATE * sigma > FFT_RADIUS for sigma in SIGMAS)
+
+
+@pytest.mark.parametrize('sparse', [False, True], ids=['dense', 'sparse'])
+def test_curves_match_density_curves(sparse):
+    polii, ser7p = _densities(sparse)
+    curves = compute_curves(polii, ser7p, SIGMAS, batch_size=3)
+    for k, sigma in enumerate(SIGMAS):
+        expected = density_curves(polii, ser7p, sigma)
+        for name in CURVES:
+            np.testing.assert_allclose(curves[name][:, k], expected[name], rtol=1e-9, atol=1e-12,
+                                       err_msg=f'{name} at sigma {sigma}')
@@ -0,0 +1,78 @@
+"""Following a trace against extracting it once it is complete.
+
+The trace is written in pieces cut anywhere, mid-line included, by the
+*sleep* hook of :func:`bcs_pol.follow.follow_counts`, so no real time
+passes.  The totals, with or without a convergence monitor and across a
+restart from the checkpoint, must be those of the finished file.
+"""
+import numpy as np
+import pytest
+
+from bcs_pol.convergence import ConvergenceMonitor
+from bcs_pol.follow import follow_counts
+from bcs_pol.parallel import extract_occupancy
+from bcs_pol.parser import extract_counts
+from conftest import TRACE_GENE_LENGTH, TRACE_SIMS
+
+
+def _grow(source, path, pieces, seed=0):
+    """Start *path* with the first of *pieces* random cuts of *source*; returns ``(sleep, finished)``."""
+    with open(source, 'rb') as f:
+        data = f.read()
+    cuts = np.sort(np.random.default_rng(seed).choice(np.arange(1, len(data)), pieces - 1, replace=False))
+    parts = [data[a:b] for a, b in zip(np.r_[0, cuts], np.r_[cuts, len(data)])]
+    with open(path, 'wb') as f:
+        f.write(parts.pop(0))
+
+    def sleep(seconds):
+        if parts:
+            with open(path, 'ab') as f:
+                f.write(parts.pop(0))
+
+    return sleep, lambda: not parts
+
+
+@pytest.mark.parametrize('pieces', [1, 7, 40])
+def test_follow_matches_batch(trace, tmp_path, pieces):
+    path = str(tmp_path / 'growing.bcs')
+    sleep, finished = _grow(trace, path, pieces)
+    result = follow_counts(path, TRACE_GENE_LENGTH, str(tmp_path / 'follow.npz'), None, refresh_interval=None,
+                           finished=finished, chunk_size=512, sleep=sleep)
+    polii, ser7p = extract_counts(trace, TRACE_GENE_LENGTH)
+    np.testing.assert_array_equal(result.polii, polii)
+    np.testing.assert_array_equal(result.ser7p, ser7p)
+    assert result.sims == TRACE_SIMS
+    with np.load(tmp_path / 'follow.npz') as data:
+        np.testing.assert_array_equal(data['polii_density_total'], polii)
+        assert int(data['sims']) == TRACE_SIMS
+
+
+def test_follow_resumes_from_checkpoint(trace, tmp_path):
+    path = str(tmp_path / 'growing.bcs')
+    sleep, finished = _grow(trace, path, 20, seed=1)
+    first = follow_counts(path, TRACE_GENE_LENGTH, sim_number=4, refresh_interval=None, finished=finished,
+                          chunk_size=512, sleep=sleep)
+    polii, ser7p = extract_counts(trace, TRACE_GENE_LENGTH, 4)
+    np.testing.assert_array_equal(first.polii, polii)
+    np.testing.assert_array_equal(first.ser7p, ser7p)
+    assert first.sims == 4
+
+    result = follow_counts(path, TRACE_GENE_LENGTH, refresh_interval=None, finished=finished, chunk_size=512,
+                           sleep=sleep)
+    polii, ser7p = extract_counts(trace, TRACE_GENE_LENGTH)
+    np.testing.assert_array_equal(result.polii, polii)
+    np.testing.assert_array_equal(result.ser7p, ser7p)
+    assert result.sims == TRACE_SIMS and result.offset > first.offset
+
+
+def test_follow_feeds_monitor(trace, tmp_path):
+    path = str(tmp_path / 'growing.bcs')
+    sleep, finished = _grow(trace, path, 10, seed=2)
+    monitor = ConvergenceMonitor(TRACE_GENE_LENGTH, {'polii': 0.0}, min_sims=TRACE_SIMS + 1)
+    follow_counts(path, TRACE_GENE_LENGTH, refresh_interval=None, finished=finished, monitor=monitor,
+                  chunk_size=512, sleep=sleep)
+    direct = ConvergenceMonitor(TRACE_GENE_LENGTH, {'polii': 0.0})
+    direct.update(*extract_occupancy(trace, TRACE_GENE_LENGTH))
+    assert monitor.n == direct.n == TRACE_SIMS
+    for name, value in direct.state().items():
+        np.testing.assert_allclose(monitor.state()[name], value, rtol=1e-12, atol=1e-12)
@@ -0,0 +1,88 @@
+"""The sidecar index and the columnar store against reading the trace itself.
+
+Index rows must point at the headers and cover the file byte for byte,
+survive a save and load, and be rebuilt once the trace changes.  The store
+must give back the event rows it was converted from and the counts of
+:func:`bcs_pol.parser.extract_counts`.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from bcs_pol.compressed import open_trace
+from bcs_pol.index import INDEX_SUFFIX, build_index, load_index, sim_ranges
+from bcs_pol.parallel import count_ranges, extract_occupancy
+from bcs_pol.parser import extract_counts, iter_blocks, parse_event_rows
+from bcs_pol.store import count_store, ensure_store
+from conftest import TRACE_GENE_LENGTH, TRACE_SIMS
+
+
+def test_index_covers_trace(trace):
+    index = build_index(trace)
+    with open(trace, 'rb') as f:
+        data = f.read()
+    assert len(index.offset) == TRACE_SIMS + 1
+    assert index.offset[0] == 0 and index.offset[-1] + index.length[-1] == len(data)
+    np.testing.assert_array_equal(index.offset[1:] + index.length[1:], np.append(index.offset[2:], len(data)))
+    assert all(data[offset:offset + 1] == b'>' for offset in index.offset[1:])
+    assert index.lines.sum() == data.count(b'\n')
+    for offset, length, final_time in zip(index.offset[1:], index.length[1:], index.final_time[1:]):
+        last = data[offset:offset + length].rstrip(b'\n').rsplit(b'\n', 1)[-1]
+        assert final_time == float(last.split(b'\t')[0])
+
+
+def test_index_round_trip(trace):
+    index = load_index(trace)
+    sidecar = trace + INDEX_SUFFIX
+    assert os.path.exists(sidecar)
+    saved = os.stat(sidecar).st_mtime_ns
+    for built, loaded in zip(index, load_index(trace)):
+        np.testing.assert_array_equal(built, loaded)
+    assert os.stat(sidecar).st_mtime_ns == saved
+
+    with open(trace, 'a') as f:
+        f.write('>=======\n1.000000\tPol_ii\tRNAPolII_postPause\ti\t5\tp\t1\n')
+    assert len(load_index(trace).offset) == TRACE_SIMS + 2
+
+
+@pytest.mark.parametrize('merge', [True, False])
+def test_sim_ranges(trace, merge):
+    polii_rows, ser7p_rows = extract_occupancy(trace, TRACE_GENE_LENGTH)
+    sims = [2, 3, 4, 8]
+    ranges = sim_ranges(load_index(trace), sims, merge)
+    with open(trace, 'rb') as f:
+        data = f.read()
+    assert all(data[start:start + 1] == b'>' for start, _ in ranges)
+    polii, ser7p = count_ranges(trace, ranges, TRACE_GENE_LENGTH)
+    np.testing.assert_array_equal(polii, polii_rows[np.array(sims) - 1].sum(axis=0))
+    np.testing.assert_array_equal(ser7p, ser7p_rows[np.array(sims) - 1].sum(axis=0))
+
+
+def test_store_round_trip(trace):
+    store = ensure_store(trace)
+    with open_trace(trace) as f:
+        blocks = [(block, parse_event_rows(segment)) for block, segment in iter_blocks(f)]
+    assert len(store.sim_offset) == TRACE_SIMS + 2
+    for name in ('time', 'i', 'p', 'd'):
+        np.testing.assert_array_equal(store[store._fields.index(name)],
+                                      np.concatenate([columns[name] for _, columns in blocks]))
+    actions = np.array(store.actions)[store.action]
+    np.testing.assert_array_equal(actions, [name.decode() for _, columns in blocks for name in columns['action']])
+    rows = np.bincount([block for block, columns in blocks for _ in columns['time']], minlength=TRACE_SIMS + 1)
+    np.testing.assert_array_equal(np.diff(store.sim_offset), rows)
+
+    for sim_number in (None, 1, 4, TRACE_SIMS + 5):
+        polii, ser7p = count_store(store, TRACE_GENE_LENGTH, sim_number)
+        expected = extract_counts(trace, TRACE_GENE_LENGTH, sim_number)
+        np.testing.assert_array_equal(polii, expected[0])
+        np.testing.assert_array_equal(ser7p, expected[1])
+
+    # reused while the trace is unchanged, converted again once it grows
+    assert ensure_store(trace).time.filename == store.time.filename
+    with open(trace, 'a') as f:
+        f.write('>=======\n1.000000\tPol_ii\tRNAPolII_postPause\ti\t5\tp\t1\n')
+    grown = ensure_store(trace)
+    assert len(grown.sim_offset) == TRACE_SIMS + 3
+    polii, _ = count_store(grown, TRACE_GENE_LENGTH)
+    np.testing.assert_array_equal(polii, extract_counts(trace, TRACE_GENE_LENGTH)[0])
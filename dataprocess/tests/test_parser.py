@@ -0,0 +1,155 @@
+"""Trace extraction against the per-line loop of the original ``snapshot_cis.py``.
+
+:func:`_snapshot_cis` is that loop, ported as it was with the trace and
+``sim_number`` as arguments, and also keeping each simulation's row.  The
+vectorised parser, the process-pool and seek-based readers and compressed
+traces must all give its counts, with rows before the first header,
+skipped lines, chunks cut mid-simulation and the ``sim_number`` cut-off.
+"""
+import bz2
+import gzip
+import lzma
+import shutil
+
+import numpy as np
+import pytest
+
+from bcs_pol.compressed import is_compressed, open_trace
+from bcs_pol.index import build_index
+from bcs_pol.parallel import extract_counts_parallel, extract_occupancy, extract_sims
+from bcs_pol.parser import extract_counts, iter_occupancy
+from conftest import TRACE_GENE_LENGTH, TRACE_SIMS
+
+SIM_NUMBERS = [None, 1, 4, TRACE_SIMS, TRACE_SIMS + 5]
+CHUNK_SIZES = [1 << 25, 4096, 100]
+
+
+def _snapshot_cis(path, gene_length, sim_number):
+    """``RNApolIIcount_all``, ``Ser7Pcount_all`` and the per-simulation rows of ``snapshot_cis.py``."""
+    if sim_number is None:
+        sim_number = float('inf')
+    f = open(path, 'r')
+
+    RNApolIIcount_all = np.zeros(gene_length)
+    RNApolIIcount_sim = np.zeros(gene_length)
+    Ser7Pcount_all = np.zeros(gene_length)
+    Ser7Pcount_sim = np.zeros(gene_length)
+    sim_iteration = 0
+    rows = []
+
+    for line in f:
+        if sim_iteration == sim_number+1:
+            break
+
+        if line.startswith('>'):
+            if sim_iteration > 0:
+                rows.append((RNApolIIcount_sim, Ser7Pcount_sim))
+            RNApolIIcount_all += RNApolIIcount_sim
+            RNApolIIcount_sim = np.zeros(gene_length)
+            Ser7Pcount_all += Ser7Pcount_sim
+            Ser7Pcount_sim = np.zeros(gene_length)
+            sim_iteration += 1
+            continue
+
+        splitLine = line.rstrip().split('\t')
+        if len(splitLine) < 7 or not splitLine[0].replace('.', '').replace('-', '').isdigit():
+            continue
+
+        action = splitLine[1]
+        i = int(splitLine[4])
+        p = int(splitLine[6])
+
+        if action == 'Pol_ii':
+
+            if i > 0:
+                if RNApolIIcount_sim[i-1] != 0:
+                    RNApolIIcount_sim[i-1] -= 1
+
+            if i <= gene_length:
+                if RNApolIIcount_sim[i] == 0:
+                    RNApolIIcount_sim[i] += 1
+
+            if p ==1:
+                if i > 0:
+                    if Ser7Pcount_sim[i-1] != 0:
+                        Ser7Pcount_sim[i-1] -= 1
+
+                if i <= gene_length:
+                    if Ser7Pcount_sim[i] == 0:
+                        Ser7Pcount_sim[i] +=1
+
+    if 0 < sim_iteration <= sim_number:
+        rows.append((RNApolIIcount_sim, Ser7Pcount_sim))
+    RNApolIIcount_all += RNApolIIcount_sim
+    Ser7Pcount_all += Ser7Pcount_sim
+    f.close()
+    return RNApolIIcount_all, Ser7Pcount_all, rows
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('sim_number', SIM_NUMBERS)
+def test_counts_match_snapshot_cis(trace, sim_number, chunk_size):
+    polii_ref, ser7p_ref, rows = _snapshot_cis(trace, TRACE_GENE_LENGTH, sim_number)
+    polii, ser7p, sims = extract_counts(trace, TRACE_GENE_LENGTH, sim_number, chunk_size, count_sims=True)
+    np.testing.assert_array_equal(polii, polii_ref)
+    np.testing.assert_array_equal(ser7p, ser7p_ref)
+    assert sims == len(rows)
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('sim_number', SIM_NUMBERS)
+def test_occupancy_matches_snapshot_cis(trace, sim_number, chunk_size):
+    _, _, rows = _snapshot_cis(trace, TRACE_GENE_LENGTH, sim_number)
+    with open(trace, 'rb') as f:
+        occupancy = list(iter_occupancy(f, TRACE_GENE_LENGTH, sim_number, chunk_size=chunk_size))
+    assert len(occupancy) == len(rows) == min(sim_number or TRACE_SIMS, TRACE_SIMS)
+    for (polii, ser7p), (polii_ref, ser7p_ref) in zip(occupancy, rows):
+        np.testing.assert_array_equal(polii, polii_ref)
+        np.testing.assert_array_equal(ser7p, ser7p_ref)
+
+
+@pytest.mark.parametrize('n_workers', [1, 3])
+@pytest.mark.parametrize('sim_number', SIM_NUMBERS)
+def test_parallel_matches_serial(trace, sim_number, n_workers):
+    polii, ser7p, sims = extract_counts(trace, TRACE_GENE_LENGTH, sim_number, count_sims=True)
+    result = extract_counts_parallel(trace, TRACE_GENE_LENGTH, sim_number, n_workers, chunk_size=4096,
+                                     count_sims=True)
+    np.testing.assert_array_equal(result[0], polii)
+    np.testing.assert_array_equal(result[1], ser7p)
+    assert result[2] == sims
+
+    with open(trace, 'rb') as f:
+        rows = list(iter_occupancy(f, TRACE_GENE_LENGTH, sim_number))
+    polii_rows, ser7p_rows = extract_occupancy(trace, TRACE_GENE_LENGTH, sim_number, n_workers, chunk_size=4096)
+    np.testing.assert_array_equal(polii_rows, [polii for polii, _ in rows])
+    np.testing.assert_array_equal(ser7p_rows, [ser7p for _, ser7p in rows])
+
+
+@pytest.mark.parametrize('n_workers', [1, 3])
+def test_sim_subset(trace, n_workers):
+    polii_rows, ser7p_rows = extract_occupancy(trace, TRACE_GENE_LENGTH)
+    subset = [7, 2, 3, 9, 2]
+    polii, ser7p = extract_sims(trace, TRACE_GENE_LENGTH, subset, n_workers)
+    chosen = np.unique(subset) - 1
+    np.testing.assert_array_equal(polii, polii_rows[chosen].sum(axis=0))
+    np.testing.assert_array_equal(ser7p, ser7p_rows[chosen].sum(axis=0))
+
+
+@pytest.mark.parametrize('module', [gzip, bz2, lzma])
+def test_compressed_matches_plain(trace, tmp_path, module):
+    packed = str(tmp_path / 'packed.bcs')
+    with open(trace, 'rb') as f, module.open(packed, 'wb') as out:
+        shutil.copyfileobj(f, out)
+    assert is_compressed(packed) and not is_compressed(trace)
+    with open_trace(packed) as f, open(trace, 'rb') as plain:
+        assert f.read() == plain.read()
+
+    for sim_number in (None, 4):
+        expected = extract_counts(trace, TRACE_GENE_LENGTH, sim_number, count_sims=True)
+        for result in (extract_counts(packed, TRACE_GENE_LENGTH, sim_number, count_sims=True),
+                       extract_counts_parallel(packed, TRACE_GENE_LENGTH, sim_number, 3, count_sims=True)):
+            np.testing.assert_array_equal(result[0], expected[0])
+            np.testing.assert_array_equal(result[1], expected[1])
+            assert result[2] == expected[2]
+    for plain, unpacked in zip(build_index(trace), build_index(packed)):
+        np.testing.assert_array_equal(plain, unpacked)
@@ -0,0 +1,54 @@
+"""Permutation tests on inputs with no difference between the models.
+
+With the same simulations on both sides, the observed difference is zero,
+so every split reaches it and every p-value, raw or adjusted, is exactly
+one.  Results depend only on the seed, not on how the permutations are
+spread over workers.
+"""
+import numpy as np
+import pytest
+
+from bcs_pol.bootstrap import CURVES
+from bcs_pol.permutation import CORRECTIONS, adjust_pvalues, permutation_test
+
+GENE_LENGTH = 60
+WINDOWS = ((1, 10), (5, 60))
+
+
+def _rows(sims, seed=0):
+    rng = np.random.default_rng(seed)
+    polii = (rng.random((sims, GENE_LENGTH)) < np.linspace(0.5, 0.1, GENE_LENGTH)).astype(np.uint8)
+    ser7p = polii * (rng.random((sims, GENE_LENGTH)) < 0.3).astype(np.uint8)
+    return polii, ser7p
+
+
+@pytest.mark.parametrize('curve', CURVES)
+def test_identical_inputs(curve):
+    polii, ser7p = _rows(12)
+    result = permutation_test(polii, ser7p, polii, ser7p, curve, sigma=2, windows=WINDOWS, n_permutations=300,
+                              seed=0, n_workers=1)
+    # group sums come from float32 products, so the curves agree to rounding
+    np.testing.assert_allclose(result.curve_a, result.curve_b, rtol=1e-5, atol=1e-6)
+    for p_values in (result.p_values, result.p_adjusted, result.window_p_values, result.window_p_adjusted):
+        np.testing.assert_array_equal(p_values, 1)
+
+
+def test_workers_do_not_change_results():
+    polii_a, ser7p_a = _rows(10, seed=1)
+    polii_b, ser7p_b = _rows(14, seed=2)
+    results = [permutation_test(polii_a, ser7p_a, polii_b, ser7p_b, sigma=2, windows=WINDOWS, n_permutations=2500,
+                                seed=3, n_workers=n_workers) for n_workers in (1, 3)]
+    for serial, parallel in zip(*results):
+        np.testing.assert_array_equal(serial, parallel)
+    p_values = results[0].p_values
+    assert ((p_values > 0) & (p_values <= 1)).all()
+
+
+@pytest.mark.parametrize('method', CORRECTIONS)
+def test_adjusted_pvalues_bounds(method):
+    p_values = np.random.default_rng(4).random(50)
+    adjusted = adjust_pvalues(p_values, method)
+    assert (adjusted >= p_values).all() and (adjusted <= 1).all()
+    order = np.argsort(p_values)
+    assert (np.diff(adjusted[order]) >= 0).all()
+    np.testing.assert_array_equal(adjust_pvalues(np.ones(50), method), 1)
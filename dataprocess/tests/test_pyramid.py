@@ -0,0 +1,69 @@
+"""Density pyramids against summing slices of the site counts.
+
+Window totals and averages, stored and derived bin levels, 1-D and 2-D
+(one row per sweep point) counts, and a pyramid saved with the density
+arrays and loaded back must all match plain slicing.
+"""
+import numpy as np
+import pytest
+
+from bcs_pol.aggregate import save_densities
+from bcs_pol.pyramid import LEVELS_BP, SITE_BP, DensityPyramid
+
+GENE_LENGTH = 257  # not a multiple of any bin, so every level ends with a short bin
+SIMS = 6
+
+
+def _counts(shape, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, SIMS + 1, shape).astype(np.float64), rng.integers(0, 3, shape).astype(np.float64)
+
+
+def _slices(counts, sites):
+    return np.stack([counts[..., start:start + sites].sum(axis=-1) for start in range(0, GENE_LENGTH, sites)],
+                    axis=-1)
+
+
+@pytest.mark.parametrize('shape', [(GENE_LENGTH,), (3, GENE_LENGTH)])
+def test_windows_match_slicing(shape):
+    polii, ser7p = _counts(shape)
+    pyramid = DensityPyramid(polii, ser7p, SIMS)
+    rng = np.random.default_rng(1)
+    first = rng.integers(1, GENE_LENGTH + 1, 40)
+    last = np.minimum(first + rng.integers(0, 80, 40), GENE_LENGTH)
+    for name, counts in (('polii', polii), ('ser7p', ser7p)):
+        totals = pyramid.window_total(name, first, last)  # every window at once
+        for k, (a, b) in enumerate(zip(first, last)):
+            expected = counts[..., a - 1:b].sum(axis=-1)
+            np.testing.assert_array_equal(totals[..., k], expected)
+            np.testing.assert_array_equal(pyramid.window_total(name, a, b), expected)
+            np.testing.assert_allclose(pyramid.window_average(name, a, b), expected / (b - a + 1) / SIMS)
+        assert np.all(pyramid.window_total(name, 10, 9) == 0)
+
+
+@pytest.mark.parametrize('shape', [(GENE_LENGTH,), (3, GENE_LENGTH)])
+@pytest.mark.parametrize('bin_bp', sorted({SITE_BP, 300, *LEVELS_BP}))
+def test_levels_match_slicing(shape, bin_bp):
+    polii, ser7p = _counts(shape, seed=2)
+    pyramid = DensityPyramid(polii, ser7p, SIMS)
+    sites = bin_bp // SITE_BP
+    edges = pyramid.bin_edges(bin_bp)
+    assert edges[0] == 0 and edges[-1] == pyramid.gene_bp
+    widths = np.diff(edges) // SITE_BP
+    for name, counts in (('polii', polii), ('ser7p', ser7p)):
+        expected = _slices(counts, sites)
+        np.testing.assert_array_equal(pyramid.level(name, bin_bp), expected)
+        np.testing.assert_allclose(pyramid.level(name, bin_bp, average=True), expected / widths / SIMS)
+
+
+@pytest.mark.parametrize('shape', [(GENE_LENGTH,), (3, GENE_LENGTH)])
+def test_saved_pyramid_round_trip(tmp_path, shape):
+    polii, ser7p = _counts(shape, seed=3)
+    path = str(tmp_path / 'x_polii_ser7p_density_arrays.npz')
+    save_densities(path, None, polii, ser7p, SIMS)
+    built, loaded = DensityPyramid(polii, ser7p, SIMS), DensityPyramid.load(path)
+    assert loaded.sims == SIMS and loaded.gene_length == GENE_LENGTH
+    for bin_bp in (SITE_BP, 300, *LEVELS_BP):
+        for name in ('polii', 'ser7p'):
+            np.testing.assert_array_equal(loaded.level(name, bin_bp), built.level(name, bin_bp))
+    np.testing.assert_array_equal(loaded.window_total('polii', 5, 77), built.window_total('polii', 5, 77))
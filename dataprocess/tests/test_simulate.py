@@ -0,0 +1,89 @@
+"""Statistical checks of the NumPy simulator.
+
+``check_against_trace`` is the check against ``bcs``: it is run here on
+traces written by the simulator itself, where it must pass for the same
+model and fail for a different one, and against ``bcs`` for every
+``<name>.bc`` model in ``tests/data`` (the repository models with the
+:data:`SMALL` header values).  The reference is the ``<name>.bcs`` (or
+``.bcs.gz``) trace next to the model if there is one, e.g. written by::
+
+    bcs -s 200 -t 4 -o tests/data/trans_small.bcs tests/data/trans_small.bc
+
+and otherwise is written the same way into a temporary directory by the
+``bcs`` executable on the path (or named by ``$BCS``).  Without either
+the check is skipped.
+"""
+import glob
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from bcs_pol.index import load_index
+from bcs_pol.model import load_model
+from bcs_pol.parallel import extract_occupancy
+from bcs_pol.simulate import check_against_trace, simulate
+
+from conftest import DATA_DIR, SMALL_T_MAX
+
+N_SIMS = 100
+
+
+REFERENCE_SIMS = 200
+REFERENCE_MODELS = sorted(glob.glob(os.path.join(DATA_DIR, '*.bc')))
+
+
+def _reference_trace(model, directory):
+    """``bcs`` trace of *model*, committed next to it or written now into *directory*."""
+    stem = model[:-len('.bc')]
+    for trace in (stem + '.bcs', stem + '.bcs.gz'):
+        if os.path.exists(trace):
+            return trace
+    bcs = shutil.which(os.environ.get('BCS', 'bcs'))
+    if bcs is None:
+        pytest.skip(f'no {os.path.basename(stem)}.bcs in tests/data and no bcs executable (set $BCS)')
+    trace = os.path.join(directory, 'reference.bcs')
+    subprocess.run([bcs, '-s', str(REFERENCE_SIMS), '-t', str(os.cpu_count() or 1), '-o', trace, model],
+                   check=True, stdout=subprocess.DEVNULL)
+    return trace
+
+
+def test_trace_extracts_to_returned_occupancy(small_model, tmp_path):
+    variant, params = small_model
+    trace = str(tmp_path / 'sim.bcs')
+    result = simulate(params, variant, 20, SMALL_T_MAX, seed=0, trace=trace, batch_size=8)
+    polii, ser7p = extract_occupancy(trace, params['gene_length'])
+    np.testing.assert_array_equal(polii, result.polii_rows)
+    np.testing.assert_array_equal(ser7p, result.ser7p_rows)
+
+
+def test_check_passes_for_the_same_model(small_model, tmp_path):
+    variant, params = small_model
+    trace = str(tmp_path / 'reference.bcs')
+    simulate(params, variant, N_SIMS, SMALL_T_MAX, seed=1, trace=trace)
+    check = check_against_trace(trace, params, variant, N_SIMS, SMALL_T_MAX, seed=2)
+    assert check['polii_outliers'] <= 0.05 and check['ser7p_outliers'] <= 0.05
+    assert check['polii_ks_p'] > 1e-3 and check['ser7p_ks_p'] > 1e-3
+
+
+def test_check_fails_for_a_different_model(small_model, tmp_path):
+    variant, params = small_model
+    trace = str(tmp_path / 'reference.bcs')
+    simulate(dict(params, uv_distance=30), variant, N_SIMS, SMALL_T_MAX, seed=1, trace=trace)
+    check = check_against_trace(trace, params, variant, N_SIMS, SMALL_T_MAX, seed=2)
+    assert check['polii_outliers'] > 0.2
+    assert check['polii_ks_p'] < 1e-6
+
+
+@pytest.mark.parametrize('model', REFERENCE_MODELS, ids=os.path.basename)
+def test_check_against_bcs(model, tmp_path):
+    trace = _reference_trace(model, str(tmp_path))
+    _, params, variant = load_model(model)
+    index = load_index(trace)
+    n_sims = len(index.offset) - 1
+    t_max = float(np.nanmax(index.final_time))
+    check = check_against_trace(trace, params, variant, n_sims, t_max, seed=0)
+    assert check['polii_outliers'] <= 0.05 and check['ser7p_outliers'] <= 0.05
+    assert check['polii_ks_p'] > 1e-3 and check['ser7p_ks_p'] > 1e-3
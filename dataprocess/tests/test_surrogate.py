@@ -0,0 +1,56 @@
+"""The mean-field surrogate against :func:`bcs_pol.simulate.simulate`.
+
+The gene is longer than :data:`conftest.SMALL` so that the densities have
+a shape to compare, but short enough that the far-gene Pol II overshoot
+described in :mod:`bcs_pol.surrogate` stays small.  Batches are checked
+against points solved one at a time, and against their saved ``.npz``.
+"""
+import numpy as np
+import pytest
+
+from bcs_pol.model import load_model
+from bcs_pol.pyramid import DensityPyramid
+from bcs_pol.surrogate import check_against_simulation, save_surrogate, solve
+from conftest import model_path
+
+HEADER = dict(gene_length=100, uv_distance=20)
+T_MAX = 600
+N_SIMS = 100
+
+# curve L1 distance and total ratio of surrogate to simulation; measured over
+# seeds: L1 0.13-0.26, ratios 1.24-1.36 (Pol II), 0.87 (cis Ser7P), 1.38-1.45 (trans Ser7P)
+MAX_CURVE_L1 = 0.35
+TOTAL_RATIO = (0.75, 1.6)
+
+
+def _params(variant):
+    _, params, variant = load_model(model_path(variant))
+    return variant, dict(params, **HEADER)
+
+
+@pytest.mark.parametrize('variant', ['cis', 'trans'])
+def test_close_to_simulation(variant):
+    variant, params = _params(variant)
+    deviations = check_against_simulation(params, variant, T_MAX, N_SIMS, seed=0)
+    for name, d in deviations.items():
+        assert d.curve_l1 <= MAX_CURVE_L1, name
+        assert TOTAL_RATIO[0] <= d.total_ratio <= TOTAL_RATIO[1], name
+
+
+def test_batch_matches_points(tmp_path):
+    variant, params = _params('cis')
+    values = [10, 20, 40]
+    batch = solve(dict(params, uv_distance=np.array(values, dtype=np.float64)), variant, T_MAX)
+    for row, value in enumerate(values):
+        point = solve(dict(params, uv_distance=value), variant, T_MAX)
+        np.testing.assert_allclose(batch.polii[row], point.polii, rtol=1e-10, atol=1e-12)
+        np.testing.assert_allclose(batch.ser7p[row], point.ser7p, rtol=1e-10, atol=1e-12)
+
+    path = str(tmp_path / 'batch.npz')
+    save_surrogate(path, batch.polii, batch.ser7p, parameter_values=np.array(values))
+    pyramid = DensityPyramid.load(path)
+    assert pyramid.sims == 1
+    np.testing.assert_allclose(pyramid.level('polii', average=True), batch.polii)
+    with np.load(path) as data:
+        assert bool(data['surrogate'])
+        np.testing.assert_array_equal(data['polii_density_avg'], batch.polii)
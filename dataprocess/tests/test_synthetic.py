@@ -0,0 +1,20 @@
+"""Synthetic traces on short genes, where many simulations have no damage site ahead."""
+import os
+
+import pytest
+
+from bcs_pol.synthetic import write_trace
+
+TARGET_BYTES = 200_000
+
+
+@pytest.mark.parametrize('variant', ['cis', 'trans'])
+@pytest.mark.parametrize('gene_length', [200, 300])
+def test_write_trace_reaches_target_bytes(tmp_path, variant, gene_length):
+    for seed in range(10):
+        path = str(tmp_path / f'{seed}.bcs')
+        sims = write_trace(path, target_bytes=TARGET_BYTES, events_per_sim=2000, gene_length=gene_length,
+                           variant=variant, seed=seed)
+        assert os.path.getsize(path) >= TARGET_BYTES
+        with open(path) as f:
+            assert sum(line.startswith('>') for line in f) == sims
@@ -0,0 +1,25 @@
+"""Trajectory tables of simulated traces: every row starts with the ``reuse`` that initiated it."""
+import numpy as np
+import pytest
+
+from bcs_pol.simulate import simulate
+from bcs_pol.trajectories import extract_trajectories
+
+from conftest import SMALL_T_MAX
+
+
+def _initiations(trace):
+    with open(trace) as f:
+        return sum(line.split('\t', 2)[1:2] == ['reuse'] for line in f if not line.startswith('>'))
+
+
+# with dense damage, trans polymerases holding d=1 at i==2 pick up phos in every run
+@pytest.mark.parametrize('seed', [0, 1])
+def test_no_orphan_trajectories(small_model, tmp_path, seed):
+    variant, params = small_model
+    trace = str(tmp_path / 'sim.bcs')
+    simulate(params, variant, 20, SMALL_T_MAX, seed=seed, trace=trace, batch_size=20)
+    table = extract_trajectories(trace)
+    assert not np.isnan(table['start']).any()
+    assert len(table) == _initiations(trace)
+    assert np.array_equal(np.unique(table['sim']), np.arange(1, 21))